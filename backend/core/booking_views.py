@@ -3,9 +3,12 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from decimal import Decimal
-from .models import Booking, ExpertProfile, Notification
+from . import outbox
+from .models import Booking, ExpertProfile
 from .serializers import BookingSerializer
+from .pagination import KeysetPagination
 
 User = get_user_model()
 
@@ -16,7 +19,7 @@ class BookSessionView(APIView):
 
     def post(self, request, expert_profile_id):
         try:
-            expert_profile = ExpertProfile.objects.get(id=expert_profile_id)
+            expert_profile = ExpertProfile.objects.select_related('user').get(id=expert_profile_id)
         except ExpertProfile.DoesNotExist:
             return Response({'error': 'Expert not found'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -31,20 +34,22 @@ class BookSessionView(APIView):
         else:
             amount = Decimal(str(amount)) if amount else expert_profile.hourly_rate
 
-        booking = Booking.objects.create(
-            expert=expert_user,
-            client=request.user,
-            is_free_intro=is_free,
-            amount=amount,
-            notes=request.data.get('notes', ''),
-        )
-        Notification.objects.create(
-            user=expert_user,
-            notification_type='BOOKING',
-            title='New Session Booking',
-            message=f"{request.user.username} booked a {'free intro ' if is_free else ''}session with you.",
-            payload={'booking_id': booking.id, 'client_id': request.user.id},
-        )
+        with transaction.atomic(savepoint=False):
+            booking = Booking.objects.create(
+                expert=expert_user,
+                client=request.user,
+                is_free_intro=is_free,
+                amount=amount,
+                notes=request.data.get('notes', ''),
+            )
+            outbox.enqueue(
+                'notify',
+                user_id=expert_user.id,
+                notification_type='BOOKING',
+                title='New Session Booking',
+                message=f"{request.user.username} booked a {'free intro ' if is_free else ''}session with you.",
+                payload={'booking_id': booking.id, 'client_id': request.user.id},
+            )
         return Response(BookingSerializer(booking).data, status=status.HTTP_201_CREATED)
 
 
@@ -56,8 +61,10 @@ class BookingListView(APIView):
         qs = Booking.objects.filter(
             client=request.user
         ) | Booking.objects.filter(expert=request.user)
-        qs = qs.distinct().order_by('-created_at')
-        return Response(BookingSerializer(qs, many=True).data)
+        paginator = KeysetPagination()
+        # One table ORed on two columns can't repeat rows, so no DISTINCT (and its temp B-tree).
+        page = paginator.paginate_queryset(qs.select_related('expert', 'client'), request, view=self)
+        return paginator.get_paginated_response(BookingSerializer(page, many=True).data)
 
 
 class ExpertContactView(APIView):
@@ -66,7 +73,7 @@ class ExpertContactView(APIView):
 
     def get(self, request, expert_profile_id):
         try:
-            profile = ExpertProfile.objects.get(id=expert_profile_id)
+            profile = ExpertProfile.objects.select_related('user').get(id=expert_profile_id)
         except ExpertProfile.DoesNotExist:
             return Response({'error': 'Expert not found'}, status=status.HTTP_404_NOT_FOUND)
 
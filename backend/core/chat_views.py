@@ -3,45 +3,153 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from django.contrib.auth import get_user_model
-from django.db.models import Q
-from .models import Message
+from rest_framework.utils.urls import replace_query_param
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db.models.functions import Substr
+from . import notifications
+from .conversations import mark_read
+from .models import ConversationMember, Message, Notification
+from .pagination import InboxPagination
+from .streams import chat_groups, publish
 
 User = get_user_model()
 
 
 class ChatHistoryView(APIView):
-    """Returns chat messages between current user and the given receiver_id. Only sender/receiver can see."""
+    """Chat messages between the current user and receiver_id, newest page first.
+
+    ``?limit=`` (default 50, max 200) messages with id below ``?before=`` are
+    returned oldest-first; ``next`` links to the page before them. Each page is
+    one range scan of the (conversation, id) index.
+    """
     permission_classes = [IsAuthenticated]
+    default_limit = 50
+    max_limit = 200
 
     def get(self, request, receiver_id):
         try:
-            other = User.objects.get(id=receiver_id)
-        except User.DoesNotExist:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+            before = request.query_params.get('before')
+            before = int(before) if before is not None else None
+        except ValueError:
+            return Response({'error': 'limit and before must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({'error': 'limit must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+
+        low, high = sorted((request.user.id, receiver_id))
+        messages = Message.objects.filter(conversation__user_low_id=low, conversation__user_high_id=high)
+        if before is not None:
+            messages = messages.filter(id__lt=before)
+        page = list(
+            messages.order_by('-id').values('id', 'sender_id', 'receiver_id', 'content', 'timestamp')[:limit + 1]
+        )
+        if not page and before is None and not User.objects.filter(id=receiver_id).exists():
             return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        # Only show messages where current user is sender or receiver
-        messages = Message.objects.filter(
-            (Q(sender=request.user) & Q(receiver=other)) |
-            (Q(sender=other) & Q(receiver=request.user))
-        ).order_by('timestamp')
+        has_more = len(page) > limit
+        page = page[:limit]
+        next_url = None
+        if has_more:
+            next_url = replace_query_param(request.build_absolute_uri(), 'before', page[-1]['id'])
+        data = [
+            {
+                'id': m['id'],
+                'sender': m['sender_id'],
+                'receiver': m['receiver_id'],
+                'content': m['content'],
+                'timestamp': m['timestamp'].isoformat(),
+            }
+            for m in reversed(page)
+        ]
+        return Response({'next': next_url, 'results': data})
+
 
+class ConversationListView(APIView):
+    """The current user's inbox: partner, last message preview and unread count per conversation.
+
+    Served from the user's ``ConversationMember`` rows, most recent first, in
+    one query over the (user, last_message) index.
+    """
+    permission_classes = [IsAuthenticated]
+    preview_length = 140
+
+    def get(self, request):
+        members = (
+            ConversationMember.objects.filter(user=request.user, last_message__isnull=False)
+            .values(
+                'conversation_id', 'unread_count', 'last_read_message_id', 'last_message_id',
+                'partner_id', 'partner__username', 'partner__role',
+                'last_message__sender_id', 'last_message__timestamp',
+                preview=Substr('last_message__content', 1, self.preview_length),
+            )
+        )
+        paginator = InboxPagination()
+        page = paginator.paginate_queryset(members, request, view=self)
         data = [
             {
-                'id': m.id,
-                'sender': m.sender.id,
-                'receiver': m.receiver.id,
-                'content': m.content,
-                'timestamp': m.timestamp.isoformat(),
+                'conversation_id': m['conversation_id'],
+                'partner': {'id': m['partner_id'], 'username': m['partner__username'], 'role': m['partner__role']},
+                'last_message': {
+                    'id': m['last_message_id'],
+                    'sender': m['last_message__sender_id'],
+                    'preview': m['preview'],
+                    'timestamp': m['last_message__timestamp'].isoformat(),
+                },
+                'unread_count': m['unread_count'],
+                'last_read_message_id': m['last_read_message_id'],
             }
-            for m in messages
+            for m in page
         ]
-        return Response(data)
+        return paginator.get_paginated_response(data)
 
 
 class MarkAsReadView(APIView):
-    """Acknowledge reading messages (no-op for now; can extend Message model with read flag)."""
+    """Move the current user's read cursor in the conversation with receiver_id.
+
+    Reads up to ``message_id`` from the body when given, else the whole
+    conversation. The new cursor and unread count are broadcast to both
+    participants' sockets so the user's other open tabs update. Catching up
+    also marks the coalesced message notification from this partner as read.
+    """
     permission_classes = [IsAuthenticated]
 
     def post(self, request, receiver_id):
-        # Optional: mark messages from receiver as read if we add a read field
-        return Response({'ok': True})
+        up_to = request.data.get('message_id')
+        if up_to is not None:
+            try:
+                up_to = int(up_to)
+            except (TypeError, ValueError):
+                return Response({'error': 'message_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        low, high = sorted((request.user.id, receiver_id))
+        member = (
+            ConversationMember.objects.filter(
+                user=request.user, conversation__user_low_id=low, conversation__user_high_id=high
+            )
+            .values('id', 'last_message_id', 'last_read_message_id', 'unread_count')
+            .first()
+        )
+        if member is None:
+            return Response({'ok': True, 'last_read_message_id': 0, 'unread_count': 0})
+
+        moved = mark_read(member, up_to)
+        if moved is None:
+            return Response({
+                'ok': True,
+                'last_read_message_id': member['last_read_message_id'],
+                'unread_count': member['unread_count'],
+            })
+        last_read, unread = moved
+        if unread == 0:
+            # Caught up: retire the rolling "new messages" notification from this partner.
+            rolling = Notification.objects.filter(group_key=notifications.message_group(receiver_id))
+            notifications.mark_read(request.user.id, rolling)
+        async_to_sync(publish)(get_channel_layer(), chat_groups(request.user.id, receiver_id), {
+            'type': 'read_cursor',
+            'user_id': request.user.id,
+            'partner_id': receiver_id,
+            'last_read_message_id': last_read,
+            'unread_count': unread,
+        })
+        return Response({'ok': True, 'last_read_message_id': last_read, 'unread_count': unread})
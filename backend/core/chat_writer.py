@@ -0,0 +1,253 @@
+"""Write-behind persistence for chat messages (``CHAT_WRITE_BEHIND``).
+
+With the setting on, the chat consumers give each message its id and timestamp
+in-process, broadcast it straight away and queue it here. A per-process
+flusher writes the queue with ``bulk_create`` every
+``CHAT_WRITE_BEHIND_INTERVAL_MS`` or ``CHAT_WRITE_BEHIND_BATCH`` messages,
+queues the receivers' notifications in the outbox (see ``core.outbox``),
+then applies what the per-row signals would have (conversation inbox state,
+platform stats).
+Whatever is still queued is written on ASGI lifespan shutdown, or at
+interpreter exit for servers without lifespan support.
+
+A flush that fails with an ``OperationalError`` (database locked or
+unreachable) keeps its batch and retries with exponential backoff, up to
+``CHAT_WRITE_BEHIND_MAX_RETRIES`` times; any other error, or running out of
+retries, falls back to writing the rows one by one and dropping (and logging)
+the ones that can't be stored. At most ``CHAT_WRITE_BEHIND_MAX_PENDING``
+messages are queued: past that, messages are written synchronously as with
+the setting off, so a stalled database slows senders down instead of
+growing the queue.
+
+Ids are reserved in blocks from the table's own id sequence, so they never
+collide with rows inserted directly. Every message a process sends with the
+setting on takes the next id from its block, including the ones written
+synchronously because the queue is full, so within a process ids follow
+send order. Rows inserted by other means (another process's block, or
+AUTOINCREMENT from a process with the setting off) can still get an id below
+a message sent earlier; ``core.conversations`` therefore only moves a
+conversation's state forward, and counts a message below a member's read
+cursor as read.
+"""
+import asyncio
+import atexit
+import logging
+from collections import Counter
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, NotSupportedError, OperationalError, connection, transaction
+from django.utils import timezone
+
+from . import conversations, outbox, stats
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+ID_BLOCK_SIZE = 500
+MAX_BACKOFF_SECONDS = 5
+
+
+def enabled():
+    return getattr(settings, 'CHAT_WRITE_BEHIND', False)
+
+
+def reserve_ids(model, count):
+    """Reserve ``count`` ids from ``model``'s id sequence and return them."""
+    table = model._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # AUTOINCREMENT tables never reuse ids at or below sqlite_sequence.seq.
+            cursor.execute('UPDATE sqlite_sequence SET seq = seq + %s WHERE name = %s', [count, table])
+            if cursor.rowcount == 0:
+                cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM "{table}"')
+                cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)',
+                               [table, cursor.fetchone()[0] + count])
+            cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+            last = cursor.fetchone()[0]
+            return list(range(last - count + 1, last + 1))
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                           [table, count])
+            return [row[0] for row in cursor.fetchall()]
+    raise NotSupportedError(f'Reserving ids is not implemented for {connection.vendor}')
+
+
+def save_message(conversation_id, sender_id, receiver_id, content, message_id=None):
+    """Write one message and queue its notification straight away (write-behind off, or its queue full)."""
+    with transaction.atomic():
+        message = Message.objects.create(
+            id=message_id, conversation_id=conversation_id, sender_id=sender_id, receiver_id=receiver_id, content=content
+        )
+        outbox.enqueue('chat.messages', pairs=[[sender_id, receiver_id]])
+    return message
+
+
+async def store_message(conversation_id, sender_id, receiver_id, content):
+    """Persist a chat message as configured; the outbox worker notifies the receiver.
+
+    Returns the message with its id and timestamp set.
+    """
+    if not enabled():
+        return await database_sync_to_async(save_message)(conversation_id, sender_id, receiver_id, content)
+    if not message_writer.full:
+        # Broadcast first; the message is written (and queued for notification) with the next batch.
+        return await message_writer.submit(conversation_id, sender_id, receiver_id, content)
+    # Written now, but still numbered from the reserved block: an AUTOINCREMENT id would
+    # jump past the queued messages and put this one ahead of them.
+    message_id = await message_writer.next_id()
+    return await database_sync_to_async(save_message)(conversation_id, sender_id, receiver_id, content, message_id)
+
+
+def write_batch(messages):
+    """Insert ``messages``, queue their receivers' notifications, then update derived state."""
+    with transaction.atomic():
+        Message.objects.bulk_create(messages)
+        outbox.enqueue('chat.messages', pairs=[[m.sender_id, m.receiver_id] for m in messages])
+        conversations.record_batch(messages)
+        for sender_id, count in Counter(m.sender_id for m in messages).items():
+            stats.bump_province(sender_id, 'messages', count)
+
+
+def write_each(messages):
+    """Fallback after a failed batch: write rows one at a time, dropping the ones that can't be stored."""
+    written = 0
+    for message in messages:
+        try:
+            write_batch([message])
+            written += 1
+        except (DatabaseError, ValueError):
+            logger.exception('Dropping chat message %s that cannot be stored', message.id)
+    return written
+
+
+class MessageWriter:
+    """Per-process queue of chat messages waiting to be written."""
+
+    def __init__(self):
+        self.pending = []
+        self.written = 0
+        self.failures = 0  # consecutive transient flush failures
+        self._ids = iter(())
+        self._loop = None
+        self._task = None
+        self._wakeup = None
+        self._reserving = None
+
+    @property
+    def batch_size(self):
+        return getattr(settings, 'CHAT_WRITE_BEHIND_BATCH', 200)
+
+    @property
+    def interval(self):
+        return getattr(settings, 'CHAT_WRITE_BEHIND_INTERVAL_MS', 50) / 1000
+
+    @property
+    def full(self):
+        return len(self.pending) >= getattr(settings, 'CHAT_WRITE_BEHIND_MAX_PENDING', 10000)
+
+    async def next_id(self):
+        """The next id from this process's reserved block, reserving a new block when it runs out."""
+        self._ensure_flusher()
+        message_id = next(self._ids, None)
+        if message_id is None:
+            # One reservation at a time, so a block is never replaced while ids are left in it.
+            async with self._reserving:
+                message_id = next(self._ids, None)
+                if message_id is None:
+                    self._ids = iter(await database_sync_to_async(reserve_ids)(Message, ID_BLOCK_SIZE))
+                    message_id = next(self._ids)
+        return message_id
+
+    async def submit(self, conversation_id, sender_id, receiver_id, content):
+        """Queue a message and return it with its id and timestamp assigned (not yet saved)."""
+        message = Message(
+            id=await self.next_id(),
+            conversation_id=conversation_id,
+            sender_id=sender_id,
+            receiver_id=receiver_id,
+            content=content,
+            timestamp=timezone.now(),
+        )
+        self.pending.append(message)
+        if len(self.pending) >= self.batch_size:
+            self._wakeup.set()
+        return message
+
+    def _ensure_flusher(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            if self._loop is not loop:
+                self._reserving = asyncio.Lock()
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            if self.failures:
+                await asyncio.sleep(min(self.interval * 2 ** self.failures, MAX_BACKOFF_SECONDS))
+
+    async def flush(self):
+        """Write everything queued so far; returns the number of messages written."""
+        if not self.pending:
+            return 0
+        batch, self.pending = self.pending, []
+        try:
+            await database_sync_to_async(write_batch)(batch)
+            written = len(batch)
+            self.failures = 0
+        except OperationalError:
+            # e.g. the database is locked or unreachable: keep the batch and retry after a backoff.
+            self.failures += 1
+            if self.failures <= getattr(settings, 'CHAT_WRITE_BEHIND_MAX_RETRIES', 5):
+                logger.warning('Chat write-behind flush of %d messages failed (attempt %d); will retry',
+                               len(batch), self.failures, exc_info=True)
+                self.pending[:0] = batch
+                return 0
+            logger.exception('Chat write-behind flush of %d messages failed %d times; writing them one by one',
+                             len(batch), self.failures)
+            self.failures = 0
+            written = await database_sync_to_async(write_each)(batch)
+        except Exception:
+            logger.exception('Chat write-behind flush of %d messages failed; writing them one by one', len(batch))
+            written = await database_sync_to_async(write_each)(batch)
+        except BaseException:
+            # Cancelled mid-write: the batch is still queued for the shutdown flush.
+            self.pending[:0] = batch
+            raise
+        self.written += written
+        return written
+
+    def flush_sync(self):
+        """Write anything still queued from synchronous code (interpreter exit)."""
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        try:
+            write_batch(batch)
+            self.written += len(batch)
+        except Exception:
+            self.written += write_each(batch)
+
+
+message_writer = MessageWriter()
+atexit.register(message_writer.flush_sync)
+
+
+async def lifespan(scope, receive, send):
+    """ASGI lifespan handler: drain the write-behind queue on shutdown."""
+    while True:
+        event = await receive()
+        if event['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif event['type'] == 'lifespan.shutdown':
+            await message_writer.flush()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
@@ -2,59 +2,246 @@ import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
-from .models import Message, Notification
+from . import chat_writer
+from .models import Conversation, ConversationMember
+from .streams import chat_groups, publish, user_group
 
 User = get_user_model()
 
 
+@database_sync_to_async
+def conversation_between(user_id, partner_id):
+    """Id of the conversation between two users, or None if the partner doesn't exist."""
+    if not User.objects.filter(id=partner_id).exists():
+        return None
+    return Conversation.objects.between(user_id, partner_id).id
+
+
+@database_sync_to_async
+def existing_conversation(user_id, partner_id):
+    """Id of the conversation between two users, or None if they have none."""
+    return ConversationMember.objects.filter(user_id=user_id, partner_id=partner_id).values_list('conversation_id', flat=True).first()
+
+
+@database_sync_to_async
+def recent_partners(user_id, limit):
+    """The user's ``limit`` most recent conversation partners."""
+    return set(
+        ConversationMember.objects.filter(user_id=user_id).exclude(partner_id=user_id)
+        .order_by('-last_message').values_list('partner_id', flat=True)[:limit]
+    )
+
+
+def chat_event(message, content):
+    return {
+        "type": "chat_message",
+        "id": message.id,
+        "message": content,
+        "sender_id": message.sender_id,
+        "receiver_id": message.receiver_id,
+        "timestamp": message.timestamp.isoformat(),
+    }
+
+
 class ChatConsumer(AsyncWebsocketConsumer):
+    """One socket per conversation (``ws/chat/<receiver_id>/``); superseded by ``StreamConsumer``.
+
+    Joins its user's ``user_<id>`` group and passes on only the events of its
+    own conversation.
+    """
+
     async def connect(self):
         self.user = self.scope["user"]
         if not self.user or not self.user.is_authenticated:
             await self.close()
             return
-        self.receiver_id = self.scope["url_route"]["kwargs"]["receiver_id"]
-        self.room_name = f"chat_{min(self.user.id, self.receiver_id)}_{max(self.user.id, self.receiver_id)}"
-        await self.channel_layer.group_add(
-            self.room_name,
-            self.channel_name
-        )
+        self.receiver_id = int(self.scope["url_route"]["kwargs"]["receiver_id"])
+        self.conversation_id = await conversation_between(self.user.id, self.receiver_id)
+        if self.conversation_id is None:
+            await self.close()
+            return
+        self.group = user_group(self.user.id)
+        await self.channel_layer.group_add(self.group, self.channel_name)
         await self.accept()
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(
-            self.room_name,
-            self.channel_name
-        )
+        if not hasattr(self, "group"):
+            return
+        await self.channel_layer.group_discard(self.group, self.channel_name)
 
     async def receive(self, text_data):
         data = json.loads(text_data)
         message = data["message"]
-        sender_id = self.user.id
-        receiver_id = int(self.receiver_id)
-        timestamp = await self.save_message(sender_id, receiver_id, message)
-        await self.channel_layer.group_send(
-            self.room_name,
-            {
-                "type": "chat_message",
-                "message": message,
-                "sender_id": sender_id,
-                "receiver_id": receiver_id,
-                "timestamp": timestamp,
-            }
-        )
+        stored = await chat_writer.store_message(self.conversation_id, self.user.id, self.receiver_id, message)
+        await publish(self.channel_layer, chat_groups(self.user.id, self.receiver_id), chat_event(stored, message))
+
+    def in_conversation(self, user_a_id, user_b_id):
+        return {user_a_id, user_b_id} == {self.user.id, self.receiver_id}
 
     async def chat_message(self, event):
-        await self.send(text_data=json.dumps(event))
-
-    @database_sync_to_async
-    def save_message(self, sender_id, receiver_id, message):
-        msg = Message.objects.create(sender_id=sender_id, receiver_id=receiver_id, content=message)
-        Notification.objects.create(
-            user_id=receiver_id,
-            notification_type='MESSAGE',
-            title='New Message',
-            message=f"You received a message (see chat).",
-            payload={'sender_id': sender_id},
-        )
-        return msg.timestamp.isoformat()
+        if self.in_conversation(event["sender_id"], event["receiver_id"]):
+            await self.send(text_data=json.dumps(event))
+
+    async def read_cursor(self, event):
+        # A participant's read cursor moved (MarkAsReadView); lets other tabs update.
+        if self.in_conversation(event["user_id"], event["partner_id"]):
+            await self.send(text_data=json.dumps(event))
+
+    # The rest of the user group's traffic is for ws/stream/ sockets.
+
+    async def notification(self, event):
+        pass
+
+    async def presence(self, event):
+        pass
+
+    async def presence_probe(self, event):
+        pass
+
+
+class StreamConsumer(AsyncWebsocketConsumer):
+    """One socket per user for every chat (``ws/stream/``).
+
+    The socket joins the ``user_<id>`` group, so a user holds one connection
+    and one group membership however many conversations are open. Frames are
+    JSON objects with a ``type``. The client sends:
+
+    - ``subscribe`` / ``unsubscribe`` with ``partner_id``: start or stop
+      receiving that conversation's ``chat.message``, ``chat.read`` and
+      ``presence`` frames (only for an existing conversation);
+    - ``chat.send`` with ``partner_id`` and ``message``; the first message
+      to a new partner starts the conversation and subscribes to it.
+
+    The server answers ``subscribe`` with ``subscribed`` (carrying the
+    ``conversation_id``) and reports bad frames with ``error``. New and
+    updated notifications arrive as ``notification`` frames with the
+    user's unread count, whatever the subscriptions.
+
+    Presence travels between user groups too, and only between conversation
+    partners: a connecting socket announces itself to the user's
+    ``PRESENCE_PARTNERS`` most recent partners and a subscription probes the
+    partner, whose sockets answer if the two share a conversation. Closing
+    announces the user offline to the same partners.
+    """
+    MAX_SUBSCRIPTIONS = 50
+    PRESENCE_PARTNERS = 50
+
+    async def connect(self):
+        self.user = self.scope["user"]
+        if not self.user or not self.user.is_authenticated:
+            await self.close()
+            return
+        self.group = user_group(self.user.id)
+        self.subscriptions = {}  # partner_id -> conversation_id
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept()
+        # Partners told about this socket's presence (and told again when it closes).
+        self.partners = await recent_partners(self.user.id, self.PRESENCE_PARTNERS)
+        await self.announce(True)
+
+    async def disconnect(self, close_code):
+        if not hasattr(self, "group"):
+            return
+        await self.channel_layer.group_discard(self.group, self.channel_name)
+        if hasattr(self, "partners"):
+            await self.announce(False)
+
+    async def announce(self, online):
+        await publish(self.channel_layer, [user_group(partner_id) for partner_id in self.partners], self.presence_event(online))
+
+    def presence_event(self, online):
+        return {"type": "presence", "user_id": self.user.id, "online": online}
+
+    async def send_frame(self, frame_type, **fields):
+        await self.send(text_data=json.dumps({"type": frame_type, **fields}))
+
+    async def receive(self, text_data):
+        try:
+            frame = json.loads(text_data)
+            frame_type = frame["type"]
+            partner_id = int(frame["partner_id"])
+        except (ValueError, TypeError, KeyError):
+            await self.send_frame("error", error="Frames need a type and an integer partner_id")
+            return
+        if frame_type == "subscribe":
+            await self.subscribe(partner_id)
+        elif frame_type == "unsubscribe":
+            await self.unsubscribe(partner_id)
+        elif frame_type == "chat.send":
+            await self.send_message(partner_id, frame.get("message"))
+        else:
+            await self.send_frame("error", error=f"Unknown frame type {frame_type!r}")
+
+    async def subscribe(self, partner_id):
+        if partner_id not in self.subscriptions:
+            if len(self.subscriptions) >= self.MAX_SUBSCRIPTIONS:
+                await self.send_frame("error", error="Too many open conversations", partner_id=partner_id)
+                return
+            conversation_id = await existing_conversation(self.user.id, partner_id)
+            if conversation_id is None:
+                await self.send_frame("error", error="No conversation with this user; send a message to start one",
+                                      partner_id=partner_id)
+                return
+            await self.add_subscription(partner_id, conversation_id)
+        await self.send_frame("subscribed", partner_id=partner_id, conversation_id=self.subscriptions[partner_id])
+
+    async def add_subscription(self, partner_id, conversation_id):
+        self.subscriptions[partner_id] = conversation_id
+        self.partners.add(partner_id)
+        # Any open socket of the partner answers with a presence event.
+        await self.channel_layer.group_send(user_group(partner_id), {"type": "presence_probe", "user_id": self.user.id})
+
+    async def unsubscribe(self, partner_id):
+        self.subscriptions.pop(partner_id, None)
+        await self.send_frame("unsubscribed", partner_id=partner_id)
+
+    async def send_message(self, partner_id, message):
+        if not isinstance(message, str) or not message:
+            await self.send_frame("error", error="message must be a non-empty string", partner_id=partner_id)
+            return
+        if partner_id not in self.subscriptions:
+            if len(self.subscriptions) >= self.MAX_SUBSCRIPTIONS:
+                await self.send_frame("error", error="Too many open conversations", partner_id=partner_id)
+                return
+            conversation_id = await conversation_between(self.user.id, partner_id)
+            if conversation_id is None:
+                await self.send_frame("error", error="User not found", partner_id=partner_id)
+                return
+            await self.add_subscription(partner_id, conversation_id)
+            await self.send_frame("subscribed", partner_id=partner_id, conversation_id=conversation_id)
+        stored = await chat_writer.store_message(self.subscriptions[partner_id], self.user.id, partner_id, message)
+        await publish(self.channel_layer, chat_groups(self.user.id, partner_id), chat_event(stored, message))
+
+    # Channel-layer events. Chat events reach both participants' user groups;
+    # only sockets subscribed to the conversation pass them on.
+
+    def partner_of(self, user_a_id, user_b_id):
+        return user_b_id if user_a_id == self.user.id else user_a_id
+
+    async def notification(self, event):
+        await self.send_frame("notification", notification=event["notification"], unread_count=event["unread_count"])
+
+    async def chat_message(self, event):
+        if self.partner_of(event["sender_id"], event["receiver_id"]) in self.subscriptions:
+            await self.send_frame("chat.message", **{k: v for k, v in event.items() if k != "type"})
+
+    async def read_cursor(self, event):
+        if self.partner_of(event["user_id"], event["partner_id"]) in self.subscriptions:
+            await self.send_frame("chat.read", **{k: v for k, v in event.items() if k != "type"})
+
+    async def presence(self, event):
+        if event["user_id"] not in self.subscriptions:
+            return
+        await self.send_frame("presence", user_id=event["user_id"], online=event["online"])
+        if not event["online"]:
+            # One of the partner's sockets closed; another may still be open.
+            await self.channel_layer.group_send(user_group(event["user_id"]), {"type": "presence_probe", "user_id": self.user.id})
+
+    async def presence_probe(self, event):
+        # Only conversation partners learn whether this user is online.
+        user_id = event["user_id"]
+        if user_id not in self.partners:
+            if await existing_conversation(self.user.id, user_id) is None:
+                return
+            self.partners.add(user_id)
+        await self.channel_layer.group_send(user_group(user_id), self.presence_event(True))
@@ -0,0 +1,140 @@
+"""Per-participant conversation state (``ConversationMember``) behind the chat inbox."""
+from collections import defaultdict
+
+from django.db.models import (
+    BigIntegerField, Case, Count, F, OuterRef, PositiveIntegerField, Subquery, Value, When,
+)
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import ConversationMember, Message
+
+
+def moved_forward(field, message_id):
+    """``field`` advanced to ``message_id`` unless it is already past it.
+
+    Message ids don't always follow send order (see ``core.chat_writer``), so
+    conversation state never moves backwards.
+    """
+    return Greatest(Coalesce(F(field), 0), Value(message_id), output_field=BigIntegerField())
+
+
+def unread_among(message_ids):
+    """How many of ``message_ids`` are after the member's read cursor (the rest count as read)."""
+    ordered = sorted(message_ids)
+    if not ordered:
+        return Value(0)
+    return Case(
+        *[When(last_read_message_id__lt=message_id, then=Value(len(ordered) - i)) for i, message_id in enumerate(ordered)],
+        default=Value(0),
+        output_field=PositiveIntegerField(),
+    )
+
+
+def record_message(message):
+    """Move both members of ``message``'s conversation past it with one UPDATE.
+
+    The receiver gains an unread message; the sender's cursor jumps to the
+    message (replying means the conversation has been read).
+    """
+    updates = {'last_message_id': moved_forward('last_message_id', message.id)}
+    if message.sender_id == message.receiver_id:
+        updates['last_read_message_id'] = moved_forward('last_read_message_id', message.id)
+    else:
+        updates['unread_count'] = Case(
+            When(user_id=message.receiver_id, then=F('unread_count') + unread_among([message.id])),
+            When(last_read_message_id__lt=message.id, then=Value(0)),
+            default=F('unread_count'),
+            output_field=PositiveIntegerField(),
+        )
+        updates['last_read_message_id'] = Case(
+            When(user_id=message.sender_id, then=moved_forward('last_read_message_id', message.id)),
+            default=F('last_read_message_id'),
+            output_field=BigIntegerField(),
+        )
+    ConversationMember.objects.filter(conversation_id=message.conversation_id).update(**updates)
+
+
+def record_batch(messages):
+    """``record_message`` for messages saved without signals (e.g. ``bulk_create``).
+
+    Folds each conversation's messages together, then issues one UPDATE per
+    affected member.
+    """
+    by_conversation = defaultdict(list)
+    for message in messages:
+        by_conversation[message.conversation_id].append(message)
+    for conversation_id, items in by_conversation.items():
+        items.sort(key=lambda m: m.id)
+        sent, received = {}, defaultdict(list)  # user_id -> last id sent / ids received
+        for message in items:
+            sent[message.sender_id] = message.id
+            if message.receiver_id != message.sender_id:
+                received[message.receiver_id].append(message.id)
+        for user_id in sent.keys() | received.keys():
+            rows = ConversationMember.objects.filter(conversation_id=conversation_id, user_id=user_id)
+            updates = {'last_message_id': moved_forward('last_message_id', items[-1].id)}
+            cursor = sent.get(user_id)
+            unread = received.get(user_id, [])
+            if cursor is None:
+                updates['unread_count'] = F('unread_count') + unread_among(unread)
+            else:
+                # Sending reads the conversation up to the sent message, unless the cursor is already past it.
+                updates['last_read_message_id'] = moved_forward('last_read_message_id', cursor)
+                updates['unread_count'] = Case(
+                    When(last_read_message_id__lt=cursor, then=Value(sum(1 for i in unread if i > cursor))),
+                    default=F('unread_count') + unread_among(unread),
+                    output_field=PositiveIntegerField(),
+                )
+            rows.update(**updates)
+
+
+def unread_subquery(cursor=None):
+    """Count of the partner's messages after ``cursor`` (default: each row's read cursor).
+
+    Pass the new cursor explicitly when updating it in the same statement,
+    since SET expressions see the row's old values.
+    """
+    return Subquery(
+        Message.objects.filter(
+            conversation_id=OuterRef('conversation_id'),
+            receiver_id=OuterRef('user_id'),
+            id__gt=OuterRef('last_read_message_id') if cursor is None else cursor,
+        ).exclude(sender_id=OuterRef('user_id'))
+        .order_by().values('conversation_id').annotate(n=Count('id')).values('n')
+    )
+
+
+def refresh_members(members=None):
+    """Recompute ``last_message`` and ``unread_count`` from the messages table.
+
+    For writes that skip model signals (``bulk_create``, imports) and for
+    reconciliation; read cursors are kept as they are.
+    """
+    if members is None:
+        members = ConversationMember.objects.all()
+    last_message = Message.objects.filter(conversation_id=OuterRef('conversation_id')).order_by('-id').values('id')[:1]
+    return members.update(
+        last_message_id=Subquery(last_message),
+        unread_count=Coalesce(unread_subquery(), 0),
+    )
+
+
+def mark_read(member, up_to=None):
+    """Advance a member's read cursor to ``up_to`` (default: the last message).
+
+    ``member`` is a dict with ``id``, ``last_message_id`` and
+    ``last_read_message_id``. The cursor only moves forward. Reading up to
+    the last message is one single-row UPDATE that zeroes the unread count,
+    guarded so a message arriving meanwhile isn't lost; otherwise the count is
+    recomputed from the cursor. Returns ``(last_read_message_id, unread_count)``
+    or None when the cursor didn't move.
+    """
+    last = member['last_message_id'] or 0
+    target = last if up_to is None else min(up_to, last)
+    if target <= member['last_read_message_id']:
+        return None
+    rows = ConversationMember.objects.filter(id=member['id'])
+    if target == last and rows.filter(last_message_id=last).update(last_read_message_id=target, unread_count=0):
+        return target, 0
+    rows.update(last_read_message_id=target, unread_count=Coalesce(unread_subquery(target), 0))
+    return target, rows.values_list('unread_count', flat=True).get()
@@ -0,0 +1,91 @@
+"""``Idempotency-Key`` support for POST views.
+
+A client that retries a POST (after a timeout or a dropped connection) sends
+the same ``Idempotency-Key`` header each time. The first request to arrive
+claims the key by inserting an ``IdempotencyKey`` row and runs the view in the
+same transaction, then stores the response on that row; every later request
+with the key gets the stored response back, marked ``Idempotent-Replayed:
+true``, without running the view again. A duplicate that arrives while the
+first is still running waits on the key's unique index and then replays its
+response. Keys are per user and expire after ``IDEMPOTENCY_KEY_HOURS``
+(``manage.py prune_idempotency_keys`` deletes them).
+
+Reusing a key for a different method, path or body is answered with 422.
+Errors (an exception or a 5xx response) are not stored, so the request can
+be retried with the same key.
+"""
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field('key').max_length
+
+
+def cutoff():
+    """Keys created before this have expired."""
+    return timezone.now() - timedelta(hours=getattr(settings, 'IDEMPOTENCY_KEY_HOURS', 24))
+
+
+def fingerprint(request):
+    digest = hashlib.sha256(request.body or b'').hexdigest()[:16]
+    return f'{request.method} {request.path} {digest}'[:255]
+
+
+def replay(stored, request_fingerprint):
+    if stored.fingerprint != request_fingerprint:
+        return Response({'error': f'{HEADER} was already used for a different request'},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    return Response(stored.body, status=stored.status_code, headers={'Idempotent-Replayed': 'true'})
+
+
+def idempotent(method):
+    """Decorate an APIView handler (``post``) to honour the ``Idempotency-Key`` header."""
+    @wraps(method)
+    def handler(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return method(view, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        request_fingerprint = fingerprint(request)
+        stored = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+        if stored is not None and stored.created_at < cutoff():
+            stored.delete()
+            stored = None
+        if stored is not None:
+            return replay(stored, request_fingerprint)
+
+        with transaction.atomic():
+            try:
+                # The savepoint keeps a lost race from breaking the outer transaction.
+                with transaction.atomic():
+                    stored = IdempotencyKey.objects.create(user=request.user, key=key, fingerprint=request_fingerprint)
+            except IntegrityError:
+                stored = None
+            else:
+                response = method(view, request, *args, **kwargs)
+                if response.status_code >= 500:
+                    stored.delete()
+                else:
+                    stored.status_code, stored.body = response.status_code, response.data
+                    stored.save(update_fields=['status_code', 'body'])
+                return response
+
+        # Another request with this key got there first and has committed by now.
+        stored = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+        if stored is None or stored.status_code is None:
+            return Response({'error': f'A request with this {HEADER} is still in progress'},
+                            status=status.HTTP_409_CONFLICT)
+        return replay(stored, request_fingerprint)
+    return handler
@@ -0,0 +1,182 @@
+"""Karma balances (``KarmaBalance``) and redemptions.
+
+A user's balance is ``karma_score`` plus their ``Points`` minus what their
+``Redemption`` rows spent. ``core.signals`` moves the stored totals with
+atomic ``F()`` updates as those rows are written, so reading a balance is one
+primary-key lookup. ``redeem`` spends with a single conditional UPDATE
+(``spent = spent + cost WHERE earned - spent >= cost``), so concurrent
+redemptions can't overdraw a balance. ``reconcile`` recomputes every row from
+the ledger (``manage.py reconcile_karma``, run periodically and after bulk
+imports). A user without a row gets one computed from the ledger the first
+time their balance is needed.
+
+Offers can also carry a stock and a per-user limit. ``redeem`` takes the
+per-user claim (a conditional upsert on ``OfferClaim``), then the balance,
+then one unit of stock (``stock = stock - 1 WHERE stock > 0``), and records
+the redemption, all in one transaction. None of these steps reads a row
+before writing it, so concurrent redemptions neither oversell nor queue
+behind a lock held across a read; the offer's row, which every redemption of
+a popular offer contends for, is written last so its lock is held only until
+the commit.
+"""
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import KarmaBalance, OfferClaim, Points, RedeemOffer, Redemption
+from .offer_ranking import offer_catalog
+
+User = get_user_model()
+
+
+def ensure(user_id):
+    """Create the user's balance row from the ledger unless it exists."""
+    qn = connection.ops.quote_name
+    balance, users = qn(KarmaBalance._meta.db_table), qn(User._meta.db_table)
+    points, redemptions = qn(Points._meta.db_table), qn(Redemption._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {balance} ("user_id", "earned", "spent") '
+            f'SELECT u."id", u."karma_score" + COALESCE((SELECT SUM("points") FROM {points} WHERE "user_id" = u."id"), 0), '
+            f'COALESCE((SELECT SUM("points_spent") FROM {redemptions} WHERE "user_id" = u."id"), 0) '
+            f'FROM {users} u WHERE u."id" = %s '
+            f'ON CONFLICT ("user_id") DO NOTHING',
+            [user_id],
+        )
+
+
+def balance(user_id):
+    """``(earned, spent)`` for the user."""
+    totals = KarmaBalance.objects.filter(user_id=user_id).values_list('earned', 'spent').first()
+    if totals is None:
+        ensure(user_id)
+        totals = KarmaBalance.objects.filter(user_id=user_id).values_list('earned', 'spent').first() or (0, 0)
+    return totals
+
+
+def adjust(user_id, earned=0, spent=0):
+    """Add to the user's stored totals.
+
+    One UPDATE. Without a row there is nothing to do: it is computed from the
+    ledger, which already includes this change, when first needed.
+    """
+    if earned or spent:
+        KarmaBalance.objects.filter(user_id=user_id).update(earned=F('earned') + earned, spent=F('spent') + spent)
+
+
+def debit(user_id, cost):
+    """Spend ``cost`` if the balance covers it; returns whether it did."""
+    def spend():
+        return KarmaBalance.objects.filter(user_id=user_id, earned__gte=F('spent') + cost).update(spent=F('spent') + cost)
+    if spend():
+        return True
+    # Either the balance is short or the row doesn't exist yet.
+    ensure(user_id)
+    return bool(spend())
+
+
+class RedemptionRefused(Exception):
+    """Raised by ``redeem``; ``reason`` is one of ``INSUFFICIENT``, ``SOLD_OUT`` or ``LIMIT_REACHED``."""
+    INSUFFICIENT = 'insufficient'
+    SOLD_OUT = 'sold_out'
+    LIMIT_REACHED = 'limit_reached'
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def claim(user_id, offer_id, limit):
+    """Count one more redemption of the offer by the user if they are under ``limit``; returns whether it did."""
+    if limit < 1:
+        return False
+    qn = connection.ops.quote_name
+    table = qn(OfferClaim._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ("user_id", "offer_id", "count") VALUES (%s, %s, 1) '
+            f'ON CONFLICT ("user_id", "offer_id") DO UPDATE SET "count" = {table}."count" + 1 '
+            f'WHERE {table}."count" < %s RETURNING "count"',
+            [user_id, offer_id, limit],
+        )
+        return cursor.fetchone() is not None
+
+
+def take_stock(offer_id):
+    """Take one unit of the offer's stock if any is left; returns the units left, or None if it was sold out."""
+    table = connection.ops.quote_name(RedeemOffer._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET "stock" = "stock" - 1 WHERE "id" = %s AND "stock" > 0 RETURNING "stock"',
+            [offer_id],
+        )
+        row = cursor.fetchone()
+    return None if row is None else row[0]
+
+
+def record(user_id, offer):
+    redemption = Redemption(user_id=user_id, offer=offer, points_spent=offer.points_required)
+    redemption._karma_debited = True  # tells core.signals not to count it again
+    redemption.save()
+    return redemption
+
+
+def redeem(user_id, offer):
+    """Spend ``offer.points_required`` and record the redemption; returns it.
+
+    Raises ``RedemptionRefused`` if the user has reached the offer's
+    per-user limit, the balance is short or the offer is sold out; nothing is
+    written then.
+    """
+    if offer.per_user_limit is None and offer.stock is None:
+        # Only the debit can refuse, before anything is written, so no savepoint is needed.
+        with transaction.atomic(savepoint=False):
+            redemption = record(user_id, offer) if debit(user_id, offer.points_required) else None
+        if redemption is None:
+            raise RedemptionRefused(RedemptionRefused.INSUFFICIENT)
+        return redemption
+    with transaction.atomic():
+        if offer.per_user_limit is not None and not claim(user_id, offer.id, offer.per_user_limit):
+            raise RedemptionRefused(RedemptionRefused.LIMIT_REACHED)
+        if not debit(user_id, offer.points_required):
+            raise RedemptionRefused(RedemptionRefused.INSUFFICIENT)
+        if offer.stock is not None:
+            left = take_stock(offer.id)
+            if left is None:
+                raise RedemptionRefused(RedemptionRefused.SOLD_OUT)
+            if left == 0:
+                # The UPDATE fires no signal, so tell the ranking the offer is gone.
+                offer_id = offer.id
+                transaction.on_commit(lambda: offer_catalog.remove(offer_id))
+        return record(user_id, offer)
+
+
+def reconcile():
+    """Recompute every balance from the ledger; returns how many rows were wrong or missing."""
+    def earned(user_ref):
+        points = Points.objects.filter(user_id=OuterRef(user_ref)).order_by().values('user_id').annotate(s=Sum('points')).values('s')
+        return Coalesce(Subquery(points), 0)
+
+    def spent(user_ref):
+        spent = Redemption.objects.filter(user_id=OuterRef(user_ref)).order_by().values('user_id').annotate(s=Sum('points_spent')).values('s')
+        return Coalesce(Subquery(spent), 0)
+
+    karma_score = Subquery(User.objects.filter(pk=OuterRef('user_id')).values('karma_score')[:1])
+    with transaction.atomic():
+        expected_earned, expected_spent = karma_score + earned('user_id'), spent('user_id')
+        fixed = (
+            KarmaBalance.objects.alias(expected_earned=expected_earned, expected_spent=expected_spent)
+            .exclude(earned=F('expected_earned'), spent=F('expected_spent'))
+            .update(earned=expected_earned, spent=expected_spent)
+        )
+        missing = (
+            User.objects.filter(karma_balance__isnull=True)
+            .annotate(total_earned=F('karma_score') + earned('pk'), total_spent=spent('pk'))
+            .values_list('pk', 'total_earned', 'total_spent')
+        )
+        created = KarmaBalance.objects.bulk_create(
+            [KarmaBalance(user_id=user_id, earned=e, spent=s) for user_id, e, s in missing.iterator(chunk_size=2000)],
+            batch_size=2000,
+        )
+    return fixed + len(created)
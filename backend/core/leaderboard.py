@@ -0,0 +1,206 @@
+"""Karma leaderboards over ``Points``.
+
+Every (window, role, province) segment is a ``Ranking``: the members' scores
+kept in a list sorted best first, so the top N is a slice and a user's rank is
+a binary search. Windows are all time, the last 30 days and the last 7 days;
+a user sits in the unfiltered segment plus the ones for their role, their
+province and both.
+
+The rankings are built once per process from one ``SUM ... GROUP BY`` (a
+filtered sum per window) and patched in place from ``core.signals`` as points
+are written, once the write commits. They are rebuilt in the background every
+``LEADERBOARD_REBUILD_SECONDS`` (see ``core.refresh``), which also ages points
+out of the 30 and 7 day windows and picks up writes made by other processes.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Max, Q, Sum
+from django.utils import timezone
+
+from .models import Points
+from .refresh import ensure_fresh
+
+User = get_user_model()
+
+WINDOWS = {'all': None, '30d': timedelta(days=30), '7d': timedelta(days=7)}
+
+
+def segments(role, province):
+    return [(None, None), (role, None), (None, province), (role, province)]
+
+
+class Ranking:
+    """Scores of one segment, ordered best first (ties by user id)."""
+
+    def __init__(self, scores=None):
+        self.scores = dict(scores or {})
+        self.order = sorted((-score, user_id) for user_id, score in self.scores.items())
+
+    def __len__(self):
+        return len(self.order)
+
+    def add(self, user_id, delta):
+        old = self.scores.get(user_id)
+        if old is not None:
+            del self.order[bisect_left(self.order, (-old, user_id))]
+        score = self.scores[user_id] = (old or 0) + delta
+        insort(self.order, (-score, user_id))
+        return score
+
+    def remove(self, user_id):
+        score = self.scores.pop(user_id, None)
+        if score is not None:
+            del self.order[bisect_left(self.order, (-score, user_id))]
+        return score
+
+    def rank(self, score):
+        """Competition rank of ``score``: one more than the number of higher scores."""
+        return bisect_left(self.order, (-score,)) + 1
+
+    def top(self, limit):
+        """``(rank, user_id, score)`` for the best ``limit`` members."""
+        return [(self.rank(-neg), user_id, -neg) for neg, user_id in self.order[:limit]]
+
+
+class Leaderboard:
+    """In-process rankings used by ``LeaderboardView``."""
+    # Everything ``build`` replaces in one swap.
+    STATE = ('_rankings', '_members', '_since', '_read_through')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._built_at = None
+            self._changes = None  # writes seen while a build is reading, replayed onto it
+            self._since = {}
+            self._read_through = 0  # highest Points id the rankings were read from
+            self._rankings = defaultdict(Ranking)
+            self._members = {}  # user_id -> (role, province)
+
+    def build(self):
+        """Read every window's scores into fresh rankings, then swap them in.
+
+        The scores come from one query (so the windows agree) run outside the
+        lock, and standings keep serving the current rankings meanwhile;
+        points and users that change during the read are recorded and
+        replayed onto the new rankings before the swap. A new ``Points`` row
+        the read already summed is skipped by id; an edit or delete of an
+        existing row that lands during the read can be counted twice until
+        the next rebuild.
+        """
+        with self._lock:
+            self._changes = []
+        now = timezone.now()
+        fresh = Leaderboard()
+        fresh._since = {window: span and now - span for window, span in WINDOWS.items()}
+        sums = {
+            window: Sum('points', filter=None if since is None else Q(created_at__gte=since))
+            for window, since in fresh._since.items()
+        }
+        scores = defaultdict(dict)
+        for user_id, role, province, last_id, *window_scores in (
+            Points.objects.order_by().values_list('user_id', 'user__role', 'user__province')
+            .annotate(last_id=Max('id'), **sums)
+        ):
+            fresh._members[user_id] = (role, province)
+            fresh._read_through = max(fresh._read_through, last_id)
+            for window, score in zip(sums, window_scores):
+                if score is not None:
+                    for segment in segments(role, province):
+                        scores[(window, *segment)][user_id] = score
+        fresh._rankings = defaultdict(Ranking, {key: Ranking(segment_scores) for key, segment_scores in scores.items()})
+        with self._lock:
+            for name in self.STATE:
+                setattr(self, name, getattr(fresh, name))
+            changes, self._changes = self._changes or [], None
+            for method, args in changes:
+                getattr(self, method)(*args)
+            self._built_at = time.monotonic()
+
+    def ensure_built(self):
+        ensure_fresh(self, getattr(settings, 'LEADERBOARD_REBUILD_SECONDS', 300))
+
+    def _change(self, method, *args):
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append((method, args))
+            if self._built_at is not None:
+                getattr(self, method)(*args)
+
+    def add_points(self, user_id, points, created_at, points_id=None):
+        """Apply a committed ``Points`` change (no-op until first build).
+
+        ``points_id`` is set for a new row, so a rebuild that already read it
+        does not count it again.
+        """
+        if not points or (self._built_at is None and self._changes is None):
+            return
+        member = self._members.get(user_id)
+        if member is None:
+            member = User.objects.filter(pk=user_id).values_list('role', 'province').first()
+            if member is None:
+                return
+        self._change('_add_points', user_id, member, points, created_at, points_id)
+
+    def _add_points(self, user_id, member, points, created_at, points_id=None):
+        if points_id is not None and points_id <= self._read_through:
+            return
+        member = self._members.setdefault(user_id, member)
+        for window, since in self._since.items():
+            if since is None or created_at >= since:
+                for segment in segments(*member):
+                    self._rankings[(window, *segment)].add(user_id, points)
+
+    def move_user(self, user_id, role, province):
+        """Follow a user's role or province change (no-op for users not on the boards)."""
+        self._change('_move_user', user_id, role, province)
+
+    def _move_user(self, user_id, role, province):
+        old = self._members.get(user_id)
+        if old is None or old == (role, province):
+            return
+        self._members[user_id] = (role, province)
+        for window in WINDOWS:
+            score = self._rankings[(window, None, None)].scores.get(user_id)
+            if score is None:
+                continue
+            for segment in segments(*old):
+                self._rankings[(window, *segment)].remove(user_id)
+            for segment in segments(role, province):
+                self._rankings[(window, *segment)].add(user_id, score)
+
+    def remove_user(self, user_id):
+        self._change('_remove_user', user_id)
+
+    def _remove_user(self, user_id):
+        member = self._members.pop(user_id, None)
+        if member is None:
+            return
+        for window in WINDOWS:
+            for segment in segments(*member):
+                self._rankings[(window, *segment)].remove(user_id)
+
+    def standings(self, window, role=None, province=None, limit=20, user_id=None):
+        """``(top, me)``: ``(rank, user_id, score)`` for the best ``limit`` users,
+        and ``(rank, score)`` for ``user_id`` (None without points in the segment).
+        """
+        self.ensure_built()
+        with self._lock:
+            ranking = self._rankings.get((window, role, province)) or Ranking()
+            top = ranking.top(limit)
+            score = ranking.scores.get(user_id)
+            me = None if score is None else (ranking.rank(score), score)
+        return top, me
+
+
+leaderboard = Leaderboard()
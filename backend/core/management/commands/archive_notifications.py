@@ -0,0 +1,45 @@
+"""Move old read notifications out of the hot ``Notification`` table."""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import notifications
+
+
+class Command(BaseCommand):
+    help = 'Archive (or delete) read notifications older than the retention period (schedule daily, e.g. cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Keep read notifications updated within this many days (default: NOTIFICATION_RETENTION_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Rows per transaction (default: NOTIFICATION_ARCHIVE_BATCH)')
+        parser.add_argument('--delete', action='store_true', help='Delete instead of copying to ArchivedNotification')
+        parser.add_argument('--pause-ms', type=int, default=0, help='Sleep between batches to let other writers in')
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches')
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 90)
+        batch_size = options['batch_size'] or getattr(settings, 'NOTIFICATION_ARCHIVE_BATCH', 1000)
+        cutoff = timezone.now() - timedelta(days=days)
+        moved, batches, last_id = 0, 0, 0
+        started = time.monotonic()
+        while options['max_batches'] is None or batches < options['max_batches']:
+            count, last_id = notifications.archive_batch(cutoff, last_id, batch_size, delete=options['delete'])
+            if last_id is None:
+                break
+            moved += count
+            batches += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  batch {batches}: {count} rows, up to id {last_id}')
+            if options['pause_ms']:
+                time.sleep(options['pause_ms'] / 1000)
+        elapsed = time.monotonic() - started
+        rate = moved / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Deleted' if options['delete'] else 'Archived'} {moved} read notifications older than {days} days "
+            f"in {batches} batches, {elapsed:.2f}s ({rate:.0f} rows/s)."
+        ))
@@ -0,0 +1,560 @@
+"""In-process HTTP/WebSocket benchmark for the API.
+
+Boots ``sangam.asgi.application`` inside this process (no server, no sockets)
+and drives every route in ``core/urls.py`` and ``users/urls.py`` plus the
+``ws/chat/<id>/`` and ``ws/stream/`` consumers against the configured
+(ideally seeded) database:
+
+    python manage.py seed_data --founders 50000 --experts 5000 --messages 500000 --seed 42
+    python manage.py benchmark --requests 200 --concurrency 16 --output bench.json
+    python manage.py benchmark --output bench-new.json --compare bench.json
+
+Per endpoint it reports p50/p95/p99 latency, throughput, error count and SQL
+queries per request (read from the ``X-Query-Count`` header added by
+``core.middleware.QueryStatsMiddleware``). Results are written as JSON so runs
+can be compared between commits.
+"""
+import asyncio
+import json
+import multiprocessing
+import statistics
+import subprocess
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.urls import URLPattern, URLResolver
+from django.utils import timezone
+
+from core.models import ExpertProfile, KPISnapshot, Notification, RedeemOffer, Syndicate, TrialProposal
+
+User = get_user_model()
+
+# (url name, method, path template, body, writes?)
+# ``body`` may be a callable taking the request number, for bodies that must be unique.
+ROUTES = [
+    ('api-root', 'get', '/api/core/', None, False),
+    ('global_stats', 'get', '/api/core/stats/', None, False),
+    ('snapshot-list', 'get', '/api/core/snapshots/', None, False),
+    ('snapshot-detail', 'get', '/api/core/snapshots/{snapshot}/', None, False),
+    ('syndicate-list', 'get', '/api/core/syndicates/', None, False),
+    ('syndicate-detail', 'get', '/api/core/syndicates/{syndicate}/', None, False),
+    ('expert-list', 'get', '/api/core/experts/', None, False),
+    ('expert-detail', 'get', '/api/core/experts/{expert_profile}/', None, False),
+    ('expert-contact', 'get', '/api/core/experts/{expert_profile}/contact/', None, False),
+    ('smart_statute', 'get', '/api/core/statutes/{syndicate}/', None, False),
+    ('chat-conversations', 'get', '/api/core/chat/conversations/', None, False),
+    ('chat-history', 'get', '/api/core/chat/history/{other}/', None, False),
+    ('chat-mark-as-read', 'post', '/api/core/chat/mark-as-read/{other}/', None, True),
+    ('propose-trial', 'post', '/api/core/trial/propose/{other}/', {'message': 'benchmark'}, True),
+    ('trial-list', 'get', '/api/core/trial/', None, False),
+    ('trial-respond', 'post', '/api/core/trial/{proposal}/respond/', {'action': 'accept'}, True),
+    ('notification-list', 'get', '/api/core/notifications/', None, False),
+    ('notification-read', 'post', '/api/core/notifications/{notification}/read/', None, True),
+    ('notification-read-all', 'post', '/api/core/notifications/read-all/', None, True),
+    ('notification-unread-count', 'get', '/api/core/notifications/unread-count/', None, False),
+    ('booking-list', 'get', '/api/core/bookings/', None, False),
+    ('booking-create', 'post', '/api/core/bookings/create/{expert_profile}/', {'amount': 0}, True),
+    ('karma-balance', 'get', '/api/core/karma/balance/', None, False),
+    ('karma-history', 'get', '/api/core/karma/history/', None, False),
+    ('karma-leaderboard', 'get', '/api/core/karma/leaderboard/?window=30d', None, False),
+    ('redeem-offers', 'get', '/api/core/redeem/offers/', None, False),
+    ('redeem-offers-for-me', 'get', '/api/core/redeem/offers/?for_me=1', None, False),
+    ('redeem-offer', 'post', '/api/core/redeem/{offer}/', None, True),
+    ('redeem-history', 'get', '/api/core/redeem/history/', None, False),
+    ('user_registration', 'post', '/api/users/register/',
+     lambda i: {'username': f'bench_{uuid.uuid4().hex[:12]}', 'email': f'bench{i}_{uuid.uuid4().hex[:8]}@bench.test',
+                'password': 'pass1234'}, True),
+    ('token_obtain_pair', 'post', '/api/users/login/', '{login}', False),
+    ('token_refresh', 'post', '/api/users/token/refresh/', '{refresh}', False),
+    ('user_profile', 'get', '/api/users/profile/', None, False),
+    ('change_password', 'post', '/api/users/change-password/', '{change_password}', True),
+    ('jodi_discovery', 'get', '/api/users/discovery/', None, False),
+    ('interest_tags', 'get', '/api/users/interest-tags/', None, False),
+]
+
+
+def url_names(patterns):
+    """All named routes under ``patterns`` (following includes)."""
+    names = set()
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            names |= url_names(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            names.add(pattern.name)
+    return names
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, statuses, queries, wall):
+    ordered = sorted(latencies)
+    return {
+        'requests': len(ordered),
+        'errors': sum(1 for s in statuses if s >= 400),
+        'p50_ms': round(percentile(ordered, 50) * 1000, 2) if ordered else None,
+        'p95_ms': round(percentile(ordered, 95) * 1000, 2) if ordered else None,
+        'p99_ms': round(percentile(ordered, 99) * 1000, 2) if ordered else None,
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 2) if ordered else None,
+        'throughput_rps': round(len(ordered) / wall, 1) if wall else None,
+        'queries_per_request': round(statistics.fmean(queries), 2) if queries else None,
+    }
+
+
+async def settle(communicator, timeout):
+    await communicator.send_to(text_data=json.dumps({'type': 'unsubscribe', 'partner_id': 0}))
+    while json.loads(await communicator.receive_from(timeout=timeout))['type'] != 'unsubscribed':
+        pass
+
+
+async def fanout_shard(application, tokens, timeout, barrier=None):
+    """Connect ``tokens``' users on ``ws/stream/``, push each a notification and time its delivery."""
+    import resource
+    from channels.layers import get_channel_layer
+    from channels.testing import WebsocketCommunicator
+    from core.streams import user_group
+
+    layer = get_channel_layer()
+    sockets = {}
+    started = time.perf_counter()
+    for offset in range(0, len(tokens), 100):
+        chunk = tokens[offset:offset + 100]
+        communicators = [WebsocketCommunicator(application, f'/ws/stream/?token={token}') for _, token in chunk]
+        connected = await asyncio.gather(*(c.connect(timeout=timeout) for c in communicators))
+        if not all(ok for ok, _ in connected):
+            raise CommandError('WebSocket connection was rejected')
+        # Sockets answer frames in order, so an answer means the socket has also announced its presence.
+        await asyncio.gather(*(settle(c, timeout) for c in communicators))
+        sockets.update((user_id, c) for (user_id, _), c in zip(chunk, communicators))
+        # Let the sockets take those announcements before connecting more: the in-memory
+        # layer drops a channel from its groups when a message expires in its queue.
+        while sum(queue.qsize() for queue in getattr(layer, 'channels', {}).values()):
+            await asyncio.sleep(0.01)
+    connect_wall = time.perf_counter() - started
+    if barrier is not None:
+        # Every process sends at once, as the workers of one deployment would.
+        await asyncio.to_thread(barrier.wait, timeout)
+
+    event = {
+        'type': 'notification',
+        'notification': {'id': 1, 'notification_type': 'BOOKING', 'title': 'New Session Booking',
+                         'message': 'benchmark', 'read': False, 'payload': {}, 'count': 1,
+                         'created_at': timezone.now().isoformat(), 'updated_at': timezone.now().isoformat()},
+        'unread_count': 1,
+    }
+    sent_at, latencies = {}, []
+
+    async def receive(user_id, communicator):
+        while json.loads(await communicator.receive_from(timeout=timeout))['type'] != 'notification':
+            pass
+        latencies.append(time.perf_counter() - sent_at[user_id])
+
+    receivers = [asyncio.ensure_future(receive(u, c)) for u, c in sockets.items()]
+    started = time.perf_counter()
+    for user_id in sockets:
+        sent_at[user_id] = time.perf_counter()
+        await layer.group_send(user_group(user_id), event)
+    send_wall = time.perf_counter() - started
+    await asyncio.gather(*receivers)
+    deliver_all = time.perf_counter() - started
+    for communicator in sockets.values():
+        await communicator.disconnect()
+    return {
+        'latencies': latencies,
+        'connect_wall': connect_wall,
+        'send_wall': send_wall,
+        'deliver_all': deliver_all,
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def fanout_worker(application, tokens, timeout, barrier, queue):
+    """Run one process's share of the fan-out and put its measurements on ``queue``."""
+    try:
+        queue.put(asyncio.run(fanout_shard(application, tokens, timeout, barrier)))
+    except BaseException as e:
+        barrier.abort()  # don't leave the other processes waiting
+        queue.put({'error': repr(e)})
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Benchmark every API route and the chat WebSocket in-process; writes latency percentiles as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help='Requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent in-flight requests / sockets')
+        parser.add_argument('--username', default=None, help='User to authenticate as (default: first founder)')
+        parser.add_argument('--password', default='pass1234', help="That user's password, for the login route")
+        parser.add_argument('--only', default=None, help='Comma-separated route names to run')
+        parser.add_argument('--read-only', action='store_true', help='Skip routes that write to the database')
+        parser.add_argument('--ws-messages', type=int, default=200, help='Chat messages to round-trip (0 to skip)')
+        parser.add_argument('--write-behind', choices=['on', 'off'], default=None,
+                            help='Force CHAT_WRITE_BEHIND for the ws-chat scenario (default: settings)')
+        parser.add_argument('--fanout-users', type=int, default=0,
+                            help='Connect this many users on ws/stream/ and time a notification push to each (0 to skip)')
+        parser.add_argument('--fanout-processes', type=int, default=1,
+                            help='Split the fan-out users across this many processes, each with its own channel layer')
+        parser.add_argument('--redeem-contention', type=int, default=0,
+                            help='Redeem one limited-stock offer from this many threads at once (0 to skip)')
+        parser.add_argument('--redeem-stock', type=int, default=None,
+                            help='Stock of the contended offer (default: half the threads)')
+        parser.add_argument('--output', default='benchmark.json', help='Where to write the JSON results')
+        parser.add_argument('--compare', default=None, help='Previous results JSON to diff p95 latency against')
+
+    def handle(self, *args, **options):
+        # Needed for queries-per-request; the middleware reads the setting per request.
+        settings.QUERY_STATS_HEADERS = True
+        if options['write_behind']:
+            settings.CHAT_WRITE_BEHIND = options['write_behind'] == 'on'
+        from sangam.asgi import application
+        from rest_framework_simplejwt.tokens import RefreshToken
+
+        user = self.pick_user(options['username'])
+        refresh = RefreshToken.for_user(user)
+        context = self.fixtures(user)
+        context['login'] = {'username': user.username, 'password': options['password']}
+        context['refresh'] = {'refresh': str(refresh)}
+        context['change_password'] = {'old_password': options['password'], 'new_password': options['password']}
+        token = str(refresh.access_token)
+        if options['fanout_users']:
+            from rest_framework_simplejwt.tokens import AccessToken
+            context['fanout_tokens'] = [
+                (u.id, str(AccessToken.for_user(u))) for u in User.objects.order_by('id')[:options['fanout_users']]
+            ]
+
+        only = {name.strip() for name in options['only'].split(',')} if options['only'] else None
+        self.warn_uncovered()
+
+        results = asyncio.run(self.run_all(application, token, context, options, only))
+        if context.get('fanout_tokens') and (not only or 'ws-fanout' in only):
+            results['ws-fanout'] = self.run_fanout(application, context['fanout_tokens'], options['fanout_processes'])
+            self.stdout.write(f"  ws-fanout: {results['ws-fanout']['sockets']} sockets in "
+                              f"{results['ws-fanout']['processes']} processes, "
+                              f"all delivered in {results['ws-fanout']['deliver_all_ms']} ms")
+        if options['redeem_contention'] and (not only or 'redeem-contention' in only):
+            results['redeem-contention'] = self.run_redeem_contention(options['redeem_contention'], options['redeem_stock'])
+            row = results['redeem-contention']
+            self.stdout.write(f"  redeem-contention: {row['redeemed']} redeemed, {row['sold_out']} sold out, "
+                              f"{row['limit_reached']} over limit, stock {row['stock']} -> {row['final_stock']}, "
+                              f"oversold {row['oversold']}")
+        report = {
+            'meta': {
+                'commit': self.git_commit(),
+                'timestamp': timezone.now().isoformat(),
+                'database': settings.DATABASES['default']['ENGINE'],
+                'user': user.username,
+                'requests_per_endpoint': options['requests'],
+                'concurrency': options['concurrency'],
+                'chat_write_behind': settings.CHAT_WRITE_BEHIND,
+                'rows': {
+                    'users': User.objects.count(),
+                    'syndicates': Syndicate.objects.count(),
+                    'notifications': Notification.objects.count(),
+                },
+            },
+            'endpoints': results,
+        }
+        with open(options['output'], 'w') as fh:
+            json.dump(report, fh, indent=2)
+        self.print_table(results, options['compare'])
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    # --- setup ----------------------------------------------------------
+
+    def pick_user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'No user named {username!r}')
+        user = User.objects.filter(role='FOUNDER').order_by('id').first() or User.objects.order_by('id').first()
+        if user is None:
+            raise CommandError('Database has no users; run seed_data first.')
+        return user
+
+    def fixtures(self, user):
+        """Ids that fill the ``{placeholders}`` in ROUTES; missing ones skip their routes."""
+        def first_id(queryset):
+            return queryset.order_by('id').values_list('id', flat=True).first()
+
+        partners = list(User.objects.exclude(id=user.id).order_by('id').values_list('id', flat=True)[:64])
+        return {
+            'partners': partners,
+            'other': first_id(User.objects.exclude(id=user.id).filter(role='FOUNDER')) or first_id(User.objects.exclude(id=user.id)),
+            'snapshot': first_id(KPISnapshot.objects.filter(user=user)),
+            'syndicate': first_id(Syndicate.objects.filter(is_active=True)),
+            'expert_profile': first_id(ExpertProfile.objects.exclude(user=user)),
+            'proposal': first_id(TrialProposal.objects.filter(recipient=user)),
+            'notification': first_id(Notification.objects.filter(user=user)),
+            'offer': first_id(RedeemOffer.objects.filter(is_active=True)),
+        }
+
+    def warn_uncovered(self):
+        from core import urls as core_urls
+        from users import urls as users_urls
+        covered = {route[0] for route in ROUTES}
+        missing = (url_names(core_urls.urlpatterns) | url_names(users_urls.urlpatterns)) - covered
+        if missing:
+            self.stdout.write(self.style.WARNING(f"Routes without a benchmark scenario: {', '.join(sorted(missing))}"))
+
+    def git_commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  cwd=settings.BASE_DIR, timeout=5).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    # --- runners --------------------------------------------------------
+
+    async def run_all(self, application, token, context, options, only):
+        results = {}
+        headers = [(b'authorization', f'Bearer {token}'.encode()), (b'content-type', b'application/json')]
+        for name, method, template, body, writes in ROUTES:
+            if (only and name not in only) or (writes and options['read_only']):
+                continue
+            try:
+                path = template.format(**context)
+            except KeyError:
+                continue
+            if 'None' in path:
+                self.stdout.write(self.style.WARNING(f'Skipping {name}: no data for {template}'))
+                continue
+            if isinstance(body, str):
+                body = context[body.strip('{}')]
+            results[name] = await self.run_http(application, method, path, body, headers,
+                                                options['requests'], options['concurrency'])
+            self.stdout.write(f"  {name}: p50 {results[name]['p50_ms']} ms")
+        for name, stream in (('ws-chat', False), ('ws-stream', True)):
+            if options['ws_messages'] and (not only or name in only) and context['partners']:
+                results[name] = await self.run_ws(application, token, context['partners'],
+                                                  options['ws_messages'], options['concurrency'], stream)
+                self.stdout.write(f"  {name}: p50 {results[name]['p50_ms']} ms")
+        return results
+
+    async def run_http(self, application, method, path, body, headers, requests, concurrency):
+        from channels.testing import HttpCommunicator
+
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, statuses, queries = [], [], []
+
+        async def one(i):
+            payload = body(i) if callable(body) else body
+            raw = json.dumps(payload).encode() if payload is not None else b''
+            async with semaphore:
+                communicator = HttpCommunicator(application, method, path, raw,
+                                                headers + [(b'content-length', str(len(raw)).encode())])
+                started = time.perf_counter()
+                response = await communicator.get_response(timeout=60)
+                latencies.append(time.perf_counter() - started)
+                await communicator.wait(timeout=60)
+            statuses.append(response['status'])
+            for key, value in response['headers']:
+                if key.lower() == b'x-query-count':
+                    queries.append(int(value))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        return summarize(latencies, statuses, queries, time.perf_counter() - started)
+
+    async def run_ws(self, application, token, partners, messages, concurrency, stream=False):
+        """Round-trip chat messages: send on one socket, wait for its broadcast echo.
+
+        Each socket talks to a different partner where possible, so sockets
+        don't share conversations and the measurement isn't dominated by
+        fan-out. With
+        ``stream`` the sockets are ``ws/stream/`` connections subscribed to
+        their partner instead of per-conversation ``ws/chat/<id>/`` ones.
+        """
+        from channels.testing import WebsocketCommunicator
+        from core.chat_writer import message_writer
+
+        sockets = []
+        connect_latencies = []
+        for i in range(concurrency):
+            partner = partners[i % len(partners)]
+            path = '/ws/stream/' if stream else f'/ws/chat/{partner}/'
+            communicator = WebsocketCommunicator(application, f'{path}?token={token}')
+            started = time.perf_counter()
+            connected, _ = await communicator.connect(timeout=30)
+            if connected and stream:
+                await communicator.send_to(text_data=json.dumps({'type': 'subscribe', 'partner_id': partner}))
+                # A partner without a conversation yet is refused; the first chat.send subscribes instead.
+                while json.loads(await communicator.receive_from(timeout=30))['type'] not in ('subscribed', 'error'):
+                    pass
+            connect_latencies.append(time.perf_counter() - started)
+            if not connected:
+                raise CommandError('WebSocket connection was rejected')
+            sockets.append((communicator, partner))
+
+        latencies, statuses = [], []
+        per_socket = max(messages // concurrency, 1)
+
+        async def drive(index, communicator, partner):
+            for n in range(per_socket):
+                marker = f'bench-{index}-{n}-{uuid.uuid4().hex[:6]}'
+                frame = {'type': 'chat.send', 'partner_id': partner, 'message': marker} if stream else {'message': marker}
+                started = time.perf_counter()
+                await communicator.send_to(text_data=json.dumps(frame))
+                # Sockets may share a conversation, so skip other sockets' broadcasts.
+                while True:
+                    frame = json.loads(await communicator.receive_from(timeout=30))
+                    if frame.get('message') == marker:
+                        break
+                latencies.append(time.perf_counter() - started)
+                statuses.append(200)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(drive(i, *socket) for i, socket in enumerate(sockets)))
+        wall = time.perf_counter() - started
+        for communicator, _ in sockets:
+            await communicator.disconnect()
+        # With write-behind on, messages are only durable once the queue drains.
+        await message_writer.flush()
+        persisted_wall = time.perf_counter() - started
+        summary = summarize(latencies, statuses, [], wall)
+        summary['connect_p50_ms'] = round(percentile(sorted(connect_latencies), 50) * 1000, 2)
+        summary['persisted_rps'] = round(len(latencies) / persisted_wall, 1)
+        return summary
+
+    def run_fanout(self, application, tokens, processes=1):
+        """Hold one ``ws/stream/`` socket per user and push one notification event to each.
+
+        Measures what ``core.notifications.send`` costs at that scale: the
+        channel-layer ``group_send`` per user, and the time until every socket
+        has the frame. Connect cost and peak RSS are reported alongside.
+
+        With ``processes`` above one the users are split across that many
+        forked processes, each holding its share of the sockets on its own
+        channel layer (as server workers would) and sending to its own users
+        once all of them have connected.
+        """
+        # The in-memory channel layer sweeps every channel on each send, so
+        # its cost grows with the number of open sockets; allow for that.
+        timeout = 60 + len(tokens) * 0.05
+        if processes <= 1:
+            shards = [asyncio.run(fanout_shard(application, tokens, timeout))]
+        else:
+            context = multiprocessing.get_context('fork')
+            barrier, queue = context.Barrier(processes), context.Queue()
+            connections.close_all()  # each process opens its own
+            workers = [
+                context.Process(target=fanout_worker, args=(application, tokens[i::processes], timeout, barrier, queue))
+                for i in range(processes)
+            ]
+            for worker in workers:
+                worker.start()
+            shards = [queue.get() for _ in workers]
+            for worker in workers:
+                worker.join()
+            errors = [shard['error'] for shard in shards if 'error' in shard]
+            if errors:
+                raise CommandError(f'Fan-out failed: {errors[0]}')
+
+        latencies = [latency for shard in shards for latency in shard['latencies']]
+        deliver_all = max(shard['deliver_all'] for shard in shards)
+        connect_wall = max(shard['connect_wall'] for shard in shards)
+        summary = summarize(latencies, [200] * len(latencies), [], deliver_all)
+        summary.update({
+            'sockets': len(latencies),
+            'processes': len(shards),
+            'connect_wall_s': round(connect_wall, 2),
+            'connects_per_s': round(len(latencies) / connect_wall, 1),
+            'group_send_us': round(statistics.fmean(shard['send_wall'] / len(shard['latencies']) for shard in shards) * 1e6, 1),
+            'deliver_all_ms': round(deliver_all * 1000, 1),
+            'max_rss_mb': max(shard['max_rss_mb'] for shard in shards),
+        })
+        return summary
+
+    def run_redeem_contention(self, threads, stock=None):
+        """Redeem one hot offer from ``threads`` users at once, each trying twice.
+
+        The offer has ``stock`` units (default half the threads) and a limit of
+        one per user, and every user is granted enough points, so the only
+        refusals are sold out and over the limit. Checks that exactly
+        ``min(stock, threads)`` redemptions went through and the stock matches;
+        the offer, its redemptions and the granted points are deleted afterwards.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from threading import Barrier
+
+        from django.db import OperationalError, connection
+        from core import karma
+        from core.models import Points, Redemption
+
+        stock = threads // 2 if stock is None else stock
+        user_ids = list(User.objects.order_by('id').values_list('id', flat=True)[:threads])
+        offer = RedeemOffer.objects.create(company_name='Benchmark', description='redeem-contention',
+                                           discount_percent=10, points_required=10, stock=stock, per_user_limit=1)
+        grants = [Points.objects.create(user_id=user_id, points=offer.points_required, reason='benchmark').id
+                  for user_id in user_ids]
+        barrier = Barrier(len(user_ids))
+        latencies, outcomes = [], []
+
+        def attempt(user_id):
+            started = time.perf_counter()
+            try:
+                karma.redeem(user_id, offer)
+                outcome = 'redeemed'
+            except karma.RedemptionRefused as refused:
+                outcome = refused.reason
+            except OperationalError:  # e.g. SQLite's "database is locked"
+                outcome = 'error'
+            latencies.append(time.perf_counter() - started)
+            outcomes.append(outcome)
+
+        def worker(user_id):
+            try:
+                barrier.wait()
+                attempt(user_id)
+                attempt(user_id)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(user_ids)) as pool:
+            list(pool.map(worker, user_ids))
+        wall = time.perf_counter() - started
+
+        offer.refresh_from_db()
+        redeemed = Redemption.objects.filter(offer=offer).count()
+        summary = summarize(latencies, [500 if o == 'error' else 200 for o in outcomes], [], wall)
+        summary.update({
+            'threads': len(user_ids),
+            'stock': stock,
+            'final_stock': offer.stock,
+            'redeemed': redeemed,
+            'sold_out': outcomes.count(karma.RedemptionRefused.SOLD_OUT),
+            'limit_reached': outcomes.count(karma.RedemptionRefused.LIMIT_REACHED),
+            'insufficient': outcomes.count(karma.RedemptionRefused.INSUFFICIENT),
+            'oversold': redeemed > stock or redeemed != stock - offer.stock,
+        })
+        offer.delete()  # redemptions cascade and are refunded by core.signals
+        for grant in Points.objects.filter(id__in=grants):
+            grant.delete()
+        return summary
+
+    # --- output ---------------------------------------------------------
+
+    def print_table(self, results, compare_path):
+        previous = {}
+        if compare_path:
+            with open(compare_path) as fh:
+                previous = json.load(fh).get('endpoints', {})
+        self.stdout.write(f"{'endpoint':32} {'p50':>8} {'p95':>8} {'p99':>8} {'rps':>8} {'q/req':>6} {'err':>4}")
+        for name, row in results.items():
+            line = (f"{name:32} {row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8} "
+                    f"{row['throughput_rps']:>8} {str(row['queries_per_request']):>6} {row['errors']:>4}")
+            before = previous.get(name, {}).get('p95_ms')
+            if before:
+                line += f"  p95 {(row['p95_ms'] - before) / before * 100:+.0f}%"
+            self.stdout.write(line)
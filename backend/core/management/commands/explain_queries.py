@@ -0,0 +1,154 @@
+"""Query-plan report for every API route.
+
+Replays one request per route in ``benchmark.ROUTES`` against the configured
+(ideally seeded) database, captures each SQL statement it runs and asks the
+database how it would execute it:
+
+    python manage.py seed_data --founders 20000 --experts 2000 --messages 200000 --seed 42
+    python manage.py explain_queries --output explain.json
+
+Statements whose plan reads a whole table (SQLite ``SCAN <table>`` without an
+index, PostgreSQL ``Seq Scan``) or sorts through a temporary structure
+(``USE TEMP B-TREE``, ``Sort``) are flagged, with the columns the statement
+filters and orders that table by as index candidates. Writes run inside a
+transaction that is rolled back, so the database is left as it was.
+"""
+import json
+import re
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from . import benchmark
+
+SKIPPED_STATEMENTS = ('SAVEPOINT', 'RELEASE', 'ROLLBACK', 'BEGIN', 'COMMIT')
+# A column compared with a value (not another column, as in join conditions).
+COLUMN_USE = re.compile(r'"(\w+)"\."(\w+)"\s*(?:=|IN\b|<|>|IS\b|LIKE\b)\s*(?!\s*"|\s*T\d+\.)', re.IGNORECASE)
+ORDER_BY = re.compile(r'ORDER BY (.+?)(?: LIMIT| OFFSET|\)|$)', re.IGNORECASE)
+
+
+def explain(sql):
+    """The plan lines for ``sql`` on the current connection."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN {sql}')
+        return [row[0] for row in cursor.fetchall()]
+
+
+def problems(plan, sql):
+    """``(kind, table or None)`` for each plan line that reads a whole table or sorts in a temp structure.
+
+    A scan that already returns rows in ORDER BY order (no temp sort) under a
+    LIMIT stops after that many rows, as keyset pages do, so it isn't flagged.
+    """
+    found = []
+    ordered_limit = ' LIMIT ' in sql and not any('TEMP B-TREE' in line or 'Sort' in line for line in plan)
+    for line in plan:
+        detail = line.strip().lstrip('->').strip()
+        if connection.vendor == 'sqlite':
+            match = re.match(r'SCAN (\w+)(?: AS \w+)?$', detail)
+            if match and not ordered_limit:
+                found.append(('full_scan', match.group(1)))
+            elif detail.startswith('USE TEMP B-TREE'):
+                found.append(('temp_sort', None))
+        else:
+            match = re.match(r'Seq Scan on (\w+)', detail)
+            if match and not ordered_limit:
+                found.append(('full_scan', match.group(1)))
+            elif detail.startswith(('Sort ', 'Incremental Sort')):
+                found.append(('temp_sort', None))
+    return found
+
+
+def candidate_columns(sql, table):
+    """Columns of ``table`` that ``sql`` filters on, then the ORDER BY terms."""
+    filtered = [column for t, column in COLUMN_USE.findall(sql) if t == table]
+    ordered = []
+    for clause in ORDER_BY.findall(sql):
+        ordered += [term.strip() for term in clause.split(',') if f'"{table}".' in term]
+    return list(dict.fromkeys(filtered)) + [term.replace(f'"{table}".', '') for term in ordered]
+
+
+class Command(benchmark.Command):
+    help = 'Capture the query plan of every SQL statement each API route runs and flag full scans and temp sorts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', default=None, help='User to authenticate as (default: first founder)')
+        parser.add_argument('--password', default='pass1234', help="That user's password, for the login route")
+        parser.add_argument('--only', default=None, help='Comma-separated route names to run')
+        parser.add_argument('--all', action='store_true', help='Print every plan, not just flagged statements')
+        parser.add_argument('--output', default='explain.json', help='Where to write the JSON report')
+
+    def handle(self, *args, **options):
+        from rest_framework_simplejwt.tokens import RefreshToken
+
+        user = self.pick_user(options['username'])
+        refresh = RefreshToken.for_user(user)
+        context = self.fixtures(user)
+        context['login'] = {'username': user.username, 'password': options['password']}
+        context['refresh'] = {'refresh': str(refresh)}
+        context['change_password'] = {'old_password': options['password'], 'new_password': options['password']}
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        only = {name.strip() for name in options['only'].split(',')} if options['only'] else None
+
+        report = {}
+        for name, method, template, body, _ in benchmark.ROUTES:
+            if only and name not in only:
+                continue
+            try:
+                path = template.format(**context)
+            except KeyError:
+                continue
+            if 'None' in path:
+                self.stdout.write(self.style.WARNING(f'Skipping {name}: no data for {template}'))
+                continue
+            if isinstance(body, str):
+                body = context[body.strip('{}')]
+            report[name] = self.explain_route(client, method, path, body(0) if callable(body) else body)
+
+        flagged = Counter()
+        for name, route in report.items():
+            bad = [s for s in route['statements'] if s['problems']]
+            self.stdout.write(f"{name:32} {route['status']:>4} {route['ms']:>8} ms "
+                              f"{len(route['statements']):>3} queries {len(bad):>3} flagged")
+            for statement in route['statements'] if options['all'] else bad:
+                self.stdout.write(f"    {statement['sql'][:200]}")
+                for line in statement['plan']:
+                    self.stdout.write(f"      {line}")
+                for kind, table in statement['problems']:
+                    flagged[kind, table] += 1
+                    if table:
+                        columns = candidate_columns(statement['sql'], table)
+                        self.stdout.write(self.style.WARNING(
+                            f"      {kind} on {table}; candidate columns: {', '.join(columns) or '-'}"))
+                    else:
+                        self.stdout.write(self.style.WARNING(f'      {kind}'))
+
+        with open(options['output'], 'w') as fh:
+            json.dump({'database': settings.DATABASES['default']['ENGINE'], 'routes': report}, fh, indent=2)
+        summary = ', '.join(f'{kind} {table or ""}'.strip() + f' x{n}' for (kind, table), n in flagged.most_common())
+        self.stdout.write(self.style.SUCCESS(f"Flagged: {summary or 'nothing'}. Report written to {options['output']}"))
+
+    def explain_route(self, client, method, path, body):
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = getattr(client, method)(path, json.dumps(body) if body is not None else None,
+                                                   content_type='application/json')
+                elapsed = time.perf_counter() - started
+            statements = []
+            for query in queries.captured_queries:
+                sql = query['sql']
+                if sql.lstrip().upper().startswith(SKIPPED_STATEMENTS):
+                    continue
+                plan = explain(sql)
+                statements.append({'sql': sql, 'ms': round(float(query['time']) * 1000, 2),
+                                   'plan': plan, 'problems': problems(plan, sql)})
+            transaction.set_rollback(True)
+        return {'status': response.status_code, 'ms': round(elapsed * 1000, 2), 'statements': statements}
@@ -0,0 +1,29 @@
+"""Apply queued outbox events: create notifications and push them to sockets."""
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import outbox
+
+
+class Command(BaseCommand):
+    help = 'Drain the transactional outbox (run continuously alongside the web and ASGI servers)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Events per transaction (default: OUTBOX_BATCH)')
+        parser.add_argument('--concurrency', type=int, default=4, help='Batches of channel-layer pushes in flight')
+        parser.add_argument('--poll-ms', type=int, default=None, help='Sleep when the outbox is empty (default: OUTBOX_POLL_MS)')
+        parser.add_argument('--once', action='store_true', help='Exit once nothing is ready instead of polling')
+
+    def handle(self, *args, **options):
+        poll = options['poll_ms'] / 1000 if options['poll_ms'] is not None else None
+        started = time.monotonic()
+        try:
+            claimed = asyncio.run(outbox.run(options['batch_size'], options['concurrency'], poll, options['once']))
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped.')
+            return
+        elapsed = time.monotonic() - started
+        rate = claimed / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(f"Processed {claimed} outbox events in {elapsed:.2f}s ({rate:.0f} events/s)."))
@@ -0,0 +1,17 @@
+"""Delete stored Idempotency-Key responses older than IDEMPOTENCY_KEY_HOURS."""
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.idempotency import cutoff
+from core.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Delete expired Idempotency-Key responses (schedule periodically, e.g. hourly cron)'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        deleted, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff()).delete()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} idempotency keys in {elapsed:.2f}s."))
@@ -0,0 +1,18 @@
+"""Rebuild the interest-tag inverted index from the JSON ``interest_tags`` columns."""
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from core import tag_index
+from core.models import Syndicate
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Rebuild InterestTagIndex (run after bulk imports that bypass model signals)'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            users = tag_index.rebuild('USER', User.objects.all())
+            syndicates = tag_index.rebuild('SYNDICATE', Syndicate.objects.all())
+        self.stdout.write(self.style.SUCCESS(f'Indexed {users} user tags and {syndicates} syndicate tags.'))
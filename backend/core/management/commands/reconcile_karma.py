@@ -0,0 +1,16 @@
+"""Recompute per-user karma balances from the points and redemptions ledger."""
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import karma
+
+
+class Command(BaseCommand):
+    help = 'Repair KarmaBalance rows (schedule periodically, e.g. nightly cron, and run after bulk imports)'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        fixed = karma.reconcile()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Reconciled karma balances in {elapsed:.2f}s ({fixed} corrected)."))
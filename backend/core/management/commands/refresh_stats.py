@@ -0,0 +1,19 @@
+"""Recompute the platform statistics rollup from the source tables."""
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild PlatformStat counters (schedule periodically, e.g. hourly cron, and run after bulk imports)'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        values = stats.rebuild()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {len(values)} counters in {elapsed:.2f}s "
+            f"({values['users']} users, {values['matches']} matches)."
+        ))
@@ -1,9 +1,31 @@
-"""Seed ~100 users, syndicates, and experts for Jodi, Syndicate, and Experts sections."""
+"""Seed ~100 users, syndicates, and experts for Jodi, Syndicate, and Experts sections.
+
+With any of the size options (``--founders``, ``--experts``, ``--messages`` ...)
+the command switches to scale mode for load testing: rows are generated lazily
+and written with ``bulk_create`` in batches, every user shares one precomputed
+password hash, and ``--seed`` makes the dataset reproducible, e.g.
+
+    python manage.py seed_data --founders 500000 --experts 50000 --messages 10000000 --seed 42
+"""
 import random
+import time
+from array import array
+from datetime import date, timedelta
 from decimal import Decimal
+from itertools import islice
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
-from core.models import Syndicate, ExpertProfile, RedeemOffer
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from core import conversations, stats, tag_index
+from core.karma import reconcile as reconcile_karma_balances
+from core.notifications import reconcile as reconcile_unread_counters
+from core.models import (
+    Syndicate, ExpertProfile, RedeemOffer, Conversation, ConversationMember, Message, Notification, Booking, Points, KPISnapshot,
+)
 
 User = get_user_model()
 
@@ -80,14 +102,116 @@ REDEEM_OFFERS = [
 ]
 
 
-def random_tags(n=3):
-    return random.sample(INTEREST_TAGS, min(n, len(INTEREST_TAGS)))
+MESSAGE_SNIPPETS = [
+    "Hi! Loved your pitch, want to talk?",
+    "Can we set up a call this week?",
+    "Sharing our latest traction numbers.",
+    "Thanks for the intro, following up here.",
+    "What stage are you raising at?",
+    "Let's sync on the trial plan.",
+]
+
+NOTIFICATION_KINDS = [
+    ('MESSAGE', 'New Message'),
+    ('TRIAL_PROPOSAL', 'Trial Proposal'),
+    ('BOOKING', 'New Session Booking'),
+]
+
+POINT_REASONS = ['Profile completed', 'Helped a founder', 'Attended session', 'Referral', 'Weekly pulse posted']
+
+# Options that switch the command into scale mode.
+SCALE_OPTIONS = ('founders', 'experts', 'syndicates', 'messages', 'notifications', 'bookings', 'points', 'snapshots')
+
+
+def random_tags(n=3, rng=random):
+    return rng.sample(INTEREST_TAGS, min(n, len(INTEREST_TAGS)))
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class ConversationSlots:
+    """Conversation ids for seeded message pairs without a pair -> id dict in memory.
+
+    Seeded messages only pair people within ``hop`` positions of each other, so
+    every pair has a fixed slot number and its conversation is created with id
+    ``base + slot``; a bytearray remembers which slots already exist. Pairs that
+    already had a conversation before this run are looked up individually.
+    """
+
+    def __init__(self, people, hop):
+        self.people = people
+        self.hop = hop
+        self.base = (Conversation.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+        self.created = bytearray(len(people) * (hop + 1))
+        self.existing = {}
+
+    def slot(self, i, j):
+        a, b = min(i, j), max(i, j)
+        if b - a <= self.hop:
+            return a * (self.hop + 1) + (b - a)
+        return b * (self.hop + 1) + (a + len(self.people) - b)
+
+    def ensure(self, pairs):
+        """Map each ``(i, j)`` index pair to a conversation id, creating missing rows."""
+        slots = {pair: self.slot(*pair) for pair in pairs}
+        new = {slot: pair for pair, slot in slots.items() if not self.created[slot]}
+        if new:
+            rows = []
+            for slot, (i, j) in new.items():
+                low, high = sorted((self.people[i], self.people[j]))
+                rows.append(Conversation(id=self.base + slot, user_low_id=low, user_high_id=high))
+            Conversation.objects.bulk_create(rows, ignore_conflicts=True)
+            ConversationMember.objects.bulk_create(
+                [m for c in rows for m in ConversationMember.pair(c.id, c.user_low_id, c.user_high_id)],
+                ignore_conflicts=True,
+            )
+            inserted = set(Conversation.objects.filter(id__in=[self.base + s for s in new]).values_list('id', flat=True))
+            for slot, (i, j) in new.items():
+                self.created[slot] = 1
+                if self.base + slot not in inserted:
+                    self.existing[slot] = Conversation.objects.between(self.people[i], self.people[j]).id
+        return {pair: self.existing.get(slot, self.base + slot) for pair, slot in slots.items()}
+
+    def reset_sequence(self):
+        # Explicit ids bypass the id sequence on backends that have one.
+        statements = connection.ops.sequence_reset_sql(no_style(), [Conversation])
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
 
 
 class Command(BaseCommand):
-    help = 'Seed ~100 users (Jodi), syndicates, and experts'
+    help = 'Seed ~100 users (Jodi), syndicates, and experts; pass sizes (e.g. --founders 500000) for load-test data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for a reproducible dataset')
+        parser.add_argument('--founders', type=int, default=0, help='Founders to create (scale mode)')
+        parser.add_argument('--experts', type=int, default=0, help='Experts (with profiles) to create (scale mode)')
+        parser.add_argument('--syndicates', type=int, default=None, help='Syndicates (default: founders / 20)')
+        parser.add_argument('--messages', type=int, default=0, help='Chat messages to create (scale mode)')
+        parser.add_argument('--notifications', type=int, default=None, help='Notifications (default: messages / 4)')
+        parser.add_argument('--bookings', type=int, default=None, help='Bookings (default: experts * 4)')
+        parser.add_argument('--points', type=int, default=None, help='Points records (default: founders * 2)')
+        parser.add_argument('--snapshots', type=int, default=None, help='KPI snapshots (default: founders * 4)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk_create batch')
 
     def handle(self, *args, **options):
+        if options['seed'] is not None:
+            random.seed(options['seed'])
+        if any(options[name] for name in SCALE_OPTIONS):
+            self.seed_scale(options)
+        else:
+            self.seed_demo()
+
+    def seed_demo(self):
         default_password = 'pass1234'
 
         # --- Jodi: ~40 founders ---
@@ -196,3 +320,229 @@ class Command(BaseCommand):
         self.stdout.write(self.style.SUCCESS(f'  Created redeem offers'))
 
         self.stdout.write(self.style.SUCCESS('Seed complete! Jodi, Syndicate, Experts, and Redeem Offers have sample data.'))
+
+    # --- Scale mode -------------------------------------------------------
+
+    def seed_scale(self, options):
+        rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        founders = options['founders']
+        experts = options['experts']
+        messages = options['messages']
+        syndicates = options['syndicates'] if options['syndicates'] is not None else founders // 20
+        notifications = options['notifications'] if options['notifications'] is not None else messages // 4
+        bookings = options['bookings'] if options['bookings'] is not None else experts * 4
+        points = options['points'] if options['points'] is not None else founders * 2
+        snapshots = options['snapshots'] if options['snapshots'] is not None else founders * 4
+        started = time.monotonic()
+
+        if connection.vendor == 'sqlite':
+            # Bulk load speed over crash safety; this is throwaway local data.
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode=WAL')
+                cursor.execute('PRAGMA synchronous=OFF')
+
+        password = make_password('pass1234')  # hashed once, shared by every seeded user
+        self.bulk(User, self.founder_rows(rng, founders, password), founders, 'founders', ignore_conflicts=True)
+        self.bulk(User, self.expert_user_rows(rng, experts, password), experts, 'expert users', ignore_conflicts=True)
+
+        # Id pools are compact int64 arrays, not model instances.
+        founder_ids = array('q', User.objects.filter(role='FOUNDER').order_by('id').values_list('id', flat=True).iterator())
+        expert_ids = array('q', User.objects.filter(role='EXPERT').order_by('id').values_list('id', flat=True).iterator())
+        people = founder_ids + expert_ids
+        if not people:
+            self.stdout.write(self.style.WARNING('No users to attach rows to; pass --founders or --experts.'))
+            return
+
+        profiled = set(ExpertProfile.objects.values_list('user_id', flat=True))
+        missing = [uid for uid in expert_ids if uid not in profiled]
+        self.bulk(ExpertProfile, self.expert_profile_rows(rng, missing), len(missing), 'expert profiles')
+        if founder_ids:
+            self.bulk(Syndicate, self.syndicate_rows(rng, syndicates, founder_ids), syndicates, 'syndicates')
+            self.bulk(KPISnapshot, self.snapshot_rows(rng, snapshots, founder_ids), snapshots, 'KPI snapshots',
+                      ignore_conflicts=True)
+        if len(people) > 1:
+            self.bulk(Message, self.message_rows(rng, messages, people), messages, 'messages')
+        self.bulk(Notification, self.notification_rows(rng, notifications, people), notifications, 'notifications',
+                  timestamp='created_at')
+        if founder_ids and expert_ids:
+            self.bulk(Booking, self.booking_rows(rng, bookings, founder_ids, expert_ids), bookings, 'bookings',
+                      timestamp='created_at')
+        self.bulk(Points, self.points_rows(rng, points, people), points, 'points', timestamp='created_at')
+
+        # bulk_create skips model signals, so rebuild what they normally maintain.
+        self.stdout.write('Rebuilding interest tag index...')
+        with transaction.atomic():
+            tag_index.rebuild('USER', User.objects.all())
+            tag_index.rebuild('SYNDICATE', Syndicate.objects.all())
+        self.stdout.write('Refreshing conversation inbox state...')
+        conversations.refresh_members()
+        self.stdout.write('Rebuilding platform stats...')
+        stats.rebuild()
+        self.stdout.write('Reconciling unread notification counters...')
+        reconcile_unread_counters()
+        self.stdout.write('Reconciling karma balances...')
+        reconcile_karma_balances()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Scale seed complete in {elapsed:.1f}s.'))
+
+    def bulk(self, model, rows, total, label, ignore_conflicts=False, timestamp=None):
+        """Insert ``rows`` in batches.
+
+        ``timestamp`` names an ``auto_now_add`` field whose generated values
+        should be kept: bulk_create stamps it with the current time, so the
+        batch's own values are written back by primary key afterwards (one
+        prepared UPDATE run per row, far cheaper than bulk_update's CASE).
+        """
+        if not total:
+            return 0
+        self.stdout.write(f'Seeding {total} {label}...')
+        started = time.monotonic()
+        done = 0
+        next_report = total // 10
+        for batch in batched(rows, self.batch_size):
+            stamps = [getattr(row, timestamp) for row in batch] if timestamp else None
+            with transaction.atomic():
+                model.objects.bulk_create(batch, ignore_conflicts=ignore_conflicts)
+                if timestamp:
+                    self.restore(model, timestamp, batch, stamps)
+            done += len(batch)
+            if done >= next_report and done < total:
+                self.stdout.write(f'  {done}/{total} {label}')
+                next_report += max(total // 10, 1)
+        rate = done / max(time.monotonic() - started, 1e-6)
+        self.stdout.write(self.style.SUCCESS(f'  Created {done} {label} ({rate:,.0f} rows/s)'))
+        return done
+
+    def restore(self, model, field_name, rows, values):
+        field = model._meta.get_field(field_name)
+        qn = connection.ops.quote_name
+        sql = (f'UPDATE {qn(model._meta.db_table)} SET {qn(field.column)} = %s '
+               f'WHERE {qn(model._meta.pk.column)} = %s')
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [(field.get_db_prep_value(value, connection), row.pk)
+                                     for row, value in zip(rows, values)])
+
+    def spread(self, total, days=365):
+        """Timestamps spread evenly over the last ``days``, oldest first (so they follow ids)."""
+        start = timezone.now() - timedelta(days=days)
+        step = timedelta(days=days) / max(total, 1)
+        for i in range(total):
+            yield start + step * i
+
+    def founder_rows(self, rng, count, password):
+        for i in range(1, count + 1):
+            yield User(
+                username=f'load_founder_{i}',
+                email=f'founder{i}@load.test',
+                password=password,
+                role='FOUNDER',
+                persona=rng.choice(PERSONAS),
+                startup_stage=rng.choice(STAGES),
+                province=rng.choice(PROVINCES),
+                bio=rng.choice(JODI_BIOS),
+                interest_tags=random_tags(rng.randint(1, 4), rng),
+                karma_score=rng.randint(0, 500),
+            )
+
+    def expert_user_rows(self, rng, count, password):
+        for i in range(1, count + 1):
+            yield User(
+                username=f'load_expert_{i}',
+                email=f'expert{i}@load.test',
+                password=password,
+                role='EXPERT',
+                province=rng.choice(PROVINCES),
+                bio=rng.choice(EXPERT_BIOS),
+                interest_tags=random_tags(rng.randint(1, 4), rng),
+                karma_score=rng.randint(0, 300),
+            )
+
+    def expert_profile_rows(self, rng, user_ids):
+        for user_id in user_ids:
+            yield ExpertProfile(
+                user_id=user_id,
+                specialization=rng.choice(EXPERT_SPECIALIZATIONS),
+                bio=rng.choice(EXPERT_BIOS),
+                hourly_rate=Decimal(rng.randint(2500, 15000)) / 100,
+                rating=Decimal(rng.randint(400, 500)) / 100,
+                is_vetted=rng.random() > 0.3,
+            )
+
+    def syndicate_rows(self, rng, count, founder_ids):
+        for i in range(1, count + 1):
+            goal = Decimal(rng.randint(50000, 500000))
+            yield Syndicate(
+                title=f'{rng.choice(SYNDICATE_TITLES)} #{i}',
+                founder_id=rng.choice(founder_ids),
+                description=rng.choice(SYNDICATE_DESCRIPTIONS),
+                funding_goal=goal,
+                current_funding=goal * Decimal(rng.randint(5, 90)) / 100,
+                interest_tags=random_tags(rng.randint(1, 3), rng),
+            )
+
+    def snapshot_rows(self, rng, count, founder_ids):
+        # Row j is week j // F of founder j % F, so (user, week_ending) never repeats.
+        last_week = date.today() - timedelta(days=date.today().weekday() + 1)
+        for j in range(count):
+            yield KPISnapshot(
+                user_id=founder_ids[j % len(founder_ids)],
+                week_ending=last_week - timedelta(weeks=j // len(founder_ids)),
+                revenue=Decimal(rng.randint(0, 500000)),
+                users=rng.randint(0, 5000),
+                expenses=Decimal(rng.randint(0, 300000)),
+                is_public=rng.random() > 0.5,
+            )
+
+    def message_rows(self, rng, count, people):
+        # Each user talks to a handful of nearby ids, giving realistic conversation sizes.
+        n = len(people)
+        hop = min(20, n - 1)
+        slots = ConversationSlots(people, hop)
+        pending = []
+        for ts in self.spread(count):
+            i = rng.randrange(n)
+            j = (i + rng.randint(1, hop)) % n
+            pending.append((i, j, ts))
+            if len(pending) == self.batch_size:
+                yield from self.resolve_messages(rng, pending, people, slots)
+                pending = []
+        yield from self.resolve_messages(rng, pending, people, slots)
+        slots.reset_sequence()
+
+    def resolve_messages(self, rng, pending, people, slots):
+        ids = slots.ensure({(i, j) for i, j, _ in pending})
+        for i, j, ts in pending:
+            yield Message(conversation_id=ids[i, j], sender_id=people[i], receiver_id=people[j],
+                          content=rng.choice(MESSAGE_SNIPPETS), timestamp=ts)
+
+    def notification_rows(self, rng, count, people):
+        for ts in self.spread(count):
+            kind, title = rng.choice(NOTIFICATION_KINDS)
+            yield Notification(
+                user_id=rng.choice(people),
+                notification_type=kind,
+                title=title,
+                message='Seeded notification.',
+                read=rng.random() < 0.7,
+                payload={},
+                created_at=ts,
+            )
+
+    def booking_rows(self, rng, count, founder_ids, expert_ids):
+        statuses = [code for code, _ in Booking.STATUS_CHOICES]
+        for ts in self.spread(count):
+            free = rng.random() < 0.4
+            yield Booking(
+                expert_id=rng.choice(expert_ids),
+                client_id=rng.choice(founder_ids),
+                is_free_intro=free,
+                amount=Decimal(0) if free else Decimal(rng.randint(2500, 15000)) / 100,
+                status=rng.choice(statuses),
+                created_at=ts,
+            )
+
+    def points_rows(self, rng, count, people):
+        for ts in self.spread(count):
+            yield Points(user_id=rng.choice(people), points=rng.randint(1, 50), reason=rng.choice(POINT_REASONS), created_at=ts)
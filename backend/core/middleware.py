@@ -1,17 +1,26 @@
-"""JWT auth middleware for WebSocket connections."""
+"""JWT auth middleware for WebSocket connections and SQL instrumentation for API requests."""
+import hashlib
+import logging
+import re
+import time
+from collections import Counter
 from urllib.parse import parse_qs
 from channels.db import database_sync_to_async
-from django.contrib.auth import get_user_model
-from rest_framework_simplejwt.tokens import UntypedToken
-from rest_framework_simplejwt.exceptions import InvalidToken
-from jwt import decode as jwt_decode
+from rest_framework_simplejwt.settings import api_settings
 from django.conf import settings
+from django.db import connection
+from users.authentication import user_cache, validate_token
 
-User = get_user_model()
+logger = logging.getLogger(__name__)
 
 
 class JwtAuthMiddleware:
-    """Resolve user from JWT token in query string (token=xxx)."""
+    """Resolve user from JWT token in query string (token=xxx).
+
+    The token is verified once, in the event loop; the user comes from
+    ``users.authentication.user_cache`` and only a cache miss hops to a
+    thread for the database read.
+    """
 
     def __init__(self, app):
         self.app = app
@@ -23,17 +32,81 @@ class JwtAuthMiddleware:
         scope["user"] = await self.get_user(token)
         return await self.app(scope, receive, send)
 
-    @database_sync_to_async
-    def get_user(self, token):
+    async def get_user(self, token):
         if not token:
             return None
-        try:
-            UntypedToken(token)
-        except InvalidToken:
+        validated = validate_token(token)
+        if validated is None:
             return None
-        try:
-            payload = jwt_decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-            user = User.objects.get(id=payload["user_id"])
-            return user
-        except (User.DoesNotExist, KeyError):
+        user_id = validated.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
             return None
+        user = user_cache.get(user_id)
+        if user is None:
+            user = await database_sync_to_async(user_cache.fetch)(user_id)
+        if user is None or not user.is_active:
+            return None
+        return user
+
+
+_IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def sql_fingerprint(sql):
+    """Stable short id for a statement shape (parameters and IN-list length ignored)."""
+    normalized = _IN_LIST_RE.sub('IN (...)', _WHITESPACE_RE.sub(' ', sql.strip()))
+    return hashlib.sha1(normalized.encode()).hexdigest()[:10]
+
+
+class QueryStats:
+    """``connection.execute_wrapper`` that records count, time and repeated statements."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints = Counter()
+        self.samples = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+            fingerprint = sql_fingerprint(sql)
+            self.fingerprints[fingerprint] += 1
+            self.samples.setdefault(fingerprint, sql)
+
+    @property
+    def duplicates(self):
+        return {fp: n for fp, n in self.fingerprints.most_common() if n > 1}
+
+
+class QueryStatsMiddleware:
+    """Expose per-request SQL statistics for ``/api/`` requests as debug headers.
+
+    ``X-Query-Count``, ``X-Query-Time-Ms`` and ``X-Query-Duplicates`` (``fingerprint*count``
+    for statements run more than once, the usual N+1 signature). Enabled by the
+    ``QUERY_STATS_HEADERS`` setting, which defaults to ``DEBUG``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'QUERY_STATS_HEADERS', settings.DEBUG) or not request.path.startswith('/api/'):
+            return self.get_response(request)
+        stats = QueryStats()
+        with connection.execute_wrapper(stats):
+            response = self.get_response(request)
+        duplicates = stats.duplicates
+        response['X-Query-Count'] = str(stats.count)
+        response['X-Query-Time-Ms'] = f'{stats.seconds * 1000:.2f}'
+        response['X-Query-Duplicates'] = ','.join(f'{fp}*{n}' for fp, n in list(duplicates.items())[:5])
+        if duplicates:
+            worst = next(iter(duplicates))
+            logger.debug('%s %s repeated a statement %d times: %s', request.method, request.path,
+                         duplicates[worst], stats.samples[worst])
+        return response
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:06
+
+from django.db import migrations, models
+
+
+def backfill_tag_index(apps, schema_editor):
+    InterestTagIndex = apps.get_model('core', 'InterestTagIndex')
+    Syndicate = apps.get_model('core', 'Syndicate')
+    CustomUser = apps.get_model('users', 'CustomUser')
+    rows = []
+    for kind, model in (('USER', CustomUser), ('SYNDICATE', Syndicate)):
+        for object_id, tags in model.objects.values_list('id', 'interest_tags').iterator():
+            if not isinstance(tags, list):
+                continue
+            for tag in {t[:100] for t in tags if isinstance(t, str) and t}:
+                rows.append(InterestTagIndex(kind=kind, tag=tag, object_id=object_id))
+    InterestTagIndex.objects.bulk_create(rows, batch_size=2000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_redeemoffer_redemption'),
+        ('users', '0004_customuser_interest_tags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InterestTagIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('USER', 'User'), ('SYNDICATE', 'Syndicate')], max_length=20)),
+                ('tag', models.CharField(max_length=100)),
+                ('object_id', models.BigIntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'object_id'], name='tag_index_kind_object_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'tag', 'object_id'), name='uniq_interest_tag_index')],
+            },
+        ),
+        migrations.RunPython(backfill_tag_index, migrations.RunPython.noop),
+    ]
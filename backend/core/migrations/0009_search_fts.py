@@ -0,0 +1,97 @@
+# FTS5 search indexes for discovery ``?search=`` (SQLite only).
+
+from django.db import migrations
+
+FORWARD_SQL = [
+    # Syndicates: title, description and the founder's username.
+    "CREATE VIRTUAL TABLE IF NOT EXISTS core_syndicate_fts USING fts5(title, description, founder, prefix='2 3')",
+    """CREATE TRIGGER IF NOT EXISTS core_syndicate_fts_ai AFTER INSERT ON core_syndicate BEGIN
+        INSERT INTO core_syndicate_fts(rowid, title, description, founder)
+        VALUES (new.id, new.title, new.description, (SELECT username FROM users_customuser WHERE id = new.founder_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS core_syndicate_fts_au AFTER UPDATE OF title, description, founder_id ON core_syndicate BEGIN
+        DELETE FROM core_syndicate_fts WHERE rowid = old.id;
+        INSERT INTO core_syndicate_fts(rowid, title, description, founder)
+        VALUES (new.id, new.title, new.description, (SELECT username FROM users_customuser WHERE id = new.founder_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS core_syndicate_fts_ad AFTER DELETE ON core_syndicate BEGIN
+        DELETE FROM core_syndicate_fts WHERE rowid = old.id;
+    END""",
+    # Expert profiles: username, specialization, bio and the user's interest tags.
+    "CREATE VIRTUAL TABLE IF NOT EXISTS core_expertprofile_fts USING fts5(username, specialization, bio, tags, prefix='2 3')",
+    """CREATE TRIGGER IF NOT EXISTS core_expertprofile_fts_ai AFTER INSERT ON core_expertprofile BEGIN
+        INSERT INTO core_expertprofile_fts(rowid, username, specialization, bio, tags)
+        SELECT new.id, username, new.specialization, new.bio, interest_tags FROM users_customuser WHERE id = new.user_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS core_expertprofile_fts_au AFTER UPDATE OF specialization, bio, user_id ON core_expertprofile BEGIN
+        DELETE FROM core_expertprofile_fts WHERE rowid = old.id;
+        INSERT INTO core_expertprofile_fts(rowid, username, specialization, bio, tags)
+        SELECT new.id, username, new.specialization, new.bio, interest_tags FROM users_customuser WHERE id = new.user_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS core_expertprofile_fts_ad AFTER DELETE ON core_expertprofile BEGIN
+        DELETE FROM core_expertprofile_fts WHERE rowid = old.id;
+    END""",
+    # Users (Jodi discovery): username and bio. Updates also refresh the
+    # denormalized username/tags held by the two indexes above.
+    "CREATE VIRTUAL TABLE IF NOT EXISTS core_user_fts USING fts5(username, bio, prefix='2 3')",
+    """CREATE TRIGGER IF NOT EXISTS core_user_fts_ai AFTER INSERT ON users_customuser BEGIN
+        INSERT INTO core_user_fts(rowid, username, bio) VALUES (new.id, new.username, new.bio);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS core_user_fts_au AFTER UPDATE OF username, bio, interest_tags ON users_customuser
+    WHEN old.username IS NOT new.username OR old.bio IS NOT new.bio OR old.interest_tags IS NOT new.interest_tags BEGIN
+        DELETE FROM core_user_fts WHERE rowid = old.id;
+        INSERT INTO core_user_fts(rowid, username, bio) VALUES (new.id, new.username, new.bio);
+        DELETE FROM core_expertprofile_fts WHERE rowid IN (SELECT id FROM core_expertprofile WHERE user_id = new.id);
+        INSERT INTO core_expertprofile_fts(rowid, username, specialization, bio, tags)
+        SELECT id, new.username, specialization, bio, new.interest_tags FROM core_expertprofile WHERE user_id = new.id;
+        DELETE FROM core_syndicate_fts WHERE rowid IN (SELECT id FROM core_syndicate WHERE founder_id = new.id);
+        INSERT INTO core_syndicate_fts(rowid, title, description, founder)
+        SELECT id, title, description, new.username FROM core_syndicate WHERE founder_id = new.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS core_user_fts_ad AFTER DELETE ON users_customuser BEGIN
+        DELETE FROM core_user_fts WHERE rowid = old.id;
+    END""",
+    # Backfill existing rows.
+    """INSERT INTO core_syndicate_fts(rowid, title, description, founder)
+    SELECT s.id, s.title, s.description, u.username FROM core_syndicate s JOIN users_customuser u ON u.id = s.founder_id""",
+    """INSERT INTO core_expertprofile_fts(rowid, username, specialization, bio, tags)
+    SELECT e.id, u.username, e.specialization, e.bio, u.interest_tags FROM core_expertprofile e JOIN users_customuser u ON u.id = e.user_id""",
+    "INSERT INTO core_user_fts(rowid, username, bio) SELECT id, username, bio FROM users_customuser",
+]
+
+REVERSE_SQL = [
+    "DROP TRIGGER IF EXISTS core_syndicate_fts_ai",
+    "DROP TRIGGER IF EXISTS core_syndicate_fts_au",
+    "DROP TRIGGER IF EXISTS core_syndicate_fts_ad",
+    "DROP TRIGGER IF EXISTS core_expertprofile_fts_ai",
+    "DROP TRIGGER IF EXISTS core_expertprofile_fts_au",
+    "DROP TRIGGER IF EXISTS core_expertprofile_fts_ad",
+    "DROP TRIGGER IF EXISTS core_user_fts_ai",
+    "DROP TRIGGER IF EXISTS core_user_fts_au",
+    "DROP TRIGGER IF EXISTS core_user_fts_ad",
+    "DROP TABLE IF EXISTS core_syndicate_fts",
+    "DROP TABLE IF EXISTS core_expertprofile_fts",
+    "DROP TABLE IF EXISTS core_user_fts",
+]
+
+
+def run_sqlite(statements):
+    def run(apps, schema_editor):
+        # Other backends keep using the icontains fallback in core.search.
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_interesttagindex'),
+        ('users', '0004_customuser_interest_tags'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sqlite(FORWARD_SQL), run_sqlite(REVERSE_SQL)),
+    ]
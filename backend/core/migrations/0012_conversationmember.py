@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_members(apps, schema_editor):
+    """Members for existing conversations; earlier history counts as read (there was no read state)."""
+    Conversation = apps.get_model('core', 'Conversation')
+    ConversationMember = apps.get_model('core', 'ConversationMember')
+    Message = apps.get_model('core', 'Message')
+    last_ids = dict(
+        Message.objects.order_by().values_list('conversation_id').annotate(last=models.Max('id'))
+    )
+    rows = []
+    for conversation_id, low, high in Conversation.objects.values_list('id', 'user_low_id', 'user_high_id').iterator():
+        last = last_ids.get(conversation_id)
+        for user_id, partner_id in {(low, high), (high, low)}:
+            rows.append(ConversationMember(
+                conversation_id=conversation_id, user_id=user_id, partner_id=partner_id,
+                last_message_id=last, last_read_message_id=last or 0,
+            ))
+    ConversationMember.objects.bulk_create(rows, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_conversation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationMember',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_message_id', models.BigIntegerField(default=0)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='members', to='core.conversation')),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.message')),
+                ('partner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='conversation_memberships', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-last_message'], name='conversation_member_inbox_idx')],
+                'constraints': [models.UniqueConstraint(fields=('conversation', 'user'), name='uniq_conversation_member')],
+            },
+        ),
+        migrations.RunPython(backfill_members, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_states(apps, schema_editor):
+    """Counters for users with unread notifications; a missing row means none unread."""
+    Notification = apps.get_model('core', 'Notification')
+    NotificationState = apps.get_model('core', 'NotificationState')
+    counts = (
+        Notification.objects.filter(read=False).order_by()
+        .values_list('user_id').annotate(n=models.Count('id'))
+    )
+    NotificationState.objects.bulk_create(
+        [NotificationState(user_id=user_id, unread_count=n) for user_id, n in counts], batch_size=2000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_notification_coalescing'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationState',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_state', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_states, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_balances(apps, schema_editor):
+    """One row per user: karma_score plus points earned, and points spent on redemptions."""
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Points = apps.get_model('core', 'Points')
+    Redemption = apps.get_model('core', 'Redemption')
+    KarmaBalance = apps.get_model('core', 'KarmaBalance')
+    earned = dict(Points.objects.order_by().values_list('user_id').annotate(s=models.Sum('points')))
+    spent = dict(Redemption.objects.order_by().values_list('user_id').annotate(s=models.Sum('points_spent')))
+    KarmaBalance.objects.bulk_create(
+        [KarmaBalance(user_id=user_id, earned=karma + earned.get(user_id, 0), spent=spent.get(user_id, 0))
+         for user_id, karma in User.objects.values_list('id', 'karma_score').iterator(chunk_size=2000)],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_history_indexes'),
+        ('users', '0005_customuser_email_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KarmaBalance',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='karma_balance', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('earned', models.BigIntegerField(default=0)),
+                ('spent', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
@@ -1,15 +1,91 @@
 
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 from django.conf import settings
+from django.utils import timezone
+
+class ConversationManager(models.Manager):
+    def between(self, user_a_id, user_b_id):
+        """The conversation for a pair of user ids, created on first use."""
+        low, high = sorted((user_a_id, user_b_id))
+        conversation, created = self.get_or_create(user_low_id=low, user_high_id=high)
+        if created:
+            ConversationMember.objects.bulk_create(ConversationMember.pair(conversation.id, low, high), ignore_conflicts=True)
+        return conversation
+
+
+class Conversation(models.Model):
+    """Direct-message thread between two users, keyed by the ordered pair (user_low.id <= user_high.id)."""
+    user_low = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    user_high = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ConversationManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='uniq_conversation_pair'),
+            models.CheckConstraint(condition=models.Q(user_low__lte=models.F('user_high')), name='conversation_pair_ordered'),
+        ]
+
+    def __str__(self):
+        return f"Conversation {self.user_low_id} & {self.user_high_id}"
+
+
+class ConversationMember(models.Model):
+    """One participant's side of a conversation, denormalized for the inbox.
+
+    ``last_message`` follows every new message (see ``core.conversations``);
+    ``last_read_message_id`` is the participant's read cursor and
+    ``unread_count`` counts the partner's messages after it.
+    """
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='members')
+    # Indexed together with last_message below, which is the inbox order.
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='conversation_memberships', db_index=False)
+    partner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    last_message = models.ForeignKey('Message', null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    last_read_message_id = models.BigIntegerField(default=0)
+    unread_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'user'], name='uniq_conversation_member'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-last_message'], name='conversation_member_inbox_idx'),
+        ]
+
+    @classmethod
+    def pair(cls, conversation_id, user_low_id, user_high_id):
+        """Unsaved member rows for both sides (one row for a conversation with oneself)."""
+        members = [cls(conversation_id=conversation_id, user_id=user_low_id, partner_id=user_high_id)]
+        if user_high_id != user_low_id:
+            members.append(cls(conversation_id=conversation_id, user_id=user_high_id, partner_id=user_low_id))
+        return members
+
+    def __str__(self):
+        return f"{self.user_id} in conversation {self.conversation_id}"
+
 
 class Message(models.Model):
+    # Indexed together with id below; that index also serves conversation lookups.
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages', db_index=False)
     sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='sent_messages')
     receiver = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='received_messages')
     content = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # A default rather than auto_now_add so write-behind batches keep the send time.
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['conversation', 'id'], name='message_conversation_id_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.conversation_id is None:
+            self.conversation = Conversation.objects.between(self.sender_id, self.receiver_id)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.sender.username} to {self.receiver.username}: {self.content[:20]}"
@@ -123,14 +199,88 @@ class Notification(models.Model):
     # Optional payload for linking to relevant objects (e.g. chat partner id, trial id)
     payload = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Rolling notifications (see core.notifications.coalesce): while unread, one row per
+    # (user, group_key) absorbs repeats, counting them and moving updated_at forward.
+    group_key = models.CharField(max_length=64, null=True, blank=True)
+    count = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-updated_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'group_key'],
+                condition=models.Q(read=False, group_key__isnull=False),
+                name='uniq_unread_notification_group',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-updated_at'], name='notification_user_recent_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username}: {self.title} ({self.notification_type})"
 
 
+class NotificationState(models.Model):
+    """Per-user notification summary, so the unread badge is a primary-key lookup.
+
+    ``unread_count`` is adjusted with atomic ``F()`` updates by
+    ``core.notifications`` whenever a notification is created or read, and
+    recomputed by the ``reconcile_notifications`` command. ``version`` goes up
+    on every change to the user's notifications and is the feed's ETag.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True,
+                                related_name='notification_state')
+    unread_count = models.PositiveIntegerField(default=0)
+    version = models.BigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.unread_count} unread"
+
+
+class ArchivedNotification(models.Model):
+    """Read notification moved out of ``Notification`` by ``archive_notifications``.
+
+    Keeps what's needed to show or audit it later; the id is the original one.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    notification_type = models.CharField(max_length=30)
+    title = models.CharField(max_length=255)
+    payload = models.JSONField(default=dict, blank=True)
+    count = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.title} (archived)"
+
+
+class OutboxEvent(models.Model):
+    """Side effect of a write, stored in the same transaction and applied later by ``outbox_worker``.
+
+    ``kind`` picks the handler in ``core.outbox``; ``payload`` is its input.
+    A failed event is retried from ``available_at`` with backoff until
+    ``OUTBOX_MAX_ATTEMPTS``, then left in place with its ``last_error``.
+    """
+    kind = models.CharField(max_length=30)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['available_at', 'id'], name='outbox_ready_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.attempts} attempts)"
+
+
 class Booking(models.Model):
     """Session booking with expert. First session is free (intro) with contact details; paid sessions follow."""
     STATUS_CHOICES = (('REQUESTED', 'Requested'), ('CONFIRMED', 'Confirmed'), ('COMPLETED', 'Completed'), ('CANCELLED', 'Cancelled'))
@@ -155,13 +305,17 @@ class Points(models.Model):
     This keeps the domain small so contributors can add records and
     connect them to users (for leaderboards, rewards, etc.).
     """
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='points')
+    # Indexed together with created_at below, which is the history order.
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='points', db_index=False)
     points = models.IntegerField(default=0)
     reason = models.CharField(max_length=255, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='points_user_recent_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username}: {self.points} ({self.reason})"
@@ -176,6 +330,9 @@ class RedeemOffer(models.Model):
     is_active = models.BooleanField(default=True)
     interest_tags = models.JSONField(default=list, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Optional limits (None = unlimited): redemptions left, and redemptions allowed per user.
+    stock = models.PositiveIntegerField(null=True, blank=True)
+    per_user_limit = models.PositiveIntegerField(null=True, blank=True)
 
     class Meta:
         ordering = ['-created_at']
@@ -186,13 +343,116 @@ class RedeemOffer(models.Model):
 
 class Redemption(models.Model):
     """Record of a user redeeming karma points for an offer."""
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='redemptions')
+    # Indexed together with redeemed_at below, which is the history order.
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='redemptions', db_index=False)
     offer = models.ForeignKey(RedeemOffer, on_delete=models.CASCADE, related_name='redemptions')
     points_spent = models.IntegerField()
     redeemed_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['-redeemed_at']
+        indexes = [
+            models.Index(fields=['user', '-redeemed_at'], name='redemption_user_recent_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} redeemed {self.offer.company_name}"
+
+
+class OfferClaim(models.Model):
+    """How many times a user has redeemed an offer, for ``RedeemOffer.per_user_limit``.
+
+    Only kept for offers with a limit; ``core.karma`` bumps it with a
+    conditional upsert, so concurrent redemptions can't pass the limit.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    offer = models.ForeignKey(RedeemOffer, on_delete=models.CASCADE, related_name='claims')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'offer'], name='uniq_offer_claim'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} x{self.count} {self.offer_id}"
+
+
+class IdempotencyKey(models.Model):
+    """Response to a POST sent with an ``Idempotency-Key`` header, replayed for retries (``core.idempotency``)."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    # Method, path and body hash of the original request; reusing a key for another request is an error.
+    fingerprint = models.CharField(max_length=255)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    body = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='uniq_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.key} ({self.status_code})"
+
+
+class KarmaBalance(models.Model):
+    """Per-user karma totals, so the balance is a primary-key lookup.
+
+    ``earned`` is ``karma_score`` plus the user's ``Points``; ``spent`` is the
+    sum of their ``Redemption`` rows. ``core.karma`` keeps both in step with
+    atomic ``F()`` updates and debits with a conditional UPDATE, and the
+    ``reconcile_karma`` command recomputes them from the ledger. A user without
+    a row gets one computed from the ledger when first read.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True,
+                                related_name='karma_balance')
+    earned = models.BigIntegerField(default=0)
+    spent = models.BigIntegerField(default=0)
+
+    @property
+    def balance(self):
+        return self.earned - self.spent
+
+    def __str__(self):
+        return f"{self.user_id}: {self.balance} karma"
+
+
+class InterestTagIndex(models.Model):
+    """Inverted index of interest tags, one row per (tag, tagged object).
+
+    Rows are kept in sync with the ``interest_tags`` JSON lists by
+    ``core.signals`` so tag filters can be answered with an indexed subquery.
+    """
+    KIND_CHOICES = (
+        ('USER', 'User'),
+        ('SYNDICATE', 'Syndicate'),
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    tag = models.CharField(max_length=100)
+    object_id = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'tag', 'object_id'], name='uniq_interest_tag_index'),
+        ]
+        indexes = [
+            models.Index(fields=['kind', 'object_id'], name='tag_index_kind_object_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}:{self.object_id} #{self.tag}"
+
+
+class PlatformStat(models.Model):
+    """One named counter in the platform statistics rollup behind ``GlobalStatsView``.
+
+    Counters are bumped with atomic ``F()`` updates from ``core.signals`` and
+    recomputed from the source tables by ``core.stats.rebuild``.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key}={self.value}"
@@ -2,17 +2,35 @@ from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from . import notifications
 from .models import Notification
 from .serializers import NotificationSerializer
 
 
 class NotificationListView(APIView):
-    """List current user's notifications."""
+    """Current user's latest notifications and unread count.
+
+    The ETag is the user's ``NotificationState.version``, which changes with
+    every notification create or read, so ``If-None-Match`` is answered with
+    a 304 after a single primary-key lookup.
+    """
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        qs = Notification.objects.filter(user=request.user).order_by('-created_at')[:50]
-        return Response(NotificationSerializer(qs, many=True).data)
+        unread, version = notifications.state(request.user.id)
+        etag = quote_etag(f'{request.user.id}.{version}')
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            patch_cache_control(not_modified, private=True, no_cache=True)
+            return not_modified
+        qs = Notification.objects.filter(user=request.user).order_by('-updated_at')[:50]
+        response = Response({'unread_count': unread, 'results': NotificationSerializer(qs, many=True).data})
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
 
 
 class NotificationMarkReadView(APIView):
@@ -24,8 +42,9 @@ class NotificationMarkReadView(APIView):
             n = Notification.objects.get(id=notification_id, user=request.user)
         except Notification.DoesNotExist:
             return Response({'error': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
-        n.read = True
-        n.save()
+        if not n.read:
+            notifications.mark_read(request.user.id, Notification.objects.filter(id=n.id))
+            n.read = True
         return Response(NotificationSerializer(n).data)
 
 
@@ -34,14 +53,13 @@ class NotificationMarkAllReadView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        Notification.objects.filter(user=request.user).update(read=True)
+        notifications.mark_read(request.user.id)
         return Response({'ok': True})
 
 
 class UnreadNotificationCountView(APIView):
-    """Get unread notification count."""
+    """Get unread notification count (from the user's NotificationState row)."""
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        count = Notification.objects.filter(user=request.user, read=False).count()
-        return Response({'count': count})
+        return Response({'count': notifications.unread_count(request.user.id)})
@@ -0,0 +1,236 @@
+"""Creating notifications and pushing them to the user's ``ws/stream/`` sockets.
+
+``notify`` writes one row per event. ``coalesce`` is for chatty sources such
+as chat messages: while a user has an unread notification with a given
+``group_key`` it is updated in place (``count`` incremented, ``updated_at`` moved forward)
+instead of adding a row. Each event is a single ``INSERT ... ON CONFLICT DO
+UPDATE`` against the partial unique index ``uniq_unread_notification_group``,
+so notification rows grow with conversations, not messages. Once read, the
+next event starts a new row.
+
+Every new or updated notification is pushed to the ``user_<id>`` group with
+the user's unread count, so clients only poll to resync. That count is
+``NotificationState.unread_count``, kept in step by ``record_change`` on
+every create and read along with the ``version`` the feed's ETag is built
+from; ``reconcile`` recomputes the counts from the table.
+"""
+from collections import Counter
+from functools import lru_cache
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.sql import Query
+from django.utils import timezone
+
+from .models import ArchivedNotification, Notification, NotificationState
+from .serializers import NotificationSerializer
+from .streams import user_group
+
+UPSERT_COLUMNS = ('user', 'notification_type', 'title', 'message', 'read', 'payload',
+                  'created_at', 'updated_at', 'group_key', 'count')
+ARCHIVE_FIELDS = ('id', 'user_id', 'notification_type', 'title', 'payload', 'count', 'created_at', 'updated_at')
+
+
+def unread_count(user_id):
+    return state(user_id)[0]
+
+
+def state(user_id):
+    """``(unread_count, version)`` for the user; ``(0, 0)`` before their first notification."""
+    return NotificationState.objects.filter(user_id=user_id).values_list('unread_count', 'version').first() or (0, 0)
+
+
+def record_change(user_id, unread_delta=0):
+    """Note a change to the user's notifications: bump ``version`` and add ``unread_delta``.
+
+    One atomic UPDATE. A user without a counter row yet gets one counted from
+    the notifications table, which already reflects the change being recorded.
+    """
+    updated = NotificationState.objects.filter(user_id=user_id).update(
+        version=F('version') + 1,
+        unread_count=Greatest(F('unread_count') + unread_delta, 0) if unread_delta else F('unread_count'),
+    )
+    if updated:
+        return
+    # The row appeared meanwhile if this conflicts; then apply the change to it.
+    qn = connection.ops.quote_name
+    state, notification = qn(NotificationState._meta.db_table), qn(Notification._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {state} ("user_id", "unread_count", "version") '
+            f'SELECT %s, COUNT(*), 1 FROM {notification} WHERE "user_id" = %s AND NOT "read" '
+            f'ON CONFLICT ("user_id") DO UPDATE SET "version" = {state}."version" + 1, "unread_count" = CASE '
+            f'WHEN {state}."unread_count" + %s < 0 THEN 0 ELSE {state}."unread_count" + %s END',
+            [user_id, user_id, unread_delta, unread_delta],
+        )
+
+
+def mark_read(user_id, notifications=None):
+    """Mark the user's unread notifications (all, or those in ``notifications``) read; returns how many."""
+    rows = (Notification.objects if notifications is None else notifications).filter(user_id=user_id, read=False)
+    with transaction.atomic(savepoint=False):
+        changed = rows.update(read=True)
+        if changed:
+            record_change(user_id, -changed)
+    return changed
+
+
+def reconcile():
+    """Recompute every unread counter from the notifications table; returns how many were wrong."""
+    unread = Coalesce(Subquery(
+        Notification.objects.filter(user_id=OuterRef('user_id'), read=False)
+        .order_by().values('user_id').annotate(n=Count('id')).values('n')
+    ), 0)
+    with transaction.atomic():
+        fixed = NotificationState.objects.exclude(unread_count=unread).update(unread_count=unread, version=F('version') + 1)
+        missing = (
+            Notification.objects.filter(read=False, user__notification_state__isnull=True)
+            .order_by().values_list('user_id').annotate(n=Count('id'))
+        )
+        created = NotificationState.objects.bulk_create(
+            [NotificationState(user_id=user_id, unread_count=n) for user_id, n in missing], batch_size=2000
+        )
+    return fixed + len(created)
+
+
+def archive_batch(cutoff, after_id=0, batch_size=1000, delete=False):
+    """Move one batch of read notifications last updated before ``cutoff`` to the archive.
+
+    Scans ids above ``after_id`` in order, so repeated calls walk the table
+    once. Only the insert and delete run in a transaction, keeping write locks
+    short. With ``delete`` the rows are dropped instead of archived. Returns
+    ``(rows moved, last id)``; the id is None when nothing is left.
+    """
+    rows = list(
+        Notification.objects.filter(id__gt=after_id, read=True, updated_at__lt=cutoff)
+        .order_by('id').values(*ARCHIVE_FIELDS)[:batch_size]
+    )
+    if not rows:
+        return 0, None
+    with transaction.atomic():
+        if not delete:
+            ArchivedNotification.objects.bulk_create([ArchivedNotification(**row) for row in rows])
+        Notification.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        # The rows leave the users' feeds, so their ETags must change.
+        NotificationState.objects.filter(user_id__in={row['user_id'] for row in rows}).update(version=F('version') + 1)
+    return len(rows), rows[-1]['id']
+
+
+def create(user_id, notification_type, title, message='', payload=None):
+    """Create a notification and count it as unread; the caller pushes it."""
+    with transaction.atomic(savepoint=False):
+        notification = Notification.objects.create(
+            user_id=user_id,
+            notification_type=notification_type,
+            title=title,
+            message=message,
+            payload=payload or {},
+        )
+        record_change(user_id, 1)
+    return notification
+
+
+def notify(user_id, notification_type, title, message='', payload=None):
+    """Create a notification and push it once the transaction commits.
+
+    Request handlers should go through ``core.outbox.enqueue('notify', ...)``
+    instead, so the work happens in ``outbox_worker``.
+    """
+    notification = create(user_id, notification_type, title, message, payload)
+    transaction.on_commit(lambda: push([notification]))
+    return notification
+
+
+def push_events(notifications):
+    """``(group, event)`` pairs announcing ``notifications``, each with its user's unread count."""
+    notifications = list(notifications)
+    unread = dict(
+        NotificationState.objects.filter(user_id__in={n.user_id for n in notifications})
+        .values_list('user_id', 'unread_count')
+    )
+    return [
+        (user_group(n.user_id), {
+            'type': 'notification',
+            'notification': dict(NotificationSerializer(n).data),
+            'unread_count': unread.get(n.user_id, 0),
+        })
+        for n in notifications
+    ]
+
+
+async def send(layer, pushes):
+    for group, event in pushes:
+        await layer.group_send(group, event)
+
+
+def push(notifications):
+    async_to_sync(send)(get_channel_layer(), push_events(notifications))
+
+
+def message_group(sender_id):
+    """Group key for chat notifications: one rolling notification per sender."""
+    return f'message:{sender_id}'
+
+
+@lru_cache(maxsize=None)
+def _upsert_sql(vendor):
+    # The ON CONFLICT target must repeat the partial index's predicate exactly,
+    # so compile it from the model's constraint rather than writing it by hand.
+    constraint = next(c for c in Notification._meta.constraints if c.name == 'uniq_unread_notification_group')
+    query = Query(model=Notification, alias_cols=False)
+    predicate, params = query.build_where(constraint.condition).as_sql(query.get_compiler(connection=connection), connection)
+    assert not params
+    qn = connection.ops.quote_name
+    table = qn(Notification._meta.db_table)
+    columns = [qn(Notification._meta.get_field(name).column) for name in UPSERT_COLUMNS]
+    count, updated_at, message, payload = qn('count'), qn('updated_at'), qn('message'), qn('payload')
+    return (
+        f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join(["%s"] * len(columns))}) '
+        f'ON CONFLICT ({qn("user_id")}, {qn("group_key")}) WHERE {predicate} DO UPDATE SET '
+        f'{count} = {table}.{count} + excluded.{count}, {updated_at} = excluded.{updated_at}, '
+        f'{message} = excluded.{message}, {payload} = excluded.{payload} '
+        f'RETURNING {qn("id")}, {count}'
+    )
+
+
+def coalesce(events):
+    """Upsert rolling notifications.
+
+    ``events`` are ``(user_id, group_key, notification_type, title, message, payload, count)``
+    tuples; each adds ``count`` to the user's unread notification for ``group_key``,
+    creating it if there is none. Returns the ids of the rows written. Call
+    inside a transaction: it also records the change in each user's
+    ``NotificationState``.
+    """
+    now = timezone.now()
+    fields = [Notification._meta.get_field(name) for name in UPSERT_COLUMNS]
+    ids = []
+    inserted = Counter()
+    with connection.cursor() as cursor:
+        for user_id, group_key, notification_type, title, message, payload, count in events:
+            values = (user_id, notification_type, title, message, False, payload or {}, now, now, group_key, count)
+            cursor.execute(_upsert_sql(connection.vendor),
+                           [field.get_db_prep_save(value, connection) for field, value in zip(fields, values)])
+            notification_id, total = cursor.fetchone()
+            ids.append(notification_id)
+            # An update adds to an existing count, so only a fresh row comes back with exactly ``count``.
+            inserted[user_id] += total == count
+    for user_id, new_rows in inserted.items():
+        record_change(user_id, new_rows)
+    return ids
+
+
+def message_events(pairs):
+    """Coalesce events for chat messages, given ``(sender_id, receiver_id)`` per message."""
+    counts = {}
+    for sender_id, receiver_id in pairs:
+        if sender_id != receiver_id:
+            counts[sender_id, receiver_id] = counts.get((sender_id, receiver_id), 0) + 1
+    return [
+        (receiver_id, message_group(sender_id), 'MESSAGE', 'New Message',
+         'You received a message (see chat).', {'sender_id': sender_id}, count)
+        for (sender_id, receiver_id), count in counts.items()
+    ]
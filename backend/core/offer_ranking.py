@@ -0,0 +1,181 @@
+"""Personalised ordering of redeem offers (``/redeem/offers/?for_me=1``).
+
+Offers are ranked by how many of the user's interest tags they share, then
+by whether the user's balance covers them, then by popularity (how often
+they have been redeemed), newest first on ties.
+
+The catalog of active offers still in stock is built once per process: a
+list of offer positions per tag, each offer's cost, and a ``Ranking`` of
+offers by redemption count. A request counts the overlap by walking the lists
+for the user's few tags, takes the best matches with a bounded heap and fills
+the rest of the page from the popularity ranking, so it never sorts the whole
+catalog.
+Redemptions move the counters from ``core.signals`` once they commit, and
+``karma.redeem`` drops an offer once its last unit is taken; saving or
+deleting an offer drops the catalog so the next request rebuilds it. It is
+also rebuilt in the background every ``OFFER_RANKING_REBUILD_SECONDS`` (see
+``core.refresh``), which picks up writes made by other processes.
+"""
+import heapq
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .leaderboard import Ranking
+from .models import RedeemOffer, Redemption
+from .refresh import ensure_fresh
+
+
+class OfferCatalog:
+    """In-process index of active offers used by ``RedeemOfferListView``."""
+    # Everything ``build`` replaces in one swap.
+    STATE = ('_ids', '_positions', '_costs', '_by_tag', '_popularity', '_read_through')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._generation = 0  # bumped by reset, so a build that read older offers is thrown away
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._generation += 1
+            self._built_at = None
+            self._changes = None  # redemptions seen while a build is reading, replayed onto it
+            self._ids = []  # position (0 = newest) -> offer id
+            self._positions = {}  # offer id -> position
+            self._costs = []
+            self._by_tag = {}  # tag -> positions, newest first
+            self._popularity = Ranking()  # members are positions
+            self._read_through = 0  # highest Redemption id the counts were read from
+
+    def build(self, attempts=2):
+        """Read the active offers into a fresh catalog, then swap it in.
+
+        The read runs outside the lock so ``rank`` keeps serving the current
+        catalog; redemptions and sell-outs that arrive meanwhile are recorded
+        and replayed onto the new one before the swap. A new ``Redemption``
+        the read already counted is skipped by id; one deleted during the
+        read can be counted twice until the next rebuild. If an offer is
+        saved or deleted during the read, the read is thrown away and made
+        again, up to ``attempts`` times.
+        """
+        for _ in range(attempts):
+            if self._build_once():
+                return
+
+    def _build_once(self):
+        with self._lock:
+            self._changes = []
+            generation = self._generation
+        offers = list(
+            RedeemOffer.objects.filter(is_active=True).exclude(stock=0).order_by('-created_at', '-id')
+            .values_list('id', 'points_required', 'interest_tags')
+        )
+        counts = {}
+        read_through = 0
+        for offer_id, count, last_id in (
+            Redemption.objects.filter(offer__is_active=True).order_by()
+            .values_list('offer_id').annotate(n=Count('id'), last_id=Max('id'))
+        ):
+            counts[offer_id] = count
+            read_through = max(read_through, last_id)
+        fresh = OfferCatalog()
+        fresh._read_through = read_through
+        fresh._ids = [offer_id for offer_id, _, _ in offers]
+        fresh._positions = {offer_id: position for position, offer_id in enumerate(fresh._ids)}
+        fresh._costs = [cost for _, cost, _ in offers]
+        by_tag = defaultdict(list)
+        for position, (_, _, tags) in enumerate(offers):
+            for tag in set(tags or ()):
+                by_tag[tag].append(position)
+        fresh._by_tag = dict(by_tag)
+        fresh._popularity = Ranking({position: counts.get(offer_id, 0) for position, offer_id in enumerate(fresh._ids)})
+        with self._lock:
+            if self._generation != generation:
+                # An offer was saved or deleted during the read.
+                return False
+            for name in self.STATE:
+                setattr(self, name, getattr(fresh, name))
+            changes, self._changes = self._changes or [], None
+            for method, args in changes:
+                getattr(self, method)(*args)
+            self._built_at = time.monotonic()
+        return True
+
+    def ensure_built(self):
+        ensure_fresh(self, getattr(settings, 'OFFER_RANKING_REBUILD_SECONDS', 300))
+
+    def _change(self, method, *args):
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append((method, args))
+            if self._built_at is not None:
+                getattr(self, method)(*args)
+
+    def add_redemptions(self, offer_id, delta, redemption_id=None):
+        """Apply a committed ``Redemption`` insert or delete (no-op for offers not in the catalog).
+
+        ``redemption_id`` is set for an insert, so a rebuild that already
+        counted it does not count it again.
+        """
+        self._change('_add_redemptions', offer_id, delta, redemption_id)
+
+    def _add_redemptions(self, offer_id, delta, redemption_id=None):
+        if redemption_id is not None and redemption_id <= self._read_through:
+            return
+        position = self._positions.get(offer_id)
+        if position is not None:
+            self._popularity.add(position, delta)
+
+    def remove(self, offer_id):
+        """Drop an offer whose stock ran out (``karma.take_stock`` updates in place, so no signal fires)."""
+        self._change('_remove', offer_id)
+
+    def _remove(self, offer_id):
+        position = self._positions.pop(offer_id, None)
+        if position is None:
+            return
+        self._popularity.remove(position)
+        for positions in self._by_tag.values():
+            if position in positions:
+                positions.remove(position)
+
+    def rank(self, tags, balance, limit=20):
+        """``(offer_id, tag overlap, affordable, redemptions)`` for the best ``limit`` offers.
+
+        None if there is no catalog to rank from: offers kept changing through
+        every attempt to read it.
+        """
+        self.ensure_built()
+        with self._lock:
+            if self._built_at is None:
+                return None
+            overlap = Counter(position for tag in set(tags or ()) for position in self._by_tag.get(tag, ()))
+            scores = self._popularity.scores
+
+            def row(position):
+                cost = self._costs[position]
+                return self._ids[position], overlap.get(position, 0), cost <= balance, scores[position]
+
+            matched = heapq.nsmallest(limit, overlap, key=lambda p: (-overlap[p], self._costs[p] > balance, -scores[p], p))
+            ranked = [row(position) for position in matched]
+            # Everything else in popularity order, the ones the balance covers first.
+            out_of_reach = []
+            for _, position in self._popularity.order:
+                if len(ranked) >= limit:
+                    break
+                if position in overlap:
+                    continue
+                if self._costs[position] <= balance:
+                    ranked.append(row(position))
+                elif len(out_of_reach) < limit:
+                    out_of_reach.append(position)
+            ranked += [row(position) for position in out_of_reach[:limit - len(ranked)]]
+        return ranked
+
+
+offer_catalog = OfferCatalog()
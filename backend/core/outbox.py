@@ -0,0 +1,157 @@
+"""Transactional outbox for the side effects of writes.
+
+Views and the chat writer call ``enqueue`` inside the transaction that saves
+the domain row (booking, trial proposal, chat message), so the event exists
+exactly when the row does and the request never waits for fan-out.
+``outbox_worker`` drains the table: each batch of ready events is applied in
+one transaction (creating or coalescing notifications) and deleted, then the
+resulting pushes go out over the channel layer while the next batch is
+claimed.
+
+An event whose handler raises is retried with exponential backoff, up to
+``OUTBOX_MAX_ATTEMPTS``; the rest of its batch still goes through. Batches
+are claimed with ``SELECT ... FOR UPDATE SKIP LOCKED`` where the database
+supports it, so several workers can run against PostgreSQL; on SQLite run
+one.
+"""
+import asyncio
+import logging
+from datetime import timedelta
+from itertools import groupby
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import notifications
+from .models import Notification, OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+MAX_BACKOFF_SECONDS = 3600
+
+
+def enqueue(kind, **payload):
+    """Record an event for the worker; call inside the transaction that writes its domain row."""
+    return OutboxEvent.objects.create(kind=kind, payload=payload)
+
+
+def handle_notify(payloads):
+    return [notifications.create(**payload).id for payload in payloads]
+
+
+def handle_chat_messages(payloads):
+    # Messages from every event in the batch fold into one upsert per (sender, receiver).
+    pairs = (pair for payload in payloads for pair in payload['pairs'])
+    return notifications.coalesce(notifications.message_events(pairs))
+
+
+# kind -> handler taking the payloads of a run of events and returning the notification ids written.
+HANDLERS = {
+    'notify': handle_notify,
+    'chat.messages': handle_chat_messages,
+}
+
+
+def apply(events):
+    ids = []
+    for kind, run in groupby(events, key=lambda event: event.kind):
+        ids += HANDLERS[kind]([event.payload for event in run])
+    return ids
+
+
+def backoff(attempts):
+    return timedelta(seconds=min(2 ** attempts, MAX_BACKOFF_SECONDS))
+
+
+def process(batch_size=None):
+    """Apply one batch of ready events.
+
+    Returns ``(events claimed, notification pushes)``; send the pushes after
+    this returns, once the batch is committed.
+    """
+    batch_size = batch_size or getattr(settings, 'OUTBOX_BATCH', 200)
+    max_attempts = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 8)
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True)
+            .filter(available_at__lte=now, attempts__lt=max_attempts)
+            .order_by('id')[:batch_size]
+        )
+        if not events:
+            return 0, []
+        try:
+            with transaction.atomic():
+                ids = apply(events)
+            done = events
+        except Exception:
+            # Isolate the failing events and let the rest through.
+            ids, done = [], []
+            for event in events:
+                try:
+                    with transaction.atomic():
+                        ids += apply([event])
+                    done.append(event)
+                except Exception as e:
+                    logger.exception('Outbox event %s (%s) failed on attempt %d', event.id, event.kind, event.attempts + 1)
+                    OutboxEvent.objects.filter(id=event.id).update(
+                        attempts=F('attempts') + 1,
+                        available_at=now + backoff(event.attempts),
+                        last_error=repr(e),
+                    )
+        OutboxEvent.objects.filter(id__in=[event.id for event in done]).delete()
+        pushes = notifications.push_events(Notification.objects.filter(id__in=ids)) if ids else []
+    return len(events), pushes
+
+
+async def send(layer, pushes, attempts=3):
+    """Send pushes, retrying a channel-layer failure; clients resync if one is lost."""
+    for attempt in range(attempts):
+        try:
+            await notifications.send(layer, pushes)
+            return
+        except Exception:
+            if attempt + 1 == attempts:
+                logger.exception('Dropping %d notification pushes after %d attempts', len(pushes), attempts)
+                return
+            await asyncio.sleep(0.1 * 2 ** attempt)
+
+
+async def run(batch_size=None, concurrency=4, poll=None, once=False):
+    """Drain the outbox until cancelled (or until it is empty with ``once``); returns events claimed.
+
+    Batches are applied one at a time; up to ``concurrency`` batches of pushes
+    are in flight alongside.
+    """
+    layer = get_channel_layer()
+    poll = poll if poll is not None else getattr(settings, 'OUTBOX_POLL_MS', 200) / 1000
+    sending = set()
+    claimed = 0
+    try:
+        while True:
+            count, pushes = await database_sync_to_async(process)(batch_size)
+            claimed += count
+            if pushes:
+                task = asyncio.create_task(send(layer, pushes))
+                sending.add(task)
+                task.add_done_callback(sending.discard)
+                if len(sending) >= concurrency:
+                    await asyncio.wait(sending, return_when=asyncio.FIRST_COMPLETED)
+            if not count:
+                if once:
+                    break
+                await asyncio.sleep(poll)
+    finally:
+        if sending:
+            await asyncio.gather(*sending)
+    return claimed
+
+
+def drain(batch_size=None):
+    """Process everything ready now from synchronous code (tests, seeding); returns events claimed."""
+    return async_to_sync(run)(batch_size, once=True)
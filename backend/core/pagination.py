@@ -0,0 +1,71 @@
+"""Keyset (cursor) pagination for list endpoints.
+
+Pages are selected with ``WHERE key > position ORDER BY key LIMIT n`` on a
+unique, indexed key, so every page costs the same regardless of depth and
+no ``COUNT(*)`` is ever issued. Cursors are DRF's opaque base64 tokens.
+"""
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+from rest_framework.response import Response
+
+
+class KeysetPagination(CursorPagination):
+    """Newest first on the primary key (ids follow ``created_at`` for auto_now_add rows)."""
+    ordering = '-id'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        # Full-text matches (core.search) page through in relevance order.
+        if 'search_rank' in queryset.query.annotations:
+            return ('search_rank', 'id')
+        return super().get_ordering(request, queryset, view)
+
+
+class WeekEndingPagination(KeysetPagination):
+    """Chronological KPI snapshots; ``week_ending`` is unique per user."""
+    ordering = 'week_ending'
+
+
+class InboxPagination(KeysetPagination):
+    """Conversations by most recent message; a user's last message ids are distinct."""
+    ordering = '-last_message_id'
+
+
+class RankedPagination(KeysetPagination):
+    """Keyset pagination over results ranked outside the database.
+
+    The cursor position is the ``(score, id)`` of the last row served and
+    ``rank(limit, after)`` must return up to ``limit`` ``(id, score)`` pairs,
+    best first, that sort strictly after ``after``.
+    """
+
+    def paginate_ranked(self, rank, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        after = None
+        if self.cursor is not None and self.cursor.position:
+            try:
+                score, object_id = self.cursor.position.split(':')
+                after = (float(score), int(object_id))
+            except ValueError:
+                raise NotFound(self.invalid_cursor_message)
+        ranked = rank(self.page_size + 1, after)
+        self.page = ranked[:self.page_size]
+        self.has_next = len(ranked) > self.page_size
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        object_id, score = self.page[-1]
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=f'{score!r}:{object_id}'))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
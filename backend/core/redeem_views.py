@@ -2,28 +2,28 @@ from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from django.db.models import Sum
+from django.contrib.auth import get_user_model
+from . import karma
+from .idempotency import idempotent
+from .leaderboard import WINDOWS, leaderboard
+from .offer_ranking import offer_catalog
 from .models import RedeemOffer, Redemption, Points
 from .serializers import RedeemOfferSerializer, RedemptionSerializer, PointsSerializer
 
+User = get_user_model()
+
 
 class KarmaBalanceView(APIView):
     """Get user's karma balance (total earned - total spent)."""
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-        # Points from the Points model (earned)
-        earned = Points.objects.filter(user=user).aggregate(total=Sum('points'))['total'] or 0
-        # Also include karma_score from user profile
-        earned += user.karma_score or 0
-        # Points spent on redemptions
-        spent = Redemption.objects.filter(user=user).aggregate(total=Sum('points_spent'))['total'] or 0
-        balance = earned - spent
+        # karma_score plus Points earned, and points spent on redemptions (core.karma)
+        earned, spent = karma.balance(request.user.id)
         return Response({
             'earned': earned,
             'spent': spent,
-            'balance': balance,
+            'balance': earned - spent,
         })
 
 
@@ -36,19 +36,74 @@ class PointsHistoryView(APIView):
         return Response(PointsSerializer(points, many=True).data)
 
 
+class LeaderboardView(APIView):
+    """Top users by points earned (all time, 30d or 7d; optionally one role and/or province) and the caller's rank."""
+    permission_classes = [IsAuthenticated]
+    MAX_LIMIT = 100
+
+    def get(self, request):
+        params = request.query_params
+        window = params.get('window', 'all')
+        role = params.get('role') or None
+        province = params.get('province') or None
+        if window not in WINDOWS:
+            return Response({'error': f"window must be one of {', '.join(WINDOWS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        if role is not None and role not in dict(User.ROLE_CHOICES):
+            return Response({'error': 'Unknown role'}, status=status.HTTP_400_BAD_REQUEST)
+        if province is not None and province not in dict(User.PROVINCE_CHOICES):
+            return Response({'error': 'Unknown province'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(params.get('limit', 20)), 1), self.MAX_LIMIT)
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        top, me = leaderboard.standings(window, role, province, limit, request.user.id)
+        usernames = dict(User.objects.filter(id__in=[user_id for _, user_id, _ in top]).values_list('id', 'username'))
+        return Response({
+            'window': window,
+            'results': [
+                {'rank': rank, 'user_id': user_id, 'username': usernames.get(user_id), 'score': score}
+                for rank, user_id, score in top
+            ],
+            'me': None if me is None else {'rank': me[0], 'score': me[1]},
+        })
+
+
 class RedeemOfferListView(APIView):
-    """List all active redeem offers."""
+    """List all active redeem offers, or with ``for_me=1`` the best ``limit`` for the caller (core.offer_ranking)."""
     permission_classes = [IsAuthenticated]
+    MAX_LIMIT = 100
 
     def get(self, request):
-        offers = RedeemOffer.objects.filter(is_active=True)
-        return Response(RedeemOfferSerializer(offers, many=True).data)
+        if request.query_params.get('for_me') not in ('1', 'true'):
+            offers = RedeemOffer.objects.filter(is_active=True)
+            return Response(RedeemOfferSerializer(offers, many=True).data)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), self.MAX_LIMIT)
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        earned, spent = karma.balance(request.user.id)
+        ranked = offer_catalog.rank(request.user.interest_tags, earned - spent, limit)
+        if ranked is None:
+            # No catalog yet (offers changed during every read); serve them unranked.
+            offers = RedeemOffer.objects.filter(is_active=True).exclude(stock=0)[:limit]
+            return Response(RedeemOfferSerializer(offers, many=True).data)
+        offers = RedeemOffer.objects.filter(is_active=True).in_bulk([offer_id for offer_id, *_ in ranked])
+        results = []
+        for offer_id, overlap, affordable, redemptions in ranked:
+            if offer_id in offers:
+                data = RedeemOfferSerializer(offers[offer_id]).data
+                data.update(tag_overlap=overlap, affordable=affordable, redemptions=redemptions)
+                results.append(data)
+        return Response(results)
 
 
 class RedeemOfferView(APIView):
     """Redeem an offer using karma points."""
     permission_classes = [IsAuthenticated]
 
+    @idempotent
     def post(self, request, offer_id):
         user = request.user
         try:
@@ -56,24 +111,21 @@ class RedeemOfferView(APIView):
         except RedeemOffer.DoesNotExist:
             return Response({'error': 'Offer not found or inactive'}, status=status.HTTP_404_NOT_FOUND)
 
-        # Calculate balance
-        earned = Points.objects.filter(user=user).aggregate(total=Sum('points'))['total'] or 0
-        earned += user.karma_score or 0
-        spent = Redemption.objects.filter(user=user).aggregate(total=Sum('points_spent'))['total'] or 0
-        balance = earned - spent
-
-        if balance < offer.points_required:
-            return Response({'error': f'Insufficient karma points. Need {offer.points_required}, have {balance}'}, status=status.HTTP_400_BAD_REQUEST)
-
-        redemption = Redemption.objects.create(
-            user=user,
-            offer=offer,
-            points_spent=offer.points_required,
-        )
+        # Claim, debit, take stock and record in one transaction (core.karma); nothing is written on refusal.
+        try:
+            redemption = karma.redeem(user.id, offer)
+        except karma.RedemptionRefused as refused:
+            if refused.reason == refused.INSUFFICIENT:
+                earned, spent = karma.balance(user.id)
+                return Response({'error': f'Insufficient karma points. Need {offer.points_required}, have {earned - spent}'}, status=status.HTTP_400_BAD_REQUEST)
+            if refused.reason == refused.SOLD_OUT:
+                return Response({'error': 'This offer is sold out'}, status=status.HTTP_409_CONFLICT)
+            return Response({'error': f'You can redeem this offer at most {offer.per_user_limit} times'}, status=status.HTTP_409_CONFLICT)
+        earned, spent = karma.balance(user.id)
         return Response({
             'message': f'Successfully redeemed {offer.discount_percent}% off at {offer.company_name}!',
             'redemption': RedemptionSerializer(redemption).data,
-            'new_balance': balance - offer.points_required,
+            'new_balance': earned - spent,
         }, status=status.HTTP_201_CREATED)
 
 
@@ -82,5 +134,5 @@ class RedemptionHistoryView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        redemptions = Redemption.objects.filter(user=request.user).order_by('-redeemed_at')[:50]
+        redemptions = Redemption.objects.filter(user=request.user).select_related('offer').order_by('-redeemed_at')[:50]
         return Response(RedemptionSerializer(redemptions, many=True).data)
@@ -0,0 +1,51 @@
+"""Single-flight rebuilds for the in-process indexes.
+
+``users.matching.match_index``, ``core.leaderboard.leaderboard`` and
+``core.offer_ranking.offer_catalog`` are built from the database once per
+process and rebuilt periodically. ``ensure_fresh`` makes the first build
+synchronous (there is nothing to serve before it) and runs every later
+rebuild in a background thread, so requests keep reading the current data
+instead of waiting on a multi-second table read. Only one build of an index
+runs at a time.
+
+An index passed here has ``_built_at`` (``time.monotonic()`` of its last
+build, None before the first), a ``_build_lock`` and a ``build()`` that reads
+outside the index's own lock and swaps the result in under it.
+"""
+import logging
+import threading
+import time
+
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+def stale(index, ttl):
+    return index._built_at is None or bool(ttl and time.monotonic() - index._built_at > ttl)
+
+
+def ensure_fresh(index, ttl):
+    """Build ``index`` on first use; once it is older than ``ttl`` seconds, start a background rebuild."""
+    if not stale(index, ttl):
+        return
+    if index._built_at is None:
+        with index._build_lock:
+            if index._built_at is None:
+                index.build()
+        return
+    if index._build_lock.acquire(blocking=False):
+        threading.Thread(target=rebuild, args=(index, ttl), daemon=True,
+                         name=f'rebuild-{type(index).__name__}').start()
+
+
+def rebuild(index, ttl):
+    # Runs with index._build_lock held by the thread that started it.
+    try:
+        if stale(index, ttl):
+            index.build()
+    except Exception:
+        logger.exception('Rebuilding %s failed; serving the previous build', type(index).__name__)
+    finally:
+        index._build_lock.release()
+        connections.close_all()
@@ -0,0 +1,74 @@
+"""Full-text search for discovery ``?search=`` parameters.
+
+On SQLite the FTS5 tables created by migration ``0009_search_fts`` (kept up
+to date by triggers) answer the search with prefix matching and BM25
+ranking in the same query as the other filters. Other backends, or a
+database that has not been migrated, fall back to ``icontains`` filters.
+"""
+import re
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import InterestTagIndex
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# name -> (fts table, bm25 column weights, icontains fallback fields)
+INDEXES = {
+    'syndicate': ('core_syndicate_fts', (5.0, 1.0, 2.0), ('title', 'description', 'founder__username')),
+    'expert': ('core_expertprofile_fts', (3.0, 5.0, 1.0, 2.0), ('user__username', 'specialization', 'bio')),
+    'user': ('core_user_fts', (3.0, 1.0), ('username', 'bio')),
+}
+
+# (alias, database name) -> FTS tables present there
+_available_tables = {}
+
+
+def fts_available(table, using='default'):
+    connection = connections[using]
+    if not getattr(settings, 'SEARCH_USE_FTS', True) or connection.vendor != 'sqlite':
+        return False
+    key = (using, connection.settings_dict['NAME'])
+    if key not in _available_tables:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE '%%_fts'")
+            _available_tables[key] = {row[0] for row in cursor.fetchall()}
+    return table in _available_tables[key]
+
+
+def match_expression(search):
+    """Turn free text into an FTS5 query: every word must match as a prefix."""
+    return ' '.join(f'"{token}"*' for token in _TOKEN_RE.findall(search))
+
+
+def search_queryset(queryset, index, search, extra_q=None):
+    """Filter ``queryset`` by ``search`` using the FTS index named ``index``.
+
+    Matches are ordered best-first by BM25 (exposed as ``search_rank``).
+    ``extra_q`` is OR-ed into the ``icontains`` fallback only.
+    """
+    table, weights, fallback_fields = INDEXES[index]
+    expression = match_expression(search)
+    if expression and fts_available(table, queryset.db):
+        base = queryset.model._meta.db_table
+        bm25 = f"bm25({table}, {', '.join(str(w) for w in weights)})"
+        # Annotated (not extra-selected) so keyset pagination can filter on it.
+        return queryset.extra(
+            tables=[table],
+            where=[f'{table}.rowid = {base}.id', f'{table} MATCH %s'],
+            params=[expression],
+        ).annotate(search_rank=RawSQL(bm25, [], output_field=FloatField())).order_by('search_rank', 'id')
+    q = reduce(or_, (Q(**{f'{field}__icontains': search}) for field in fallback_fields))
+    if extra_q is not None:
+        q |= extra_q
+    return queryset.filter(q)
+
+
+def tag_search_q(search, id_field='id'):
+    """Fallback clause: rows whose user carries a tag containing ``search``."""
+    return Q(**{f'{id_field}__in': InterestTagIndex.objects.filter(kind='USER', tag__icontains=search).values('object_id')})
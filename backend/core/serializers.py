@@ -18,8 +18,8 @@ class TrialProposalSerializer(serializers.ModelSerializer):
 class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
-        fields = ('id', 'notification_type', 'title', 'message', 'read', 'payload', 'created_at')
-        read_only_fields = ('id', 'created_at')
+        fields = ('id', 'notification_type', 'title', 'message', 'read', 'payload', 'count', 'created_at', 'updated_at')
+        read_only_fields = ('id', 'count', 'created_at', 'updated_at')
 
 
 class BookingSerializer(serializers.ModelSerializer):
@@ -67,7 +67,7 @@ class ExpertProfileSerializer(serializers.ModelSerializer):
 class RedeemOfferSerializer(serializers.ModelSerializer):
     class Meta:
         model = RedeemOffer
-        fields = ('id', 'company_name', 'description', 'discount_percent', 'points_required', 'interest_tags', 'is_active', 'created_at')
+        fields = ('id', 'company_name', 'description', 'discount_percent', 'points_required', 'interest_tags', 'is_active', 'stock', 'per_user_limit', 'created_at')
 
 
 class RedemptionSerializer(serializers.ModelSerializer):
@@ -0,0 +1,211 @@
+"""Model signal receivers that keep derived tables in sync."""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import conversations, karma, stats, tag_index
+from .leaderboard import leaderboard
+from .models import Booking, Investment, Message, Points, RedeemOffer, Redemption, Syndicate, TrialProposal
+from .offer_ranking import offer_catalog
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def index_user_tags(sender, instance, raw=False, update_fields=None, **kwargs):
+    if update_fields is not None and 'interest_tags' not in update_fields:
+        return
+    tag_index.sync_tags('USER', instance.pk, instance.interest_tags)
+
+
+@receiver(post_delete, sender=User)
+def unindex_user_tags(sender, instance, **kwargs):
+    tag_index.drop_tags('USER', instance.pk)
+
+
+@receiver(post_save, sender=Syndicate)
+def index_syndicate_tags(sender, instance, raw=False, update_fields=None, **kwargs):
+    if update_fields is not None and 'interest_tags' not in update_fields:
+        return
+    tag_index.sync_tags('SYNDICATE', instance.pk, instance.interest_tags)
+
+
+@receiver(post_delete, sender=Syndicate)
+def unindex_syndicate_tags(sender, instance, **kwargs):
+    tag_index.drop_tags('SYNDICATE', instance.pk)
+
+
+@receiver(post_save, sender=Message)
+def advance_conversation(sender, instance, created=False, **kwargs):
+    if created:
+        conversations.record_message(instance)
+
+
+# --- platform stats rollup (core.stats) ---------------------------------
+# ``post_init`` remembers the values a counter depends on so ``post_save`` can
+# move the count when they change. It reads ``__dict__`` so deferred fields are
+# never fetched just for this.
+
+@receiver(post_init, sender=User)
+def remember_user_stats(sender, instance, **kwargs):
+    instance._stats_state = (instance.__dict__.get('role'), instance.__dict__.get('province'))
+
+
+@receiver(post_save, sender=User)
+def count_user(sender, instance, created=False, update_fields=None, **kwargs):
+    role, province = instance.role, instance.province
+    if created:
+        stats.bump(['users', stats.role_key(role), stats.province_key(province, 'users')])
+    elif update_fields is None or {'role', 'province'} & set(update_fields):
+        old_role, old_province = instance._stats_state
+        if old_role is not None and old_role != role:
+            stats.bump([stats.role_key(old_role)], -1)
+            stats.bump([stats.role_key(role)])
+        if old_province is not None and old_province != province:
+            stats.bump([stats.province_key(old_province, 'users')], -1)
+            stats.bump([stats.province_key(province, 'users')])
+    instance._stats_state = (role, province)
+
+
+@receiver(post_delete, sender=User)
+def uncount_user(sender, instance, **kwargs):
+    stats.bump(['users', stats.role_key(instance.role), stats.province_key(instance.province, 'users')], -1)
+
+
+@receiver(post_init, sender=Investment)
+def remember_investment_amount(sender, instance, **kwargs):
+    instance._stats_amount = instance.__dict__.get('amount')
+
+
+@receiver(post_save, sender=Investment)
+def count_investment(sender, instance, created=False, **kwargs):
+    previous = 0 if created else instance._stats_amount
+    if previous is not None:
+        stats.bump(['investment_paisa'], stats.to_paisa(instance.amount) - stats.to_paisa(previous))
+    instance._stats_amount = instance.amount
+
+
+@receiver(post_delete, sender=Investment)
+def uncount_investment(sender, instance, **kwargs):
+    stats.bump(['investment_paisa'], -stats.to_paisa(instance.amount))
+
+
+@receiver(post_save, sender=Booking)
+def count_booking(sender, instance, created=False, **kwargs):
+    if created:
+        stats.bump_province(instance.client_id, 'bookings')
+
+
+@receiver(post_save, sender=Message)
+def count_message(sender, instance, created=False, **kwargs):
+    if created:
+        stats.bump_province(instance.sender_id, 'messages')
+
+
+@receiver(post_init, sender=TrialProposal)
+def remember_proposal_status(sender, instance, **kwargs):
+    instance._stats_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=TrialProposal)
+def count_match(sender, instance, created=False, **kwargs):
+    was_match = not created and instance._stats_status == 'ACCEPTED'
+    is_match = instance.status == 'ACCEPTED'
+    if was_match != is_match:
+        stats.bump(['matches'], 1 if is_match else -1)
+    instance._stats_status = instance.status
+
+
+@receiver(post_delete, sender=TrialProposal)
+def uncount_match(sender, instance, **kwargs):
+    if instance.status == 'ACCEPTED':
+        stats.bump(['matches'], -1)
+
+
+# --- karma balances (core.karma) ----------------------------------------
+
+@receiver(post_init, sender=User)
+def remember_karma_score(sender, instance, **kwargs):
+    instance._karma_score = instance.__dict__.get('karma_score')
+
+
+@receiver(post_save, sender=User)
+def move_karma_score(sender, instance, created=False, update_fields=None, **kwargs):
+    # A new user has no balance row yet; it is computed when first read.
+    if not created and instance._karma_score is not None and (update_fields is None or 'karma_score' in update_fields):
+        karma.adjust(instance.pk, earned=instance.karma_score - instance._karma_score)
+    instance._karma_score = instance.karma_score
+
+
+@receiver(post_init, sender=Points)
+def remember_points(sender, instance, **kwargs):
+    instance._karma_points = instance.__dict__.get('points')
+
+
+@receiver(post_save, sender=Points)
+def credit_points(sender, instance, created=False, **kwargs):
+    previous = 0 if created else instance._karma_points
+    if previous is not None:
+        delta = instance.points - previous
+        karma.adjust(instance.user_id, earned=delta)
+        rank_points(instance.user_id, delta, instance.created_at, instance.pk if created else None)
+    instance._karma_points = instance.points
+
+
+@receiver(post_delete, sender=Points)
+def uncredit_points(sender, instance, **kwargs):
+    karma.adjust(instance.user_id, earned=-instance.points)
+    rank_points(instance.user_id, -instance.points, instance.created_at)
+
+
+@receiver(post_save, sender=Redemption)
+def debit_redemption(sender, instance, created=False, **kwargs):
+    # core.karma.redeem has already debited the balance for its own rows.
+    if created and not getattr(instance, '_karma_debited', False):
+        karma.adjust(instance.user_id, spent=instance.points_spent)
+
+
+@receiver(post_delete, sender=Redemption)
+def refund_redemption(sender, instance, **kwargs):
+    karma.adjust(instance.user_id, spent=-instance.points_spent)
+
+
+# --- leaderboards (core.leaderboard) ------------------------------------
+# The in-process rankings only take writes that commit.
+
+def rank_points(user_id, delta, created_at, points_id=None):
+    transaction.on_commit(lambda: leaderboard.add_points(user_id, delta, created_at, points_id))
+
+
+@receiver(post_save, sender=User)
+def rerank_user(sender, instance, **kwargs):
+    user_id, role, province = instance.pk, instance.role, instance.province
+    transaction.on_commit(lambda: leaderboard.move_user(user_id, role, province))
+
+
+@receiver(post_delete, sender=User)
+def unrank_user(sender, instance, **kwargs):
+    user_id = instance.pk
+    transaction.on_commit(lambda: leaderboard.remove_user(user_id))
+
+
+# --- offer ranking (core.offer_ranking) ---------------------------------
+
+@receiver(post_save, sender=Redemption)
+def count_redemption(sender, instance, created=False, **kwargs):
+    if created:
+        offer_id, redemption_id = instance.offer_id, instance.pk
+        transaction.on_commit(lambda: offer_catalog.add_redemptions(offer_id, 1, redemption_id))
+
+
+@receiver(post_delete, sender=Redemption)
+def uncount_redemption(sender, instance, **kwargs):
+    offer_id = instance.offer_id
+    transaction.on_commit(lambda: offer_catalog.add_redemptions(offer_id, -1))
+
+
+@receiver(post_save, sender=RedeemOffer)
+@receiver(post_delete, sender=RedeemOffer)
+def reload_offers(sender, instance, **kwargs):
+    transaction.on_commit(offer_catalog.reset)
@@ -0,0 +1,169 @@
+"""Platform statistics rollup (``PlatformStat``) served by ``GlobalStatsView``.
+
+Each statistic is a named counter row. ``core.signals`` bumps the affected
+counters with atomic ``F()`` updates as users, investments, bookings, messages
+and trial proposals are written, and ``rebuild()`` recomputes everything from
+the source tables (``manage.py refresh_stats``, run periodically and after bulk
+imports) to correct any drift. Reading the stats is a single query over a few
+dozen rows regardless of table sizes.
+
+``rebuild()`` counts without holding any lock and then applies only the
+correction, so bumps made while it counts are kept.
+
+Province activity is attributed to the acting user's current province: the
+user's own row, the client of a booking, the sender of a message.
+"""
+import threading
+from collections import defaultdict
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, Subquery, Sum, Value
+from django.db.models.functions import Concat
+
+from .models import Booking, Investment, Message, PlatformStat, TrialProposal
+
+User = get_user_model()
+
+# Lets one request build the empty table while the others wait for it.
+_snapshot_lock = threading.Lock()
+
+ROLES = [code for code, _ in User.ROLE_CHOICES]
+# Hotspot numbering used by the dashboard map: KOSHI=1 ... SUDURPASHCHIM=7.
+PROVINCE_NUMBERS = {
+    code: i + 1 for i, code in enumerate(code for code, _ in User.PROVINCE_CHOICES if code != 'NONE')
+}
+ACTIVITY_SOURCES = ('users', 'bookings', 'messages')
+
+
+def role_key(role):
+    return f'role:{role}'
+
+
+def province_key(province, source):
+    return f'province:{province}:{source}'
+
+
+def all_keys():
+    keys = ['users', 'investment_paisa', 'matches']
+    keys += [role_key(role) for role in ROLES]
+    keys += [province_key(p, s) for p in PROVINCE_NUMBERS for s in ACTIVITY_SOURCES]
+    return keys
+
+
+def bump(keys, delta=1):
+    """Add ``delta`` to every counter in ``keys`` with one UPDATE; unknown keys are ignored."""
+    if delta:
+        PlatformStat.objects.filter(key__in=keys).update(value=F('value') + delta)
+
+
+def bump_province(user_id, source, delta=1):
+    """Add ``delta`` to ``source`` activity in ``user_id``'s province.
+
+    The province is looked up inside the UPDATE, so the caller never loads the user.
+    """
+    province = User.objects.filter(pk=user_id).values('province')[:1]
+    key = Concat(Value('province:'), Subquery(province), Value(f':{source}'))
+    PlatformStat.objects.filter(key=key).update(value=F('value') + delta)
+
+
+def to_paisa(amount):
+    return int((Decimal(amount or 0) * 100).to_integral_value())
+
+
+def sources():
+    """``(keys, query)`` per source query: the counters it recomputes and a callable returning them."""
+    def roles():
+        values = dict.fromkeys((role_key(role) for role in ROLES), 0)
+        for row in User.objects.values('role').annotate(n=Count('id')).order_by():
+            values[role_key(row['role'])] = row['n']
+        return values
+
+    def provinces(source, rows):
+        def query():
+            values = dict.fromkeys((province_key(p, source) for p in PROVINCE_NUMBERS), 0)
+            for province, n in rows.order_by():
+                if province in PROVINCE_NUMBERS:
+                    values[province_key(province, source)] = n
+            return values
+        return [province_key(p, source) for p in PROVINCE_NUMBERS], query
+
+    return [
+        (['users'], lambda: {'users': User.objects.count()}),
+        ([role_key(role) for role in ROLES], roles),
+        provinces('users', User.objects.values_list('province').annotate(n=Count('id'))),
+        provinces('bookings', Booking.objects.values_list('client__province').annotate(n=Count('id'))),
+        provinces('messages', Message.objects.values_list('sender__province').annotate(n=Count('id'))),
+        (['investment_paisa'], lambda: {'investment_paisa': to_paisa(Investment.objects.aggregate(total=Sum('amount'))['total'])}),
+        (['matches'], lambda: {'matches': TrialProposal.objects.filter(status='ACCEPTED').count()}),
+    ]
+
+
+def compute():
+    """Recompute every counter from the source tables."""
+    values = {}
+    for _, query in sources():
+        values.update(query())
+    return values
+
+
+def rebuild():
+    """Correct the rollup table to ``compute()``'s values; returns them.
+
+    The source queries run outside any transaction, so writes are never held
+    up behind a scan. Each query's counters are read just before it runs, and
+    only the difference between that reading and the query's result is added
+    to the rows, in one short transaction at the end; bumps that land while
+    the queries run are kept. (A bump that commits between a counter read and
+    the start of its query is counted twice until the next rebuild.)
+    """
+    values, drift = {}, defaultdict(list)  # drift: correction -> keys
+    for keys, query in sources():
+        before = dict(PlatformStat.objects.filter(key__in=keys).values_list('key', 'value'))
+        result = query()
+        values.update(result)
+        for key, value in result.items():
+            if key in before and value != before[key]:
+                drift[value - before[key]].append(key)
+    with transaction.atomic():
+        PlatformStat.objects.exclude(key__in=values).delete()
+        for correction, keys in drift.items():
+            PlatformStat.objects.filter(key__in=keys).update(value=F('value') + correction)
+        PlatformStat.objects.bulk_create([PlatformStat(key=k, value=v) for k, v in values.items()], ignore_conflicts=True)
+    return values
+
+
+def snapshot():
+    """Current counters as a dict, building the table on first use."""
+    values = dict(PlatformStat.objects.values_list('key', 'value'))
+    if not values:
+        with _snapshot_lock:
+            values = dict(PlatformStat.objects.values_list('key', 'value')) or rebuild()
+    return values
+
+
+def compact_amount(paisa):
+    """Format a rupee amount for a stat card: 950, 12.5K, 3.2M, 1.1B."""
+    amount = paisa / 100
+    for threshold, suffix in ((1e9, 'B'), (1e6, 'M'), (1e3, 'K')):
+        if amount >= threshold:
+            return f'{amount / threshold:.1f}{suffix}'
+    return f'{amount:.0f}'
+
+
+def global_stats():
+    """Response body for ``GlobalStatsView``."""
+    values = snapshot()
+    hotspots = []
+    for province, number in PROVINCE_NUMBERS.items():
+        activity = {source: values.get(province_key(province, source), 0) for source in ACTIVITY_SOURCES}
+        hotspots.append({'province': number, 'activity': sum(activity.values()), **activity})
+    return {
+        'total_users': values.get('users', 0),
+        'users_by_role': {role: values.get(role_key(role), 0) for role in ROLES},
+        'total_startups': values.get(role_key('FOUNDER'), 0),
+        'total_investment': compact_amount(values.get('investment_paisa', 0)),
+        'active_matches': values.get('matches', 0),
+        'hotspots': hotspots,
+    }
@@ -0,0 +1,27 @@
+"""Channel-layer groups behind the chat sockets.
+
+Every chat socket joins one ``user_<id>`` group for everything addressed to
+its user: chat messages, read cursors, notifications and partners' presence.
+A ``ws/stream/`` socket (``StreamConsumer``) passes on the events of the
+conversations it subscribed to; an older ``ws/chat/<id>/`` socket
+(``ChatConsumer``) those of its one conversation. A chat event therefore goes
+to the two participants' groups and nowhere else, and opening a conversation
+adds no group membership.
+"""
+
+
+def user_group(user_id):
+    return f'user_{user_id}'
+
+
+def chat_groups(user_a_id, user_b_id):
+    """Every group that should see an event in the conversation between two users."""
+    groups = [user_group(user_a_id)]
+    if user_b_id != user_a_id:
+        groups.append(user_group(user_b_id))
+    return groups
+
+
+async def publish(layer, groups, event):
+    for group in groups:
+        await layer.group_send(group, event)
@@ -0,0 +1,74 @@
+"""Helpers for the interest-tag inverted index (``InterestTagIndex``)."""
+from .models import InterestTagIndex
+
+TAG_MAX_LENGTH = InterestTagIndex._meta.get_field('tag').max_length
+
+
+def parse_tags(raw):
+    """Split a ``?tags=a,b`` query value into a de-duplicated list of tags."""
+    if not raw:
+        return []
+    seen = []
+    for tag in raw.split(','):
+        tag = tag.strip()
+        if tag and tag not in seen:
+            seen.append(tag)
+    return seen
+
+
+def clean_tags(tags):
+    """Normalize an ``interest_tags`` JSON value into a set of indexable strings."""
+    if not isinstance(tags, (list, tuple)):
+        return set()
+    return {t[:TAG_MAX_LENGTH] for t in tags if isinstance(t, str) and t}
+
+
+def tagged_ids(kind, tags):
+    """Subquery of object ids of ``kind`` carrying at least one of ``tags``.
+
+    Use it as ``queryset.filter(id__in=tagged_ids(...))`` so the database
+    answers the filter from the index instead of loading rows into Python.
+    """
+    return InterestTagIndex.objects.filter(kind=kind, tag__in=tags).values('object_id')
+
+
+def sync_tags(kind, object_id, tags):
+    """Make the index rows for one object match its current tag list."""
+    wanted = clean_tags(tags)
+    current = set(
+        InterestTagIndex.objects.filter(kind=kind, object_id=object_id).values_list('tag', flat=True)
+    )
+    stale = current - wanted
+    if stale:
+        InterestTagIndex.objects.filter(kind=kind, object_id=object_id, tag__in=stale).delete()
+    missing = wanted - current
+    if missing:
+        InterestTagIndex.objects.bulk_create(
+            [InterestTagIndex(kind=kind, tag=t, object_id=object_id) for t in missing],
+            ignore_conflicts=True,
+        )
+
+
+def drop_tags(kind, object_id):
+    InterestTagIndex.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def rebuild(kind, queryset, batch_size=2000):
+    """Rebuild the index for ``kind`` from ``queryset`` (rows with ``id`` and ``interest_tags``).
+
+    Needed after writes that skip model signals, e.g. ``bulk_create`` or ``update()``.
+    Returns the number of index rows written.
+    """
+    InterestTagIndex.objects.filter(kind=kind).delete()
+    written = 0
+    batch = []
+    for object_id, tags in queryset.values_list('id', 'interest_tags').iterator(chunk_size=batch_size):
+        batch.extend(InterestTagIndex(kind=kind, tag=t, object_id=object_id) for t in clean_tags(tags))
+        if len(batch) >= batch_size:
+            InterestTagIndex.objects.bulk_create(batch, ignore_conflicts=True)
+            written += len(batch)
+            batch = []
+    if batch:
+        InterestTagIndex.objects.bulk_create(batch, ignore_conflicts=True)
+        written += len(batch)
+    return written
@@ -1,3 +1,1112 @@
-from django.test import TestCase
+from io import StringIO
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from .models import Syndicate, ExpertProfile, InterestTagIndex
+
+User = get_user_model()
+
+
+class TagIndexTests(TestCase):
+    def setUp(self):
+        self.me = User.objects.create_user(username='me', password='pass1234', interest_tags=['Tech'])
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def test_index_follows_saves(self):
+        user = User.objects.create_user(username='ag', password='x', interest_tags=['Agriculture', 'AI'])
+        self.assertEqual(set(InterestTagIndex.objects.filter(kind='USER', object_id=user.id).values_list('tag', flat=True)), {'Agriculture', 'AI'})
+        user.interest_tags = ['Health']
+        user.save()
+        self.assertEqual(list(InterestTagIndex.objects.filter(kind='USER', object_id=user.id).values_list('tag', flat=True)), ['Health'])
+        user.delete()
+        self.assertFalse(InterestTagIndex.objects.filter(kind='USER', object_id=user.id).exists())
+
+    def test_syndicate_and_expert_tag_filters(self):
+        Syndicate.objects.create(title='Agri', founder=self.me, description='x', funding_goal=10, interest_tags=['Agriculture'])
+        Syndicate.objects.create(title='Fin', founder=self.me, description='x', funding_goal=10, interest_tags=['FinTech'])
+        expert = User.objects.create_user(username='ex', password='x', role='EXPERT', interest_tags=['FinTech'])
+        ExpertProfile.objects.create(user=expert, specialization='Tax', bio='b', hourly_rate=10)
+
+        res = self.client.get('/api/core/syndicates/', {'tags': 'FinTech,Health'})
+        self.assertEqual([s['title'] for s in res.data['results']], ['Fin'])
+        res = self.client.get('/api/core/experts/', {'tags': 'FinTech'})
+        self.assertEqual([e['username'] for e in res.data['results']], ['ex'])
+        res = self.client.get('/api/core/experts/', {'tags': 'AI'})
+        self.assertEqual(res.data['results'], [])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.me = User.objects.create_user(username='me', password='pass1234')
+        founder = User.objects.create_user(username='ramesh', password='x')
+        Syndicate.objects.create(title='Himalayan AgriTech Fund', founder=founder, description='Farm tools', funding_goal=10)
+        Syndicate.objects.create(title='Valley Fund', founder=founder, description='Agri exports and agriculture logistics', funding_goal=10)
+        Syndicate.objects.create(title='Cyber Pool', founder=self.me, description='Security', funding_goal=10)
+        expert = User.objects.create_user(username='sita', password='x', role='EXPERT', interest_tags=['Sustainability'])
+        ExpertProfile.objects.create(user=expert, specialization='Tax & Accounting', bio='Ten years', hourly_rate=10)
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def titles(self, search):
+        return [s['title'] for s in self.client.get('/api/core/syndicates/', {'search': search}).data['results']]
+
+    def test_prefix_match_and_ranking(self):
+        self.assertEqual(self.titles('agri'), ['Himalayan AgriTech Fund', 'Valley Fund'])
+        self.assertEqual(self.titles('rame'), ['Himalayan AgriTech Fund', 'Valley Fund'])
+        self.assertEqual(self.titles('valley agri'), ['Valley Fund'])
+
+    def test_ranked_results_page_in_order(self):
+        res = self.client.get('/api/core/syndicates/', {'search': 'agri', 'page_size': 1})
+        titles = [s['title'] for s in res.data['results']]
+        res = self.client.get(res.data['next'])
+        titles.extend(s['title'] for s in res.data['results'])
+        self.assertEqual(titles, ['Himalayan AgriTech Fund', 'Valley Fund'])
+        self.assertIsNone(res.data['next'])
+
+    def test_index_follows_updates(self):
+        founder = User.objects.get(username='ramesh')
+        founder.username = 'hari'
+        founder.save()
+        self.assertEqual(self.titles('rame'), [])
+        self.assertEqual(len(self.titles('hari')), 2)
+
+    def test_expert_search_covers_tags(self):
+        res = self.client.get('/api/core/experts/', {'search': 'sustain'})
+        self.assertEqual([e['username'] for e in res.data['results']], ['sita'])
+
+    def test_icontains_fallback(self):
+        with self.settings(SEARCH_USE_FTS=False):
+            self.assertEqual(sorted(self.titles('agri')), ['Himalayan AgriTech Fund', 'Valley Fund'])
+            res = self.client.get('/api/core/experts/', {'search': 'sustain'})
+            self.assertEqual([e['username'] for e in res.data['results']], ['sita'])
+
+    def test_fts_tables_are_looked_up_per_database(self):
+        from unittest import mock
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .search import fts_available
+        self.assertTrue(fts_available('core_syndicate_fts'))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(fts_available('core_syndicate_fts'))
+        self.assertEqual(len(queries), 0)
+        # Another database behind the same alias (e.g. the test database) is checked afresh.
+        with mock.patch.dict(connection.settings_dict, NAME='other.sqlite3'), CaptureQueriesContext(connection) as queries:
+            self.assertTrue(fts_available('core_syndicate_fts'))
+        self.assertEqual(len(queries), 1)
+
+
+class KeysetPaginationTests(TestCase):
+    def test_pages_walk_without_count(self):
+        me = User.objects.create_user(username='me', password='pass1234')
+        for i in range(5):
+            Syndicate.objects.create(title=f'S{i}', founder=me, description='x', funding_goal=10)
+        client = APIClient()
+        client.force_authenticate(me)
+        res = client.get('/api/core/syndicates/', {'page_size': 2})
+        self.assertNotIn('count', res.data)
+        titles = [s['title'] for s in res.data['results']]
+        while res.data['next']:
+            res = client.get(res.data['next'])
+            titles.extend(s['title'] for s in res.data['results'])
+        self.assertEqual(titles, ['S4', 'S3', 'S2', 'S1', 'S0'])
+
+    def test_snapshots_page_back_from_the_latest_week(self):
+        from datetime import date, timedelta
+        from .models import KPISnapshot
+        me = User.objects.create_user(username='me', password='pass1234')
+        for i in range(5):
+            KPISnapshot.objects.create(user=me, week_ending=date(2025, 1, 5) + timedelta(weeks=i))
+        client = APIClient()
+        client.force_authenticate(me)
+        res = client.get('/api/core/snapshots/', {'page_size': 2})
+        self.assertEqual([s['week_ending'] for s in res.data['results']], ['2025-01-05', '2025-01-12'])
+        res = client.get('/api/core/snapshots/', {'page_size': 2, 'ordering': '-week_ending'})
+        self.assertEqual([s['week_ending'] for s in res.data['results']], ['2025-02-02', '2025-01-26'])
+        res = client.get(res.data['next'])
+        self.assertEqual([s['week_ending'] for s in res.data['results']], ['2025-01-19', '2025-01-12'])
+
+
+class PlatformStatsTests(TestCase):
+    def setUp(self):
+        from .models import Investment
+        self.koshi = User.objects.create_user(username='k', password='x', province='KOSHI')
+        self.bagmati = User.objects.create_user(username='b', password='x', role='INVESTOR', province='BAGMATI')
+        syndicate = Syndicate.objects.create(title='S', founder=self.koshi, description='x', funding_goal=10)
+        Investment.objects.create(syndicate=syndicate, investor=self.bagmati, amount='1500.50')
+
+    def hotspot(self, data, number):
+        return next(h for h in data['hotspots'] if h['province'] == number)
+
+    def test_counters_follow_writes_and_match_rebuild(self):
+        from . import stats
+        from .models import Booking, Investment, Message, TrialProposal
+        res = APIClient().get('/api/core/stats/')
+        self.assertEqual(res.data['total_users'], 2)
+        self.assertEqual(res.data['total_investment'], '1.5K')
+        self.assertIn('max-age=60', res['Cache-Control'])
+
+        # Writes after the table exists are applied incrementally.
+        Message.objects.create(sender=self.koshi, receiver=self.bagmati, content='hi')
+        Booking.objects.create(expert=self.bagmati, client=self.koshi)
+        proposal = TrialProposal.objects.create(proposer=self.koshi, recipient=self.bagmati)
+        proposal.status = 'ACCEPTED'
+        proposal.save()
+        self.bagmati.province = 'KOSHI'
+        self.bagmati.role = 'FOUNDER'
+        self.bagmati.save()
+        Investment.objects.create(syndicate=Syndicate.objects.get(), investor=self.koshi, amount='2000000')
+        User.objects.create_user(username='gone', password='x', province='KARNALI').delete()
+
+        data = APIClient().get('/api/core/stats/').data
+        self.assertEqual(data['total_startups'], 2)
+        self.assertEqual(data['users_by_role']['INVESTOR'], 0)
+        self.assertEqual(data['active_matches'], 1)
+        self.assertEqual(data['total_investment'], '2.0M')
+        self.assertEqual(self.hotspot(data, 1), {'province': 1, 'activity': 4, 'users': 2, 'bookings': 1, 'messages': 1})
+        self.assertEqual(self.hotspot(data, 3)['activity'], 0)
+        self.assertEqual(self.hotspot(data, 6)['activity'], 0)
+        self.assertEqual(stats.snapshot(), stats.compute())
+
+    def test_rebuild_corrects_drift_and_keeps_bumps_made_while_it_counts(self):
+        from unittest import mock
+        from . import stats
+        from .models import PlatformStat
+        stats.rebuild()
+        PlatformStat.objects.filter(key='matches').update(value=99)
+        sources = stats.sources
+
+        def bumped_while_counting():
+            def during(query):
+                def run():
+                    values = query()
+                    stats.bump(['users'])  # committed after the query read the table
+                    return values
+                return run
+            return [(keys, during(query)) for keys, query in sources()]
+
+        with mock.patch.object(stats, 'sources', bumped_while_counting):
+            stats.rebuild()
+        expected = stats.compute()
+        expected['users'] += len(sources())
+        self.assertEqual(stats.snapshot(), expected)
+
+
+class ChatHistoryTests(TestCase):
+    def setUp(self):
+        from .models import Message
+        self.me = User.objects.create_user(username='me', password='x')
+        self.other = User.objects.create_user(username='other', password='x')
+        third = User.objects.create_user(username='third', password='x')
+        self.ids = []
+        for i in range(5):
+            sender, receiver = (self.me, self.other) if i % 2 else (self.other, self.me)
+            self.ids.append(Message.objects.create(sender=sender, receiver=receiver, content=f'm{i}').id)
+        Message.objects.create(sender=third, receiver=self.me, content='elsewhere')
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def test_pages_backwards_from_newest(self):
+        from .models import Conversation
+        self.assertEqual(Conversation.objects.count(), 2)
+        res = self.client.get(f'/api/core/chat/history/{self.other.id}/', {'limit': 2})
+        self.assertEqual([m['content'] for m in res.data['results']], ['m3', 'm4'])
+        res = self.client.get(res.data['next'])
+        self.assertEqual([m['content'] for m in res.data['results']], ['m1', 'm2'])
+        res = self.client.get(res.data['next'])
+        self.assertEqual([m['content'] for m in res.data['results']], ['m0'])
+        self.assertIsNone(res.data['next'])
+
+    def test_unknown_user_and_bad_params(self):
+        self.assertEqual(self.client.get('/api/core/chat/history/9999/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/core/chat/history/{self.other.id}/', {'before': 'x'}).status_code, 400)
+
+
+class ConversationInboxTests(TestCase):
+    def test_inbox_orders_by_last_message_with_unread_counts(self):
+        from .models import Message
+        me = User.objects.create_user(username='me', password='x')
+        asha = User.objects.create_user(username='asha', password='x')
+        bina = User.objects.create_user(username='bina', password='x')
+        Message.objects.create(sender=asha, receiver=me, content='one')
+        Message.objects.create(sender=bina, receiver=me, content='hello ' * 50)
+        Message.objects.create(sender=asha, receiver=me, content='two')
+        Message.objects.create(sender=me, receiver=bina, content='reply')
+        Message.objects.create(sender=bina, receiver=me, content='three')
+        client = APIClient()
+        client.force_authenticate(me)
+
+        res = client.get('/api/core/chat/conversations/', {'page_size': 1})
+        self.assertEqual(len(res.data['results']), 1)
+        rows = res.data['results'] + client.get(res.data['next']).data['results']
+        self.assertEqual([(r['partner']['username'], r['unread_count']) for r in rows], [('bina', 1), ('asha', 2)])
+        self.assertEqual(rows[0]['last_message']['preview'], 'three')
+
+        client.force_authenticate(bina)
+        row = client.get('/api/core/chat/conversations/').data['results'][0]
+        self.assertEqual((row['partner']['username'], row['unread_count']), ('me', 0))
+        self.assertEqual(row['last_read_message_id'], row['last_message']['id'])
+
+    def test_refresh_members_matches_incremental_state(self):
+        from .conversations import refresh_members
+        from .models import ConversationMember, Message
+        a = User.objects.create_user(username='a', password='x')
+        b = User.objects.create_user(username='b', password='x')
+        for i in range(3):
+            Message.objects.create(sender=a, receiver=b, content=str(i))
+        Message.objects.create(sender=a, receiver=a, content='note to self')
+        before = list(ConversationMember.objects.order_by('id').values('last_message_id', 'unread_count', 'last_read_message_id'))
+        refresh_members()
+        after = list(ConversationMember.objects.order_by('id').values('last_message_id', 'unread_count', 'last_read_message_id'))
+        self.assertEqual(before, after)
+        self.assertEqual([m['unread_count'] for m in after], [0, 3, 0])
+
+
+class ReadCursorTests(TestCase):
+    def setUp(self):
+        from .models import Message
+        self.me = User.objects.create_user(username='me', password='x')
+        self.other = User.objects.create_user(username='other', password='x')
+        self.ids = [Message.objects.create(sender=self.other, receiver=self.me, content=str(i)).id for i in range(4)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+        self.url = f'/api/core/chat/mark-as-read/{self.other.id}/'
+
+    def inbox_unread(self):
+        return self.client.get('/api/core/chat/conversations/').data['results'][0]['unread_count']
+
+    def test_partial_then_full_read(self):
+        self.assertEqual(self.inbox_unread(), 4)
+        res = self.client.post(self.url, {'message_id': self.ids[1]}, format='json')
+        self.assertEqual((res.data['last_read_message_id'], res.data['unread_count']), (self.ids[1], 2))
+        self.assertEqual(self.inbox_unread(), 2)
+        # The cursor never moves backwards.
+        res = self.client.post(self.url, {'message_id': self.ids[0]}, format='json')
+        self.assertEqual(res.data['last_read_message_id'], self.ids[1])
+        res = self.client.post(self.url)
+        self.assertEqual((res.data['last_read_message_id'], res.data['unread_count']), (self.ids[3], 0))
+        self.assertEqual(self.inbox_unread(), 0)
+
+    def test_read_state_is_broadcast_to_the_partner(self):
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        from .streams import user_group
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(user_group(self.other.id), channel)
+        self.client.post(self.url)
+        event = async_to_sync(layer.receive)(channel)
+        self.assertEqual(event, {'type': 'read_cursor', 'user_id': self.me.id, 'partner_id': self.other.id,
+                                 'last_read_message_id': self.ids[3], 'unread_count': 0})
+
+
+class StreamTests(TestCase):
+    def setUp(self):
+        self.me = User.objects.create_user(username='me', password='x')
+        self.other = User.objects.create_user(username='other', password='x')
+
+    def socket(self, user):
+        from channels.testing import WebsocketCommunicator
+        from .consumers import StreamConsumer
+        communicator = WebsocketCommunicator(StreamConsumer.as_asgi(), '/ws/stream/')
+        communicator.scope['user'] = user
+        return communicator
+
+    def test_one_socket_carries_subscribed_conversations(self):
+        from asgiref.sync import async_to_sync
+        from . import outbox
+        from .models import Conversation, ConversationMember, Message
+        third = User.objects.create_user(username='third', password='x')
+        conversation = Conversation.objects.between(self.me.id, self.other.id)
+
+        async def scenario():
+            mine, theirs = self.socket(self.me), self.socket(self.other)
+            await mine.connect()
+            await theirs.connect()
+            # The partner's announcement reaches mine before it subscribes, so it is dropped.
+            self.assertTrue(await mine.receive_nothing())
+            frames = {}
+            await mine.send_json_to({'type': 'subscribe', 'partner_id': self.other.id})
+            frames['subscribed'] = await mine.receive_json_from()
+            # The partner's open socket answers the subscription's presence probe.
+            frames['presence'] = await mine.receive_json_from()
+            # Only existing conversations can be subscribed to (and probed for presence).
+            await mine.send_json_to({'type': 'subscribe', 'partner_id': third.id})
+            frames['no_conversation'] = await mine.receive_json_from()
+            await mine.send_json_to({'type': 'chat.send', 'partner_id': self.other.id, 'message': 'hi'})
+            frames['echo'] = await mine.receive_json_from()
+            await outbox.run(once=True)
+            # The partner hasn't subscribed to this conversation: only the notification reaches them.
+            frames['notified'] = await theirs.receive_json_from()
+            frames['partner_idle'] = await theirs.receive_nothing()
+            # Sending subscribes.
+            await theirs.send_json_to({'type': 'chat.send', 'partner_id': self.me.id, 'message': 'yo'})
+            frames['auto_subscribed'] = await theirs.receive_json_from()
+            frames['reply'] = await mine.receive_json_from()
+            await theirs.disconnect()
+            frames['offline'] = await mine.receive_json_from()
+            await mine.send_json_to({'type': 'bogus', 'partner_id': 1})
+            frames['error'] = await mine.receive_json_from()
+            # A first message to a new partner starts the conversation.
+            await mine.send_json_to({'type': 'chat.send', 'partner_id': third.id, 'message': 'hello'})
+            frames['started'] = await mine.receive_json_from()
+            await mine.disconnect()
+            return frames
+
+        frames = async_to_sync(scenario)()
+        self.assertEqual(frames['subscribed'], {'type': 'subscribed', 'partner_id': self.other.id, 'conversation_id': conversation.id})
+        self.assertEqual(frames['no_conversation']['type'], 'error')
+        self.assertEqual(frames['presence'], {'type': 'presence', 'user_id': self.other.id, 'online': True})
+        message = Message.objects.get(content='hi')
+        self.assertEqual(frames['echo'], {
+            'type': 'chat.message', 'id': message.id, 'message': 'hi', 'sender_id': self.me.id,
+            'receiver_id': self.other.id, 'timestamp': message.timestamp.isoformat(),
+        })
+        self.assertEqual(message.conversation_id, conversation.id)
+        self.assertEqual((frames['notified']['type'], frames['notified']['unread_count']), ('notification', 1))
+        self.assertEqual(frames['notified']['notification']['payload'], {'sender_id': self.me.id})
+        self.assertTrue(frames['partner_idle'])
+        self.assertEqual(frames['auto_subscribed']['type'], 'subscribed')
+        self.assertEqual((frames['reply']['type'], frames['reply']['message']), ('chat.message', 'yo'))
+        self.assertEqual(frames['offline'], {'type': 'presence', 'user_id': self.other.id, 'online': False})
+        self.assertEqual(frames['error']['type'], 'error')
+        self.assertEqual(frames['started']['type'], 'subscribed')
+        self.assertTrue(ConversationMember.objects.filter(user=self.me, partner=third).exists())
+
+
+class UnreadCounterTests(TestCase):
+    def test_counter_follows_creates_and_reads(self):
+        from django.core.management import call_command
+        from .models import Notification, NotificationState
+        from .notifications import coalesce, message_events, notify
+        me = User.objects.create_user(username='me', password='x')
+        other = User.objects.create_user(username='other', password='x')
+        api = APIClient()
+        api.force_authenticate(me)
+
+        def unread():
+            return api.get('/api/core/notifications/unread-count/').data['count']
+
+        first = notify(me.id, 'BOOKING', 'a')
+        notify(me.id, 'BOOKING', 'b')
+        for _ in range(3):
+            coalesce(message_events([(other.id, me.id)]))
+        self.assertEqual(unread(), 3)
+        api.post(f'/api/core/notifications/{first.id}/read/')
+        api.post(f'/api/core/notifications/{first.id}/read/')
+        self.assertEqual(unread(), 2)
+        api.post('/api/core/notifications/read-all/')
+        self.assertEqual(unread(), 0)
+
+        # Drift (e.g. rows written by bulk imports) is repaired by the reconcile command.
+        Notification.objects.bulk_create([Notification(user=me, notification_type='BOOKING', title='x')] * 2)
+        Notification.objects.bulk_create([Notification(user=other, notification_type='BOOKING', title='y')])
+        self.assertEqual(unread(), 0)
+        call_command('reconcile_notifications', stdout=StringIO())
+        self.assertEqual(unread(), 2)
+        self.assertEqual(NotificationState.objects.get(user=other).unread_count, 1)
+
+    def test_unread_count_is_a_primary_key_lookup(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        me = User.objects.create_user(username='me', password='x')
+        api = APIClient()
+        api.force_authenticate(me)
+        with CaptureQueriesContext(connection) as queries:
+            api.get('/api/core/notifications/unread-count/')
+        self.assertEqual(len(queries), 1)
+        self.assertIn('core_notificationstate', queries[0]['sql'])
+
+
+class NotificationFeedTests(TestCase):
+    def test_feed_revalidates_with_etag(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .notifications import notify
+        me = User.objects.create_user(username='me', password='x')
+        api = APIClient()
+        api.force_authenticate(me)
+        notify(me.id, 'BOOKING', 'a')
+
+        res = api.get('/api/core/notifications/')
+        self.assertEqual((res.status_code, res.data['unread_count'], len(res.data['results'])), (200, 1, 1))
+        etag = res['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            res = api.get('/api/core/notifications/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((res.status_code, res['ETag'], len(queries)), (304, etag, 1))
+
+        # Any change (here a read) moves the version, so the old ETag no longer matches.
+        api.post('/api/core/notifications/read-all/')
+        res = api.get('/api/core/notifications/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((res.status_code, res.data['unread_count']), (200, 0))
+        self.assertNotEqual(res['ETag'], etag)
+
+
+class NotificationArchiveTests(TestCase):
+    def test_old_read_notifications_leave_the_hot_table(self):
+        from datetime import timedelta
+        from django.core.management import call_command
+        from django.utils import timezone
+        from .models import ArchivedNotification, Notification
+        from .notifications import notify, state
+        me = User.objects.create_user(username='me', password='x')
+        old = timezone.now() - timedelta(days=100)
+        old_read = [notify(me.id, 'BOOKING', f'old {i}') for i in range(3)]
+        old_unread = notify(me.id, 'BOOKING', 'old unread')
+        recent_read = notify(me.id, 'BOOKING', 'recent')
+        Notification.objects.filter(id__in=[n.id for n in old_read]).update(read=True, updated_at=old)
+        Notification.objects.filter(id=old_unread.id).update(updated_at=old)
+        Notification.objects.filter(id=recent_read.id).update(read=True)
+        version = state(me.id)[1]
+
+        call_command('archive_notifications', '--batch-size', '2', stdout=StringIO())
+        self.assertEqual(set(Notification.objects.values_list('id', flat=True)), {old_unread.id, recent_read.id})
+        archived = ArchivedNotification.objects.order_by('id')
+        self.assertEqual([(a.id, a.title) for a in archived], [(n.id, n.title) for n in old_read])
+        self.assertGreater(state(me.id)[1], version)
+
+        # --delete drops rows without archiving them.
+        Notification.objects.filter(id=recent_read.id).update(updated_at=old)
+        call_command('archive_notifications', '--delete', stdout=StringIO())
+        self.assertFalse(Notification.objects.filter(id=recent_read.id).exists())
+        self.assertEqual(ArchivedNotification.objects.count(), 3)
+
+
+class NotificationPushTests(TestCase):
+    def test_booking_notification_is_pushed_by_the_outbox_worker(self):
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        from .models import Notification, OutboxEvent
+        from .outbox import drain
+        from .streams import user_group
+        expert = User.objects.create_user(username='ex', password='x', role='EXPERT')
+        profile = ExpertProfile.objects.create(user=expert, specialization='Tax', bio='b', hourly_rate=10)
+        client = User.objects.create_user(username='cl', password='x')
+        api = APIClient()
+        api.force_authenticate(client)
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(user_group(expert.id), channel)
+
+        api.post(f'/api/core/bookings/create/{profile.id}/', {}, format='json')
+        # The request only queued the notification.
+        self.assertEqual((OutboxEvent.objects.count(), Notification.objects.count()), (1, 0))
+        self.assertEqual(drain(), 1)
+        self.assertFalse(OutboxEvent.objects.exists())
+        event = async_to_sync(layer.receive)(channel)
+        self.assertEqual((event['type'], event['unread_count']), ('notification', 1))
+        self.assertEqual(event['notification']['notification_type'], 'BOOKING')
+
+
+class OutboxTests(TestCase):
+    def test_failed_events_are_retried_with_backoff(self):
+        from django.utils import timezone
+        from . import outbox
+        from .models import Notification, OutboxEvent
+        me = User.objects.create_user(username='me', password='x')
+        outbox.enqueue('notify', user_id=me.id, notification_type='BOOKING', title='ok')
+        outbox.enqueue('notify', user_id=me.id, notification_type='BOOKING', bogus='x')
+        outbox.enqueue('notify', user_id=me.id, notification_type='BOOKING', title='also ok')
+
+        self.assertEqual(outbox.drain(), 3)
+        self.assertEqual(sorted(Notification.objects.values_list('title', flat=True)), ['also ok', 'ok'])
+        broken = OutboxEvent.objects.get()
+        self.assertEqual(broken.attempts, 1)
+        self.assertIn('bogus', broken.last_error)
+        self.assertGreater(broken.available_at, timezone.now())
+        # Not due again until the backoff passes.
+        self.assertEqual(outbox.drain(), 0)
+
+
+class ChatWriteBehindTests(TestCase):
+    def test_queued_messages_are_written_in_one_batch(self):
+        from asgiref.sync import async_to_sync
+        from .chat_writer import MessageWriter
+        from .conversations import refresh_members
+        from .outbox import drain
+        from .models import Conversation, ConversationMember, Message, Notification
+        a = User.objects.create_user(username='a', password='x')
+        b = User.objects.create_user(username='b', password='x')
+        first = Message.objects.create(sender=a, receiver=b, content='direct')
+        conversation = Conversation.objects.between(a.id, b.id)
+        writer = MessageWriter()
+
+        async def send_and_flush():
+            queued = [await writer.submit(conversation.id, sender.id, receiver.id, str(i))
+                      for i, (sender, receiver) in enumerate([(a, b), (b, a), (a, b)])]
+            pending = len(writer.pending)
+            written = await writer.flush()
+            writer._task.cancel()
+            return queued, pending, written
+
+        queued, pending, written = async_to_sync(send_and_flush)()
+        self.assertEqual((pending, written), (3, 3))
+        self.assertEqual(drain(), 1)
+        ids = [m.id for m in queued]
+        self.assertEqual(ids, sorted(ids))
+        self.assertGreater(ids[0], first.id)
+        # Direct inserts continue after the reserved block instead of colliding with it.
+        self.assertGreater(Message.objects.create(sender=b, receiver=a, content='late').id, ids[-1])
+        self.assertEqual(list(Message.objects.filter(id__in=ids).values_list('content', flat=True)), ['0', '1', '2'])
+        # a's two messages share b's rolling notification.
+        self.assertEqual(sorted(Notification.objects.values_list('user_id', 'count')), [(a.id, 1), (b.id, 2)])
+        state = list(ConversationMember.objects.order_by('id').values_list('last_message_id', 'unread_count', 'last_read_message_id'))
+        refresh_members()
+        self.assertEqual(state, list(ConversationMember.objects.order_by('id').values_list('last_message_id', 'unread_count', 'last_read_message_id')))
+
+    @override_settings(CHAT_WRITE_BEHIND=True, CHAT_WRITE_BEHIND_MAX_PENDING=1)
+    def test_out_of_order_ids_never_move_conversation_state_back(self):
+        from unittest import mock
+        from asgiref.sync import async_to_sync
+        from . import chat_writer
+        from .conversations import mark_read, refresh_members
+        from .models import Conversation, ConversationMember, Message
+        a = User.objects.create_user(username='a', password='x')
+        b = User.objects.create_user(username='b', password='x')
+        conversation = Conversation.objects.between(a.id, b.id)
+        writer = chat_writer.MessageWriter()
+
+        async def send():
+            queued = await chat_writer.store_message(conversation.id, a.id, b.id, 'queued')
+            # The queue is full, so this one is written straight away, numbered after the queued one.
+            direct = await chat_writer.store_message(conversation.id, b.id, a.id, 'direct')
+            return queued, direct
+
+        with mock.patch.object(chat_writer, 'message_writer', writer):
+            queued, direct = async_to_sync(send)()
+            # Another process inserts with AUTOINCREMENT, past the reserved block...
+            elsewhere = Message.objects.create(conversation=conversation, sender=a, receiver=b, content='elsewhere')
+            # ...before this one flushes the lower id it handed out earlier.
+            async_to_sync(writer.flush)()
+            writer._task.cancel()
+        self.assertLess(queued.id, direct.id)
+        self.assertLess(direct.id, elsewhere.id)
+
+        def members():
+            rows = ConversationMember.objects.values_list('user_id', 'last_message_id', 'last_read_message_id', 'unread_count')
+            return {user_id: rest for user_id, *rest in rows}
+
+        # b's reply read 'queued' (a lower id); 'elsewhere' is the one unread message.
+        expected = {a.id: [elsewhere.id, elsewhere.id, 0], b.id: [elsewhere.id, direct.id, 1]}
+        self.assertEqual(members(), expected)
+        refresh_members()
+        self.assertEqual(members(), expected)
+        member = ConversationMember.objects.values('id', 'last_message_id', 'last_read_message_id').get(user=b)
+        self.assertEqual(mark_read(member), (elsewhere.id, 0))
+
+    @override_settings(CHAT_WRITE_BEHIND_MAX_RETRIES=1)
+    def test_failed_flushes_retry_then_drop_only_bad_rows(self):
+        import asyncio
+        from unittest import mock
+        from asgiref.sync import async_to_sync
+        from django.db import OperationalError
+        from . import chat_writer
+        from .models import Conversation, Message
+        a = User.objects.create_user(username='a', password='x')
+        b = User.objects.create_user(username='b', password='x')
+        conversation = Conversation.objects.between(a.id, b.id)
+        writer = chat_writer.MessageWriter()
+        write_batch = chat_writer.write_batch
+
+        def flaky(messages):
+            if any(m.content == 'bad' for m in messages):
+                raise OperationalError('database is locked')
+            return write_batch(messages)
+
+        async def submit_and_flush():
+            # Concurrent first sends share one reserved block.
+            queued = await asyncio.gather(*(writer.submit(conversation.id, a.id, b.id, text) for text in ('ok', 'bad', 'fine')))
+            writer._task.cancel()
+            return queued, await writer.flush(), len(writer.pending), await writer.flush()
+
+        with mock.patch.object(chat_writer, 'write_batch', flaky), self.assertLogs('core.chat_writer', 'WARNING'):
+            queued, first, kept, second = async_to_sync(submit_and_flush)()
+        ids = [m.id for m in queued]
+        self.assertEqual(ids, list(range(ids[0], ids[0] + 3)))
+        # The first failure keeps the batch; the second exhausts the retries and writes row by row.
+        self.assertEqual((first, kept, second), (0, 3, 2))
+        self.assertEqual(sorted(Message.objects.values_list('content', flat=True)), ['fine', 'ok'])
+
+
+class NotificationCoalescingTests(TestCase):
+    def setUp(self):
+        self.me = User.objects.create_user(username='me', password='x')
+        self.other = User.objects.create_user(username='other', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def burst(self, n):
+        from django.db import transaction
+        from .models import Message
+        from .notifications import coalesce, message_events
+        for i in range(n):
+            with transaction.atomic():
+                Message.objects.create(sender=self.other, receiver=self.me, content=str(i))
+                coalesce(message_events([(self.other.id, self.me.id)]))
+
+    def test_burst_updates_one_row_until_read(self):
+        from .models import Notification
+        self.burst(200)
+        res = self.client.get('/api/core/notifications/')
+        self.assertEqual([(n['count'], n['read']) for n in res.data['results']], [(200, False)])
+        self.assertEqual(self.client.get('/api/core/notifications/unread-count/').data['count'], 1)
+
+        # Catching up on the conversation retires it; the next message starts a new one.
+        self.client.post(f'/api/core/chat/mark-as-read/{self.other.id}/')
+        self.burst(2)
+        rows = list(Notification.objects.values_list('count', 'read'))
+        self.assertEqual(rows, [(2, False), (200, True)])
+
+
+class KarmaBalanceTests(TestCase):
+    def test_balance_follows_the_ledger_and_redemptions_cannot_overdraw(self):
+        from django.core.management import call_command
+        from .models import KarmaBalance, Points, RedeemOffer, Redemption
+        me = User.objects.create_user(username='me', password='x', karma_score=5)
+        offer = RedeemOffer.objects.create(company_name='Co', description='x', points_required=7)
+        api = APIClient()
+        api.force_authenticate(me)
+
+        def balance():
+            return api.get('/api/core/karma/balance/').data
+
+        self.assertEqual(balance(), {'earned': 5, 'spent': 0, 'balance': 5})
+        points = Points.objects.create(user=me, points=4, reason='post')
+        me.karma_score = 6
+        me.save()
+        self.assertEqual(balance()['balance'], 10)
+
+        res = api.post(f'/api/core/redeem/{offer.id}/')
+        self.assertEqual((res.status_code, res.data['new_balance']), (201, 3))
+        res = api.post(f'/api/core/redeem/{offer.id}/')
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual((Redemption.objects.count(), balance()['balance']), (1, 3))
+
+        points.delete()
+        Redemption.objects.get().delete()
+        self.assertEqual(balance(), {'earned': 6, 'spent': 0, 'balance': 6})
+
+        # Writes that skip signals drift until reconcile_karma recomputes the row.
+        Points.objects.bulk_create([Points(user=me, points=20)])
+        User.objects.filter(id=me.id).update(karma_score=0)
+        call_command('reconcile_karma', stdout=StringIO())
+        self.assertEqual(balance()['balance'], 20)
+        self.assertEqual(KarmaBalance.objects.count(), 1)
+
+
+class OfferLimitTests(TestCase):
+    def setUp(self):
+        from .models import RedeemOffer
+        self.me = User.objects.create_user(username='me', password='x', karma_score=100)
+        self.offer = RedeemOffer.objects.create(company_name='Co', description='x', points_required=10, stock=2, per_user_limit=1)
+        self.api = APIClient()
+        self.api.force_authenticate(self.me)
+
+    def test_stock_and_per_user_limit(self):
+        from .models import Redemption
+        other = User.objects.create_user(username='other', password='x', karma_score=100)
+        third = User.objects.create_user(username='third', password='x', karma_score=100)
+        self.assertEqual(self.api.post(f'/api/core/redeem/{self.offer.id}/').status_code, 201)
+        res = self.api.post(f'/api/core/redeem/{self.offer.id}/')
+        self.assertEqual((res.status_code, res.data['error']), (409, 'You can redeem this offer at most 1 times'))
+
+        self.api.force_authenticate(other)
+        self.assertEqual(self.api.post(f'/api/core/redeem/{self.offer.id}/').status_code, 201)
+        self.api.force_authenticate(third)
+        res = self.api.post(f'/api/core/redeem/{self.offer.id}/')
+        self.assertEqual((res.status_code, res.data['error']), (409, 'This offer is sold out'))
+        # A refused redemption spends nothing and doesn't count against the user's limit.
+        self.assertEqual(self.api.get('/api/core/karma/balance/').data['balance'], 100)
+        self.offer.stock = 1
+        self.offer.save()
+        self.assertEqual(self.api.post(f'/api/core/redeem/{self.offer.id}/').status_code, 201)
+
+        self.offer.refresh_from_db()
+        self.assertEqual((self.offer.stock, Redemption.objects.count()), (0, 3))
+
+    def test_idempotency_key_replays_the_first_response(self):
+        from datetime import timedelta
+        from django.core.management import call_command
+        from django.utils import timezone
+        from .models import IdempotencyKey, Redemption
+        path = f'/api/core/redeem/{self.offer.id}/'
+        first = self.api.post(path, HTTP_IDEMPOTENCY_KEY='abc')
+        retry = self.api.post(path, HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual((first.status_code, retry.status_code), (201, 201))
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Redemption.objects.count(), 1)
+
+        # Same key, different request; a new key is a new request (refused by the per-user limit here).
+        self.assertEqual(self.api.post('/api/core/redeem/999/', HTTP_IDEMPOTENCY_KEY='abc').status_code, 422)
+        self.assertEqual(self.api.post(path, HTTP_IDEMPOTENCY_KEY='def').status_code, 409)
+        self.assertEqual(self.api.post(path, HTTP_IDEMPOTENCY_KEY='def').status_code, 409)
+
+        # Expired keys are pruned.
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        call_command('prune_idempotency_keys', stdout=StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class OfferRankingTests(TestCase):
+    def setUp(self):
+        from .offer_ranking import offer_catalog
+        offer_catalog.reset()
+        self.addCleanup(offer_catalog.reset)
+
+    def test_overlap_then_affordability_then_popularity(self):
+        from .models import RedeemOffer, Redemption
+        me = User.objects.create_user(username='me', password='x', karma_score=50, interest_tags=['Tech', 'AI'])
+        fan = User.objects.create_user(username='fan', password='x', karma_score=1000)
+
+        def offer(name, cost, tags=()):
+            return RedeemOffer.objects.create(company_name=name, description='x', points_required=cost, interest_tags=list(tags))
+
+        both = offer('both', 500, ['Tech', 'AI'])
+        tech = offer('tech', 10, ['Tech'])
+        ai = offer('ai', 10, ['AI'])
+        pricey = offer('pricey', 100)
+        popular = offer('popular', 10, ['Health'])
+        offer('new', 10)
+        Redemption.objects.create(user=fan, offer=ai, points_spent=10)
+        Redemption.objects.create(user=fan, offer=popular, points_spent=10)
+        api = APIClient()
+        api.force_authenticate(me)
+
+        def ranked(query='?for_me=1'):
+            return [o['company_name'] for o in api.get(f'/api/core/redeem/offers/{query}').data]
+
+        self.assertEqual(ranked(), ['both', 'ai', 'tech', 'popular', 'new', 'pricey'])
+        self.assertEqual(ranked('?for_me=1&limit=2'), ['both', 'ai'])
+        self.assertEqual(ranked('?'), ['new', 'popular', 'pricey', 'ai', 'tech', 'both'])
+        first = api.get('/api/core/redeem/offers/?for_me=1').data[0]
+        self.assertEqual((first['tag_overlap'], first['affordable'], first['redemptions']), (2, False, 0))
+
+        # Committed redemptions move the counters; offer edits rebuild the catalog.
+        with self.captureOnCommitCallbacks(execute=True):
+            Redemption.objects.create(user=fan, offer=tech, points_spent=10)
+            Redemption.objects.create(user=fan, offer=tech, points_spent=10)
+        self.assertEqual(ranked()[:3], ['both', 'tech', 'ai'])
+        with self.captureOnCommitCallbacks(execute=True):
+            pricey.interest_tags = ['AI']
+            pricey.save()
+            both.is_active = False
+            both.save()
+        self.assertEqual(ranked(), ['tech', 'ai', 'pricey', 'popular', 'new'])
+
+        # Taking the last unit drops the offer without a rebuild; rebuilds leave it out too.
+        from . import karma
+        from .offer_ranking import offer_catalog
+        with self.captureOnCommitCallbacks(execute=True):
+            tech.stock = 1
+            tech.save()
+        self.assertEqual(ranked()[0], 'tech')
+        built_at = offer_catalog._built_at
+        with self.captureOnCommitCallbacks(execute=True):
+            karma.redeem(me.id, tech)
+        self.assertEqual(ranked(), ['ai', 'pricey', 'popular', 'new'])
+        self.assertEqual(offer_catalog._built_at, built_at)
+        offer_catalog.reset()
+        self.assertEqual(ranked(), ['ai', 'pricey', 'popular', 'new'])
+
+    def test_changes_during_a_rebuild_are_replayed_onto_it(self):
+        from unittest import mock
+        from .models import RedeemOffer
+        from .offer_ranking import OfferCatalog, offer_catalog
+        quiet = RedeemOffer.objects.create(company_name='quiet', description='x', points_required=10)
+        loud = RedeemOffer.objects.create(company_name='loud', description='x', points_required=10)
+        gone = RedeemOffer.objects.create(company_name='gone', description='x', points_required=10, stock=1)
+        offer_catalog.build()
+
+        def read_started():
+            # Committed after the rebuild's read began, so only the replay carries them.
+            offer_catalog.add_redemptions(quiet.id, 2)
+            offer_catalog.remove(gone.id)
+            return OfferCatalog()
+
+        with mock.patch('core.offer_ranking.OfferCatalog', side_effect=read_started):
+            offer_catalog.build()
+        self.assertEqual([row[0] for row in offer_catalog.rank([], 100)], [quiet.id, loud.id])
+
+        # An offer saved during the read throws that read away and reads again.
+        saves = []
+
+        def offer_saved():
+            if not saves:
+                saves.append(RedeemOffer.objects.create(company_name='late', description='x', points_required=10))
+                offer_catalog.reset()
+            return OfferCatalog()
+
+        with mock.patch('core.offer_ranking.OfferCatalog', side_effect=offer_saved):
+            offer_catalog.build()
+        self.assertEqual([row[0] for row in offer_catalog.rank([], 100)], [saves[0].id, gone.id, loud.id, quiet.id])
+
+        # Offers changing through every read leave no catalog; the list is served unranked.
+        def always_saved():
+            offer_catalog.reset()
+            return OfferCatalog()
+
+        me = User.objects.create_user(username='me', password='x')
+        api = APIClient()
+        api.force_authenticate(me)
+        with mock.patch('core.offer_ranking.OfferCatalog', side_effect=always_saved):
+            offer_catalog.reset()
+            names = [o['company_name'] for o in api.get('/api/core/redeem/offers/?for_me=1').data]
+        self.assertIsNone(offer_catalog._built_at)
+        self.assertEqual(sorted(names), ['gone', 'late', 'loud', 'quiet'])
+
+    def test_rebuild_does_not_replay_redemptions_it_already_counted(self):
+        from unittest import mock
+        from .models import RedeemOffer, Redemption
+        from .offer_ranking import OfferCatalog, offer_catalog
+        fan = User.objects.create_user(username='fan', password='x')
+        offer = RedeemOffer.objects.create(company_name='offer', description='x', points_required=10)
+        offer_catalog.build()
+
+        def read_started():
+            # Committed before the read's count runs; its callback lands during the build.
+            with self.captureOnCommitCallbacks(execute=True):
+                Redemption.objects.create(user=fan, offer=offer, points_spent=10)
+            return OfferCatalog()
+
+        with mock.patch('core.offer_ranking.OfferCatalog', side_effect=read_started):
+            offer_catalog.build()
+        self.assertEqual(offer_catalog.rank([], 0), [(offer.id, 0, False, 1)])
+        with self.captureOnCommitCallbacks(execute=True):
+            Redemption.objects.create(user=fan, offer=offer, points_spent=10)
+        self.assertEqual(offer_catalog.rank([], 0), [(offer.id, 0, False, 2)])
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        from .leaderboard import leaderboard
+        leaderboard.reset()
+        self.addCleanup(leaderboard.reset)
+
+    def test_windows_filters_and_incremental_updates(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import Points
+        me = User.objects.create_user(username='me', password='x', province='BAGMATI')
+        rival = User.objects.create_user(username='rival', password='x', province='KOSHI')
+        expert = User.objects.create_user(username='expert', password='x', role='EXPERT', province='BAGMATI')
+        Points.objects.create(user=me, points=10)
+        Points.objects.create(user=rival, points=30)
+        Points.objects.create(user=expert, points=10)
+        old = Points.objects.create(user=me, points=100)
+        Points.objects.filter(id=old.id).update(created_at=timezone.now() - timedelta(days=60))
+        api = APIClient()
+        api.force_authenticate(me)
+
+        def board(query=''):
+            data = api.get(f'/api/core/karma/leaderboard/{query}').data
+            return [(r['rank'], r['username'], r['score']) for r in data['results']], data['me']
+
+        self.assertEqual(board(), ([(1, 'me', 110), (2, 'rival', 30), (3, 'expert', 10)], {'rank': 1, 'score': 110}))
+        # Ties share a rank.
+        self.assertEqual(board('?window=30d'), ([(1, 'rival', 30), (2, 'me', 10), (2, 'expert', 10)], {'rank': 2, 'score': 10}))
+        self.assertEqual(board('?window=7d&province=BAGMATI&role=FOUNDER'), ([(1, 'me', 10)], {'rank': 1, 'score': 10}))
+        self.assertEqual(board('?window=7d&role=EXPERT')[1], None)
+        self.assertEqual(api.get('/api/core/karma/leaderboard/?window=1y').status_code, 400)
+
+        # Committed writes move the built rankings without a rebuild.
+        with self.captureOnCommitCallbacks(execute=True):
+            Points.objects.create(user=me, points=25)
+        self.assertEqual(board('?window=7d')[1], {'rank': 1, 'score': 35})
+        with self.captureOnCommitCallbacks(execute=True):
+            me.province = 'KOSHI'
+            me.save()
+        self.assertEqual(board('?window=7d&province=KOSHI')[0], [(1, 'me', 35), (2, 'rival', 30)])
+        self.assertEqual(board('?window=7d&province=BAGMATI')[0], [(1, 'expert', 10)])
+
+    def test_writes_during_a_rebuild_are_replayed_onto_it(self):
+        from unittest import mock
+        from django.utils import timezone
+        from .leaderboard import Leaderboard, leaderboard
+        from .models import Points
+        me = User.objects.create_user(username='me', password='x', province='BAGMATI')
+        Points.objects.create(user=me, points=10)
+        leaderboard.build()
+
+        def read_started():
+            # Committed after the rebuild's read began, so only the replay carries them.
+            leaderboard.add_points(me.id, 5, timezone.now())
+            leaderboard.move_user(me.id, 'FOUNDER', 'KOSHI')
+            return Leaderboard()
+
+        with mock.patch('core.leaderboard.Leaderboard', side_effect=read_started):
+            leaderboard.build()
+        self.assertEqual(leaderboard.standings('7d', province='KOSHI', user_id=me.id), ([(1, me.id, 15)], (1, 15)))
+        self.assertEqual(leaderboard.standings('all', province='BAGMATI'), ([], None))
+
+    def test_rebuild_does_not_replay_points_it_already_read(self):
+        from unittest import mock
+        from .leaderboard import Leaderboard, leaderboard
+        from .models import Points
+        me = User.objects.create_user(username='me', password='x')
+        Points.objects.create(user=me, points=10)
+        leaderboard.build()
+
+        def read_started():
+            # Committed before the read's query runs; its callback lands during the build.
+            with self.captureOnCommitCallbacks(execute=True):
+                Points.objects.create(user=me, points=5)
+            return Leaderboard()
+
+        with mock.patch('core.leaderboard.Leaderboard', side_effect=read_started):
+            leaderboard.build()
+        self.assertEqual(leaderboard.standings('all', user_id=me.id)[1], (1, 15))
+        with self.captureOnCommitCallbacks(execute=True):
+            Points.objects.create(user=me, points=1)
+        self.assertEqual(leaderboard.standings('all', user_id=me.id)[1], (1, 16))
+
+
+class QueryPlanTests(TestCase):
+    def test_history_pages_use_their_indexes(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .management.commands.explain_queries import explain, problems
+        me = User.objects.create_user(username='me', password='x')
+        api = APIClient()
+        api.force_authenticate(me)
+        for path in ('/api/core/karma/history/', '/api/core/redeem/history/', '/api/core/bookings/'):
+            with self.subTest(path=path), CaptureQueriesContext(connection) as queries:
+                api.get(path)
+                for query in queries.captured_queries:
+                    plan = explain(query['sql'])
+                    if 'bookings' in path:
+                        # Client-or-expert still sorts, but no longer de-duplicates.
+                        self.assertFalse([line for line in plan if 'DISTINCT' in line or line.startswith('SCAN')], plan)
+                    else:
+                        self.assertEqual(problems(plan, query['sql']), [], plan)
+        with CaptureQueriesContext(connection) as queries:
+            User.objects.filter(email='new@x.test').exists()
+        self.assertIn('customuser_email_idx', ' '.join(explain(queries.captured_queries[0]['sql'])))
+
+
+@override_settings(
+    QUERY_STATS_HEADERS=True,
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class QueryBudgetTests(TestCase):
+    """Every route in core/urls.py and users/urls.py runs a fixed number of queries.
+
+    Each endpoint is measured (via QueryStatsMiddleware's X-Query-Count) after
+    seeding a few rows and again after seeding many more; the count must not
+    grow with the data and must stay within its budget. A failure here is
+    usually a missing select_related() or a per-row query.
+    """
+    # name: (method, path template, request body, max queries)
+    ENDPOINTS = {
+        'stats': ('get', '/api/core/stats/', None, 2),
+        'snapshots': ('get', '/api/core/snapshots/', None, 2),
+        'syndicates': ('get', '/api/core/syndicates/', None, 2),
+        'syndicates-tags': ('get', '/api/core/syndicates/?tags=Tech,AI', None, 2),
+        'syndicates-search': ('get', '/api/core/syndicates/?search=fund', None, 2),
+        'experts': ('get', '/api/core/experts/', None, 2),
+        'experts-search': ('get', '/api/core/experts/?search=tax&tags=Tech', None, 2),
+        'expert-contact': ('get', '/api/core/experts/{expert_profile}/contact/', None, 2),
+        'statute': ('get', '/api/core/statutes/{syndicate}/', None, 2),
+        'chat-conversations': ('get', '/api/core/chat/conversations/', None, 2),
+        'chat-history': ('get', '/api/core/chat/history/{other}/', None, 2),
+        'chat-mark-read': ('post', '/api/core/chat/mark-as-read/{other}/', None, 4),
+        'trial-propose': ('post', '/api/core/trial/propose/{other}/', {'message': 'hi'}, 3),
+        'trial-list': ('get', '/api/core/trial/', None, 2),
+        'trial-respond': ('post', '/api/core/trial/{proposal}/respond/', {'action': 'accept'}, 4),
+        'notifications': ('get', '/api/core/notifications/', None, 2),
+        'notification-read': ('post', '/api/core/notifications/{notification}/read/', None, 3),
+        'notifications-read-all': ('post', '/api/core/notifications/read-all/', None, 2),
+        'notifications-unread': ('get', '/api/core/notifications/unread-count/', None, 2),
+        'bookings': ('get', '/api/core/bookings/', None, 2),
+        'booking-create': ('post', '/api/core/bookings/create/{expert_profile}/', {'amount': 0}, 5),
+        'karma-balance': ('get', '/api/core/karma/balance/', None, 1),
+        'karma-history': ('get', '/api/core/karma/history/', None, 2),
+        'karma-leaderboard': ('get', '/api/core/karma/leaderboard/?window=30d&role=FOUNDER', None, 1),
+        'redeem-offers': ('get', '/api/core/redeem/offers/', None, 2),
+        'redeem-offers-for-me': ('get', '/api/core/redeem/offers/?for_me=1', None, 2),
+        'redeem': ('post', '/api/core/redeem/{offer}/', None, 4),
+        'redeem-history': ('get', '/api/core/redeem/history/', None, 2),
+        'register': ('post', '/api/users/register/', 'register', 7),
+        'login': ('post', '/api/users/login/', {'username': 'me', 'password': 'pass1234'}, 3),
+        'token-refresh': ('post', '/api/users/token/refresh/', 'refresh', 1),
+        'profile': ('get', '/api/users/profile/', None, 1),
+        'change-password': ('post', '/api/users/change-password/', {'old_password': 'pass1234', 'new_password': 'pass1234'}, 3),
+        'discovery': ('get', '/api/users/discovery/', None, 2),
+        'discovery-search': ('get', '/api/users/discovery/?search=founder&tags=Tech', None, 3),
+        'interest-tags': ('get', '/api/users/interest-tags/', None, 1),
+    }
+
+    def setUp(self):
+        from rest_framework_simplejwt.tokens import RefreshToken
+        from users.matching import match_index
+        from .offer_ranking import offer_catalog
+        match_index.reset()
+        offer_catalog.reset()
+        self.me = User.objects.create_user(username='me', password='pass1234', persona='HACKER',
+                                           interest_tags=['Tech'], karma_score=10 ** 6)
+        self.refresh = RefreshToken.for_user(self.me)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+        self.seeded = 0
+        self.registered = 0
+
+    def seed(self, n):
+        from datetime import date, timedelta
+        from .models import (Booking, KPISnapshot, Message, Notification, Points, RedeemOffer,
+                             Redemption, TrialProposal)
+        for _ in range(n):
+            i = self.seeded = self.seeded + 1
+            founder = User.objects.create(username=f'founder{i}', persona='HUSTLER', interest_tags=['Tech', 'AI'])
+            expert = User.objects.create(username=f'expert{i}', role='EXPERT', interest_tags=['Tech'])
+            profile = ExpertProfile.objects.create(user=expert, specialization='Tax', bio='Tax expert', hourly_rate=10)
+            syndicate = Syndicate.objects.create(title=f'Fund {i}', founder=founder, description='A fund',
+                                                 funding_goal=100, interest_tags=['Tech'])
+            offer = RedeemOffer.objects.create(company_name=f'Co {i}', description='x', points_required=1)
+            Booking.objects.create(expert=expert, client=self.me)
+            Booking.objects.create(expert=self.me, client=founder)
+            TrialProposal.objects.create(proposer=self.me, recipient=founder)
+            proposal = TrialProposal.objects.create(proposer=founder, recipient=self.me)
+            notification = Notification.objects.create(user=self.me, notification_type='MESSAGE', title='hi')
+            Message.objects.create(sender=self.me, receiver=founder, content='hello')
+            Message.objects.create(sender=founder, receiver=self.me, content='hi back')
+            Points.objects.create(user=self.me, points=5, reason='seed')
+            Redemption.objects.create(user=self.me, offer=offer, points_spent=1)
+            KPISnapshot.objects.create(user=self.me, week_ending=date(2025, 1, 5) + timedelta(weeks=i))
+        self.ids = {
+            'other': founder.id,
+            'expert_profile': profile.id,
+            'syndicate': syndicate.id,
+            'offer': offer.id,
+            'proposal': proposal.id,
+            'notification': notification.id,
+        }
+
+    def body(self, data):
+        if data == 'register':
+            self.registered += 1
+            return {'username': f'new{self.registered}', 'email': f'new{self.registered}@x.test', 'password': 'pass1234'}
+        if data == 'refresh':
+            return {'refresh': str(self.refresh)}
+        return data
+
+    def measure(self):
+        counts = {}
+        for name, (method, path, data, _) in self.ENDPOINTS.items():
+            response = getattr(self.client, method)(path.format(**self.ids), self.body(data), format='json')
+            self.assertLess(response.status_code, 400, f'{name}: {response.status_code} {getattr(response, "data", "")}')
+            counts[name] = int(response['X-Query-Count'])
+        return counts
+
+    def test_query_budgets(self):
+        # Warm per-process caches (FTS table probe, Jodi match index) first.
+        self.seed(1)
+        self.measure()
+        self.seed(2)
+        small = self.measure()
+        self.seed(12)
+        large = self.measure()
+        for name, (_, _, _, budget) in self.ENDPOINTS.items():
+            with self.subTest(endpoint=name):
+                self.assertLessEqual(large[name], budget)
+                self.assertEqual(small[name], large[name], 'query count grows with row count')
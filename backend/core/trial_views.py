@@ -3,8 +3,11 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from django.contrib.auth import get_user_model
-from .models import TrialProposal, Notification
+from django.db import transaction
+from . import outbox
+from .models import TrialProposal
 from .serializers import TrialProposalSerializer
+from .pagination import KeysetPagination
 
 User = get_user_model()
 
@@ -23,19 +26,21 @@ class ProposeTrialView(APIView):
             return Response({'error': 'Cannot propose trial to yourself'}, status=status.HTTP_400_BAD_REQUEST)
 
         message = request.data.get('message', '')
-        proposal = TrialProposal.objects.create(
-            proposer=request.user,
-            recipient=recipient,
-            message=message or None,
-        )
-        # Create notification for recipient
-        Notification.objects.create(
-            user=recipient,
-            notification_type='TRIAL_PROPOSAL',
-            title='Trial Proposal',
-            message=f"{request.user.username} wants to propose a 2-week digital trial with you.",
-            payload={'trial_id': proposal.id, 'proposer_id': request.user.id},
-        )
+        with transaction.atomic(savepoint=False):
+            proposal = TrialProposal.objects.create(
+                proposer=request.user,
+                recipient=recipient,
+                message=message or None,
+            )
+            # Notify the recipient (applied by the outbox worker)
+            outbox.enqueue(
+                'notify',
+                user_id=recipient.id,
+                notification_type='TRIAL_PROPOSAL',
+                title='Trial Proposal',
+                message=f"{request.user.username} wants to propose a 2-week digital trial with you.",
+                payload={'trial_id': proposal.id, 'proposer_id': request.user.id},
+            )
         return Response(TrialProposalSerializer(proposal).data, status=status.HTTP_201_CREATED)
 
 
@@ -46,8 +51,11 @@ class TrialProposalListView(APIView):
     def get(self, request):
         received = TrialProposal.objects.filter(recipient=request.user)
         sent = TrialProposal.objects.filter(proposer=request.user)
-        qs = (received | sent).distinct().order_by('-created_at')
-        return Response(TrialProposalSerializer(qs, many=True).data)
+        paginator = KeysetPagination()
+        # One table ORed on two columns can't repeat rows, so no DISTINCT (and its temp B-tree).
+        qs = (received | sent).select_related('proposer', 'recipient')
+        page = paginator.paginate_queryset(qs, request, view=self)
+        return paginator.get_paginated_response(TrialProposalSerializer(page, many=True).data)
 
 
 class TrialProposalRespondView(APIView):
@@ -56,21 +64,23 @@ class TrialProposalRespondView(APIView):
 
     def post(self, request, proposal_id):
         try:
-            proposal = TrialProposal.objects.get(id=proposal_id, recipient=request.user)
+            proposal = TrialProposal.objects.select_related('proposer', 'recipient').get(id=proposal_id, recipient=request.user)
         except TrialProposal.DoesNotExist:
             return Response({'error': 'Proposal not found'}, status=status.HTTP_404_NOT_FOUND)
 
         action = request.data.get('action')
         if action == 'accept':
             proposal.status = 'ACCEPTED'
-            proposal.save()
-            Notification.objects.create(
-                user=proposal.proposer,
-                notification_type='TRIAL_PROPOSAL',
-                title='Trial Accepted',
-                message=f"{request.user.username} accepted your trial proposal.",
-                payload={'trial_id': proposal.id},
-            )
+            with transaction.atomic(savepoint=False):
+                proposal.save()
+                outbox.enqueue(
+                    'notify',
+                    user_id=proposal.proposer_id,
+                    notification_type='TRIAL_PROPOSAL',
+                    title='Trial Accepted',
+                    message=f"{request.user.username} accepted your trial proposal.",
+                    payload={'trial_id': proposal.id},
+                )
         elif action == 'decline':
             proposal.status = 'DECLINED'
             proposal.save()
@@ -1,11 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import GlobalStatsView, KPISnapshotViewSet, SyndicateViewSet, ExpertProfileViewSet, SmartStatuteView
-from .chat_views import ChatHistoryView, MarkAsReadView
+from .chat_views import ChatHistoryView, ConversationListView, MarkAsReadView
 from .trial_views import ProposeTrialView, TrialProposalListView, TrialProposalRespondView
 from .notification_views import NotificationListView, NotificationMarkReadView, NotificationMarkAllReadView, UnreadNotificationCountView
 from .booking_views import BookSessionView, BookingListView, ExpertContactView
-from .redeem_views import KarmaBalanceView, PointsHistoryView, RedeemOfferListView, RedeemOfferView, RedemptionHistoryView
+from .redeem_views import KarmaBalanceView, LeaderboardView, PointsHistoryView, RedeemOfferListView, RedeemOfferView, RedemptionHistoryView
 
 router = DefaultRouter()
 router.register(r'snapshots', KPISnapshotViewSet, basename='snapshot')
@@ -16,6 +16,7 @@ urlpatterns = [
     path('', include(router.urls)),
     path('stats/', GlobalStatsView.as_view(), name='global_stats'),
     path('statutes/<int:syndicate_id>/', SmartStatuteView.as_view(), name='smart_statute'),
+    path('chat/conversations/', ConversationListView.as_view(), name='chat-conversations'),
     path('chat/history/<int:receiver_id>/', ChatHistoryView.as_view(), name='chat-history'),
     path('chat/mark-as-read/<int:receiver_id>/', MarkAsReadView.as_view(), name='chat-mark-as-read'),
     path('trial/propose/<int:recipient_id>/', ProposeTrialView.as_view(), name='propose-trial'),
@@ -30,6 +31,7 @@ urlpatterns = [
     path('experts/<int:expert_profile_id>/contact/', ExpertContactView.as_view(), name='expert-contact'),
     path('karma/balance/', KarmaBalanceView.as_view(), name='karma-balance'),
     path('karma/history/', PointsHistoryView.as_view(), name='karma-history'),
+    path('karma/leaderboard/', LeaderboardView.as_view(), name='karma-leaderboard'),
     path('redeem/offers/', RedeemOfferListView.as_view(), name='redeem-offers'),
     path('redeem/<int:offer_id>/', RedeemOfferView.as_view(), name='redeem-offer'),
     path('redeem/history/', RedemptionHistoryView.as_view(), name='redeem-history'),
@@ -1,70 +1,58 @@
 from rest_framework import generics, permissions, viewsets, status
+from rest_framework.filters import OrderingFilter
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
+from django.conf import settings
 from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
 from .models import KPISnapshot, Syndicate, ExpertProfile
 from .serializers import KPISnapshotSerializer, SyndicateSerializer, ExpertProfileSerializer
+from .tag_index import parse_tags, tagged_ids
+from .search import search_queryset, tag_search_q
+from .pagination import WeekEndingPagination
+from . import stats
 import io
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from rest_framework.views import APIView
-from django.db.models import Q
 
 User = get_user_model()
 
 class GlobalStatsView(APIView):
+    """Platform totals and province hotspots, read from the ``core.stats`` rollup."""
     permission_classes = (permissions.AllowAny,)
 
     def get(self, request):
-        total_users = User.objects.count()
-        total_founders = User.objects.filter(role='FOUNDER').count()
-        total_investors = User.objects.filter(role='INVESTOR').count()
-        
-        stats = {
-            'total_startups': total_founders + 42,
-            'total_investment': f"{total_investors * 0.5 + 2.5:.1f}M",
-            'active_matches': total_users * 2 + 15,
-            'hotspots': [
-                {'province': 1, 'activity': 12},
-                {'province': 2, 'activity': 8},
-                {'province': 3, 'activity': 45},
-                {'province': 4, 'activity': 22},
-                {'province': 5, 'activity': 15},
-                {'province': 6, 'activity': 5},
-                {'province': 7, 'activity': 10},
-            ]
-        }
-        return Response(stats)
+        response = Response(stats.global_stats())
+        patch_cache_control(response, public=True, max_age=getattr(settings, 'STATS_CACHE_SECONDS', 60))
+        return response
 
 class KPISnapshotViewSet(viewsets.ModelViewSet):
     serializer_class = KPISnapshotSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    pagination_class = WeekEndingPagination
+    # ?ordering=-week_ending pages back from the latest week (the chart's view).
+    filter_backends = (OrderingFilter,)
+    ordering_fields = ('week_ending',)
 
     def get_queryset(self):
         return KPISnapshot.objects.filter(user=self.request.user)
 
 class SyndicateViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Syndicate.objects.filter(is_active=True)
+    queryset = Syndicate.objects.filter(is_active=True).select_related('founder')
     serializer_class = SyndicateSerializer
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_queryset(self):
-        queryset = Syndicate.objects.filter(is_active=True)
-        # Filter by interest tags
-        tags = self.request.query_params.get('tags', None)
-        if tags:
-            tag_list = [t.strip() for t in tags.split(',') if t.strip()]
-            if tag_list:
-                filtered_ids = [s.id for s in queryset if any(t in (s.interest_tags or []) for t in tag_list)]
-                queryset = queryset.filter(id__in=filtered_ids)
+        queryset = Syndicate.objects.filter(is_active=True).select_related('founder')
+        # Filter by interest tags (answered from the tag index)
+        tag_list = parse_tags(self.request.query_params.get('tags', None))
+        if tag_list:
+            queryset = queryset.filter(id__in=tagged_ids('SYNDICATE', tag_list))
         # Search by title, description, founder
         search = self.request.query_params.get('search', None)
         if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) |
-                Q(description__icontains=search) |
-                Q(founder__username__icontains=search)
-            )
+            queryset = search_queryset(queryset, 'syndicate', search)
         return queryset
 
 class ExpertProfileViewSet(viewsets.ReadOnlyModelViewSet):
@@ -72,44 +60,17 @@ class ExpertProfileViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_queryset(self):
-        queryset = ExpertProfile.objects.all()
+        queryset = ExpertProfile.objects.select_related('user')
         
-        # Filter by interest tags if provided
-        tags = self.request.query_params.get('tags', None)
-        if tags:
-            tag_list = [tag.strip() for tag in tags.split(',')]
-            # Filter profiles where the user has at least one matching tag
-            queryset = queryset.filter(user__interest_tags__overlap=tag_list) if hasattr(queryset.query, 'overlap') else queryset
-            # For SQLite compatibility, we'll do a more flexible approach
-            filtered_profiles = []
-            for profile in queryset:
-                if any(tag in profile.user.interest_tags for tag in tag_list):
-                    filtered_profiles.append(profile.id)
-            queryset = queryset.filter(id__in=filtered_profiles)
+        # Filter by interest tags if provided (experts carry their user's tags)
+        tag_list = parse_tags(self.request.query_params.get('tags', None))
+        if tag_list:
+            queryset = queryset.filter(user_id__in=tagged_ids('USER', tag_list))
         
         # Search by keyword (name, specialization, bio, tags)
         search = self.request.query_params.get('search', None)
         if search:
-            queryset = queryset.filter(
-                Q(user__username__icontains=search) |
-                Q(specialization__icontains=search) |
-                Q(bio__icontains=search)
-            )
-            # Additional filtering for tags matching search
-            search_lower = search.lower()
-            filtered_profiles = []
-            for profile in queryset:
-                if any(search_lower in tag.lower() for tag in profile.user.interest_tags):
-                    if profile.id not in filtered_profiles:
-                        filtered_profiles.append(profile.id)
-            if filtered_profiles:
-                # Combine with existing queryset
-                queryset = queryset.filter(
-                    Q(user__username__icontains=search) |
-                    Q(specialization__icontains=search) |
-                    Q(bio__icontains=search) |
-                    Q(id__in=filtered_profiles)
-                )
+            queryset = search_queryset(queryset, 'expert', search, extra_q=tag_search_q(search, 'user_id'))
         
         return queryset
 
@@ -118,7 +79,7 @@ class SmartStatuteView(APIView):
 
     def get(self, request, syndicate_id):
         try:
-            syndicate = Syndicate.objects.get(id=syndicate_id)
+            syndicate = Syndicate.objects.select_related('founder').get(id=syndicate_id)
         except Syndicate.DoesNotExist:
             return Response({'error': 'Syndicate not found'}, status=404)
 
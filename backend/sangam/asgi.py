@@ -11,6 +11,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sangam.settings')
 
 from channels.routing import ProtocolTypeRouter, URLRouter
 from core.chat_routing import websocket_urlpatterns
+from core.chat_writer import lifespan
 from core.middleware import JwtAuthMiddleware
 from django.core.asgi import get_asgi_application
 
@@ -19,4 +20,5 @@ django_asgi_app = get_asgi_application()
 application = ProtocolTypeRouter({
 	"http": django_asgi_app,
 	"websocket": JwtAuthMiddleware(URLRouter(websocket_urlpatterns)),
+	"lifespan": lifespan,
 })
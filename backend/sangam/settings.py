@@ -47,6 +47,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -57,6 +58,46 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per-request SQL count/time/duplicate headers on /api/ responses (see core.middleware)
+QUERY_STATS_HEADERS = DEBUG
+
+# Cache-Control max-age for the public /api/core/stats/ rollup (see core.stats)
+STATS_CACHE_SECONDS = 60
+
+# Chat write-behind (see core.chat_writer): broadcast first, bulk-insert every
+# CHAT_WRITE_BEHIND_INTERVAL_MS or CHAT_WRITE_BEHIND_BATCH messages. A batch that
+# hits a transient database error is retried up to CHAT_WRITE_BEHIND_MAX_RETRIES
+# times with backoff; past CHAT_WRITE_BEHIND_MAX_PENDING queued messages, sends
+# are written synchronously.
+CHAT_WRITE_BEHIND = False
+CHAT_WRITE_BEHIND_BATCH = 200
+CHAT_WRITE_BEHIND_INTERVAL_MS = 50
+CHAT_WRITE_BEHIND_MAX_RETRIES = 5
+CHAT_WRITE_BEHIND_MAX_PENDING = 10000
+
+# Notification retention (manage.py archive_notifications): read notifications
+# untouched for this many days leave the hot table, this many rows per transaction.
+NOTIFICATION_RETENTION_DAYS = 90
+NOTIFICATION_ARCHIVE_BATCH = 1000
+
+# Karma leaderboards (see core.leaderboard): in-process rankings are rebuilt from
+# Points this often, ageing out the 30/7 day windows and catching other processes' writes.
+LEADERBOARD_REBUILD_SECONDS = 300
+
+# Personalised offer ranking (see core.offer_ranking): the in-process catalog of
+# per-tag offer lists and redemption counts is rebuilt this often.
+OFFER_RANKING_REBUILD_SECONDS = 300
+
+# Transactional outbox (see core.outbox, manage.py outbox_worker): events per
+# batch, delivery attempts before an event is parked, and the idle poll interval.
+OUTBOX_BATCH = 200
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_POLL_MS = 200
+
+# Idempotency-Key responses (see core.idempotency) are replayed for this long,
+# then pruned by manage.py prune_idempotency_keys.
+IDEMPOTENCY_KEY_HOURS = 24
+
 ROOT_URLCONF = 'sangam.urls'
 
 TEMPLATES = [
@@ -142,11 +183,14 @@ AUTH_USER_MODEL = 'users.CustomUser'
 # REST Framework Settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # Keyset pagination: opaque ?cursor=, ?page_size= up to 100, no COUNT(*)
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetPagination',
+    'PAGE_SIZE': 20,
 }
 
 # JWT Settings
@@ -158,9 +202,15 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
+# Authenticated users are cached per process (users.authentication.user_cache):
+# at most this many, each for this many seconds. Saves in the same process
+# invalidate immediately; the TTL bounds staleness for other writers.
+AUTH_USER_CACHE_SIZE = 10000
+AUTH_USER_CACHE_SECONDS = 60
 
 # CORS Settings
 CORS_ALLOW_ALL_ORIGINS = True  # Only for development
+CORS_EXPOSE_HEADERS = ['X-Query-Count', 'X-Query-Time-Ms', 'X-Query-Duplicates']
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
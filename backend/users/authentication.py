@@ -0,0 +1,118 @@
+"""JWT authentication backed by an in-process user cache.
+
+Both the REST API (``CachedJWTAuthentication``) and WebSocket connects
+(``core.middleware.JwtAuthMiddleware``) validate a token once and resolve its
+user from ``user_cache``, a bounded LRU with a TTL. Saving or deleting a
+``CustomUser`` drops its entry in this process (see ``users.signals``);
+other processes and ``QuerySet.update()`` writes catch up within
+``AUTH_USER_CACHE_SECONDS``.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+User = get_user_model()
+
+
+class UserCache:
+    """Thread-safe LRU of ``CustomUser`` rows by id, each kept for ``ttl`` seconds."""
+
+    def __init__(self):
+        self._entries = OrderedDict()  # user_id -> (expires_at, user)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'AUTH_USER_CACHE_SIZE', 10000)
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'AUTH_USER_CACHE_SECONDS', 60)
+
+    @staticmethod
+    def key(user_id):
+        # Tokens carry the id as a string; signals pass the int primary key.
+        return User._meta.pk.to_python(user_id)
+
+    def get(self, user_id):
+        """A private copy of the cached user, or None on a miss."""
+        user_id = self.key(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] <= time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            # Requests may set attributes on request.user; keep those out of the shared copy.
+            return copy.copy(entry[1])
+
+    def put(self, user):
+        with self._lock:
+            self._entries[user.pk] = (time.monotonic() + self.ttl, copy.copy(user))
+            self._entries.move_to_end(user.pk)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(self.key(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def fetch(self, user_id):
+        """Read the user from the database and cache it; None if there is none."""
+        user = User.objects.filter(pk=user_id).first()
+        if user is not None:
+            self.put(user)
+        return user
+
+    def load(self, user_id):
+        """The user with ``user_id`` from the cache or the database; None if there is none."""
+        user = self.get(user_id)
+        return self.fetch(user_id) if user is None else user
+
+
+user_cache = UserCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """simplejwt's ``JWTAuthentication`` with users resolved through ``user_cache``."""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        user = user_cache.load(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN and (
+            validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password)
+        ):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
+
+
+def validate_token(raw_token):
+    """Decode and verify ``raw_token`` once; returns the token or None if it is invalid."""
+    try:
+        return CachedJWTAuthentication().get_validated_token(raw_token)
+    except InvalidToken:
+        return None
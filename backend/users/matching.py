@@ -0,0 +1,295 @@
+"""Vectorized Jodi compatibility scoring.
+
+Every founder is held in a set of parallel NumPy arrays (one slot per user)
+that are built once per process and patched in place from ``CustomUser``
+signals. A discovery request scores all candidates in a single vectorized
+pass and returns the top-K ``(user_id, score)`` pairs. Every ``MATCH_INDEX_TTL``
+seconds the arrays are rebuilt from the table in a background thread
+(``core.refresh``) and swapped in.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is listed in requirements.txt
+    np = None
+
+from core.refresh import ensure_fresh
+
+from .models import INTEREST_TAGS
+
+User = get_user_model()
+
+PERSONAS = [code for code, _ in User.PERSONA_CHOICES]
+STAGES = [code for code, _ in User.STAGE_CHOICES]
+PROVINCES = [code for code, _ in User.PROVINCE_CHOICES]
+# Code 0 is reserved for 'NONE' so "unset" can be tested with ``== 0``.
+PERSONA_CODES = {p: i + 1 for i, p in enumerate(p for p in PERSONAS if p != 'NONE')}
+STAGE_CODES = {s: i + 1 for i, s in enumerate(s for s in STAGES if s != 'NONE')}
+PROVINCE_CODES = {p: i + 1 for i, p in enumerate(p for p in PROVINCES if p != 'NONE')}
+
+# Score weights in points out of 1000 (scores are reported as points / 1000).
+# Integer points keep the per-request arrays at int16 and make top-K a
+# bounded-range selection instead of a float sort.
+WEIGHTS = {
+    'persona': 350,
+    'tags': 250,
+    'stage': 150,
+    'province': 150,
+    'karma': 100,
+}
+SCORE_SCALE = 1000
+# Tags are a bitset split into 64-bit words; a new word is added for every 64
+# distinct tags, so free-form tags are never dropped.
+TAG_WORD_BITS = 64
+
+
+def filter_code(codes, value):
+    """Stored code to filter on: 0 for 'NONE', -1 (matches nothing) for an unknown value."""
+    return 0 if value == 'NONE' else codes.get(value, -1)
+
+
+def _popcount(values):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    # numpy < 2.0: count bits byte by byte.
+    table = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+    bits = table[values.view(np.uint8)]
+    return bits.reshape(values.shape + (values.itemsize,)).sum(axis=-1, dtype=np.uint8)
+
+
+def _points(condition, weight):
+    """``weight`` where ``condition`` holds, else 0, as an int16 array."""
+    return condition.view(np.int8) * np.int16(weight)
+
+
+class MatchIndex:
+    """In-process column store of founders used by ``JodiMatcherView``."""
+    # Everything ``build`` replaces in one swap.
+    STATE = ('_size', '_slots', '_karma_max', '_tag_bits',
+             'ids', 'persona', 'stage', 'province', 'tags', 'karma', 'karma_pts', 'active')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._built_at = None
+            self._changes = None  # writes seen while a build is reading, replayed onto it
+            self._size = 0
+            self._slots = {}
+            self._karma_max = 0
+            self._tag_bits = {tag: i for i, tag in enumerate(INTEREST_TAGS)}
+            self._alloc(0)
+
+    @property
+    def available(self):
+        return np is not None
+
+    def _columns(self):
+        return (self.ids, self.persona, self.stage, self.province, self.tags, self.karma, self.karma_pts, self.active)
+
+    def _tag_words(self):
+        return max(1, -(-len(self._tag_bits) // TAG_WORD_BITS))
+
+    def _alloc(self, capacity):
+        if np is None:
+            return
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.persona = np.zeros(capacity, dtype=np.int8)
+        self.stage = np.zeros(capacity, dtype=np.int8)
+        self.province = np.zeros(capacity, dtype=np.int8)
+        self.tags = np.zeros((capacity, self._tag_words()), dtype=np.uint64)
+        self.karma = np.zeros(capacity, dtype=np.int32)
+        # Karma scaled against the current maximum, ready to add to a score.
+        self.karma_pts = np.zeros(capacity, dtype=np.int16)
+        self.active = np.zeros(capacity, dtype=bool)
+
+    def _grow(self):
+        old = self._columns()
+        self._alloc(max(1024, len(self.ids) * 2))
+        for new, prev in zip(self._columns(), old):
+            new[:len(prev)] = prev
+
+    def tag_mask(self, tags, register=False):
+        """Bitset for ``tags``; unseen tags get a new bit only when ``register`` is set."""
+        mask = 0
+        for tag in tags or []:
+            if not isinstance(tag, str):
+                continue
+            bit = self._tag_bits.get(tag)
+            if bit is None:
+                if not register:
+                    continue
+                bit = self._tag_bits[tag] = len(self._tag_bits)
+                if self._tag_words() > self.tags.shape[1]:
+                    self._widen_tags()
+            mask |= 1 << bit
+        return mask
+
+    def _widen_tags(self):
+        old = self.tags
+        self.tags = np.zeros((len(old), self._tag_words()), dtype=np.uint64)
+        self.tags[:, :old.shape[1]] = old
+
+    def tag_words(self, mask):
+        """``mask`` as a row of the ``tags`` column."""
+        words = self.tags.shape[1]
+        return np.array([(mask >> (TAG_WORD_BITS * i)) & ((1 << TAG_WORD_BITS) - 1) for i in range(words)],
+                        dtype=np.uint64)
+
+    def _rescale_karma(self):
+        n = self._size
+        if self._karma_max > 0:
+            self.karma_pts[:n] = self.karma[:n] * WEIGHTS['karma'] // self._karma_max
+        else:
+            self.karma_pts[:n] = 0
+
+    def _put(self, user_id, persona, stage, province, tags, karma):
+        slot = self._slots.get(user_id)
+        if slot is None:
+            if self._size == len(self.ids):
+                self._grow()
+            slot = self._slots[user_id] = self._size
+            self._size += 1
+        karma = max(karma or 0, 0)
+        self.ids[slot] = user_id
+        self.persona[slot] = PERSONA_CODES.get(persona, 0)
+        self.stage[slot] = STAGE_CODES.get(stage, 0)
+        self.province[slot] = PROVINCE_CODES.get(province, 0)
+        self.tags[slot] = self.tag_words(self.tag_mask(tags, register=True))
+        self.karma[slot] = karma
+        self.active[slot] = True
+        if karma > self._karma_max:
+            # A new maximum changes everyone's karma points; rare after warm-up.
+            self._karma_max = karma
+            self._rescale_karma()
+        elif self._karma_max:
+            self.karma_pts[slot] = karma * WEIGHTS['karma'] // self._karma_max
+
+    def build(self):
+        """Read every founder into fresh columns, then swap them in.
+
+        The read runs outside the lock so ``top_k`` keeps serving the current
+        columns; writes that arrive meanwhile are recorded and replayed onto
+        the new ones before the swap.
+        """
+        with self._lock:
+            self._changes = []
+        rows = User.objects.filter(role='FOUNDER').values_list(
+            'id', 'persona', 'startup_stage', 'province', 'interest_tags', 'karma_score'
+        )
+        fresh = MatchIndex()
+        fresh._alloc(max(1024, rows.count()))
+        for user_id, persona, stage, province, tags, karma in rows.iterator(chunk_size=5000):
+            fresh._put(user_id, persona, stage, province, tags, karma)
+        fresh._karma_max = int(fresh.karma[:fresh._size].max()) if fresh._size else 0
+        fresh._rescale_karma()
+        with self._lock:
+            for name in self.STATE:
+                setattr(self, name, getattr(fresh, name))
+            changes, self._changes = self._changes or [], None
+            for method, args in changes:
+                getattr(self, method)(*args)
+            self._built_at = time.monotonic()
+
+    def ensure_built(self):
+        ensure_fresh(self, getattr(settings, 'MATCH_INDEX_TTL', 300))
+
+    def upsert(self, user_id, role, persona, stage, province, tags, karma):
+        """Apply a saved ``CustomUser`` row to the index (no-op until first build)."""
+        if role != 'FOUNDER':
+            self.remove(user_id)
+            return
+        self._change('_put', user_id, persona, stage, province, tags, karma)
+
+    def remove(self, user_id):
+        self._change('_deactivate', user_id)
+
+    def _change(self, method, *args):
+        if np is None:
+            return
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append((method, args))
+            if self._built_at is not None:
+                getattr(self, method)(*args)
+
+    def _deactivate(self, user_id):
+        slot = self._slots.get(user_id)
+        if slot is not None:
+            self.active[slot] = False
+
+    def top_k(self, user, k=20, persona=None, stage=None, province=None, tags=None,
+              candidate_ids=None, after=None):
+        """Score every founder against ``user`` and return the best ``k``.
+
+        Optional filters narrow the candidate mask first; ``candidate_ids``
+        restricts to a precomputed id set (e.g. search hits). ``after`` is the
+        ``(score, user_id)`` of the last row already served, for keyset paging.
+        Returns a list of ``(user_id, score)`` ordered by score desc, id asc.
+        """
+        self.ensure_built()
+        with self._lock:
+            n = self._size
+            ids = self.ids[:n]
+            cand_persona = self.persona[:n]
+            mask = self.active[:n] & (ids != user.pk)
+
+            my_persona = PERSONA_CODES.get(user.persona, 0)
+            if my_persona:
+                # Complementary matching: never pair two founders of the same persona.
+                mask &= cand_persona != my_persona
+            if persona:
+                mask &= cand_persona == filter_code(PERSONA_CODES, persona)
+            if stage:
+                mask &= self.stage[:n] == filter_code(STAGE_CODES, stage)
+            if province:
+                mask &= self.province[:n] == filter_code(PROVINCE_CODES, province)
+            if tags:
+                mask &= (self.tags[:n] & self.tag_words(self.tag_mask(tags))).any(axis=1)
+            if candidate_ids is not None:
+                mask &= np.isin(ids, np.fromiter(candidate_ids, dtype=np.int64))
+            if after is not None:
+                after_points = round(after[0] * SCORE_SCALE) + 1
+                after_id = after[1]
+
+            points = self.karma_pts[:n].copy()
+            if my_persona:
+                points += _points(cand_persona != 0, WEIGHTS['persona'])
+            my_stage = STAGE_CODES.get(user.startup_stage, 0)
+            if my_stage:
+                points += _points(self.stage[:n] == my_stage, WEIGHTS['stage'])
+            my_province = PROVINCE_CODES.get(user.province, 0)
+            if my_province:
+                points += _points(self.province[:n] == my_province, WEIGHTS['province'])
+            my_tags = self.tag_mask(user.interest_tags)
+            if my_tags:
+                overlap = _popcount(self.tags[:n] & self.tag_words(my_tags)).sum(axis=1, dtype=np.int16)
+                points += overlap * np.int16(WEIGHTS['tags']) // np.int16(bin(my_tags).count('1'))
+            # Shift by one and zero out excluded rows: a multiply is several
+            # times cheaper than boolean-mask assignment at this size.
+            points += 1
+            points *= mask.view(np.int8)
+            if after is not None:
+                # Keep rows ordered after the cursor: lower score, or same score and higher id.
+                points *= ((points < after_points) | ((points == after_points) & (ids > after_id))).view(np.int8)
+
+            # The k-th best is found with one linear-time int16 partition and
+            # only the rows at or above it are ordered exactly.
+            cutoff = max(int(np.partition(points, n - k)[n - k]), 1) if n > k else 1
+            selected = np.flatnonzero(points >= cutoff)
+            selected_ids = ids[selected]
+            selected_points = points[selected] - 1
+
+        order = np.lexsort((selected_ids, -selected_points))[:k]
+        return [(int(selected_ids[i]), int(selected_points[i]) / SCORE_SCALE) for i in order]
+
+
+match_index = MatchIndex()
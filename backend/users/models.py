@@ -55,5 +55,11 @@ class CustomUser(AbstractUser):
     is_verified = models.BooleanField(default=False)
     interest_tags = models.JSONField(default=list, blank=True)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Registration checks that the email is unused.
+            models.Index(fields=['email'], name='customuser_email_idx'),
+        ]
+
     def __str__(self):
         return f"{self.username} ({self.role})"
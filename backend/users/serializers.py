@@ -65,6 +65,12 @@ class UserSerializer(serializers.ModelSerializer):
 
 class UserDiscoverySerializer(serializers.ModelSerializer):
     """Read-only serializer for Jodi discovery (no password)."""
+    match_score = serializers.SerializerMethodField()
+
     class Meta:
         model = User
-        fields = ('id', 'username', 'persona', 'role', 'startup_stage', 'province', 'bio', 'interest_tags', 'linkedin_profile', 'karma_score')
+        fields = ('id', 'username', 'persona', 'role', 'startup_stage', 'province', 'bio', 'interest_tags', 'linkedin_profile', 'karma_score', 'match_score')
+
+    def get_match_score(self, obj):
+        # Filled in by JodiMatcherView from users.matching; None on the SQL fallback path.
+        return self.context.get('match_scores', {}).get(obj.id)
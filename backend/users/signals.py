@@ -0,0 +1,30 @@
+"""Keep the in-process Jodi match index and auth user cache in step with ``CustomUser`` writes."""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import user_cache
+from .matching import match_index
+from .models import CustomUser
+
+
+# The match index only takes writes that commit; the row is copied now because
+# ``instance`` may change again before the callback runs.
+
+@receiver(post_save, sender=CustomUser)
+def update_match_index(sender, instance, **kwargs):
+    row = (instance.pk, instance.role, instance.persona, instance.startup_stage, instance.province,
+           list(instance.interest_tags or []), instance.karma_score)
+    transaction.on_commit(lambda: match_index.upsert(*row))
+
+
+@receiver(post_delete, sender=CustomUser)
+def drop_from_match_index(sender, instance, **kwargs):
+    user_id = instance.pk
+    transaction.on_commit(lambda: match_index.remove(user_id))
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
@@ -1,3 +1,144 @@
-from django.test import TestCase
+from django.db import DatabaseError, transaction
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from .matching import match_index
 
-# Create your tests here.
+User = get_user_model()
+
+
+class JodiDiscoveryTests(TestCase):
+    def setUp(self):
+        match_index.reset()
+        self.me = User.objects.create_user(username='me', password='pass1234', persona='HACKER')
+        User.objects.create_user(username='agri', password='x', persona='HUSTLER', interest_tags=['Agriculture'])
+        User.objects.create_user(username='fin', password='x', persona='HIPSTER', province='BAGMATI', interest_tags=['FinTech', 'AI'])
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def usernames(self, **params):
+        res = self.client.get('/api/users/discovery/', params)
+        self.assertEqual(res.status_code, 200)
+        return sorted(u['username'] for u in res.data['results'])
+
+    def test_tag_filter_combines_with_other_filters(self):
+        self.assertEqual(self.usernames(tags='AI,Agriculture'), ['agri', 'fin'])
+        self.assertEqual(self.usernames(tags='AI', province='BAGMATI'), ['fin'])
+        self.assertEqual(self.usernames(tags='AI', province='KOSHI'), [])
+
+    def test_none_filters_match_unset_fields(self):
+        User.objects.create_user(username='lurker', password='x', province='KOSHI', startup_stage='MVP')
+        self.assertEqual(self.usernames(persona='NONE'), ['lurker'])
+        self.assertEqual(self.usernames(stage='NONE'), ['agri', 'fin'])
+        self.assertEqual(self.usernames(province='NONE'), ['agri'])
+
+    def test_free_form_tags_beyond_one_word_are_kept(self):
+        User.objects.create_user(username='wide', password='x', interest_tags=[f'Niche{i}' for i in range(70)])
+        self.assertEqual(self.usernames(tags='Niche69'), ['wide'])
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create_user(username='late', password='x', interest_tags=['Niche3', 'Rare'])
+        self.assertEqual(self.usernames(tags='Rare'), ['late'])
+        self.assertEqual(self.usernames(tags='Niche3,Agriculture'), ['agri', 'late', 'wide'])
+
+
+class JodiRankingTests(TestCase):
+    def setUp(self):
+        match_index.reset()
+        self.me = User.objects.create_user(
+            username='me', password='pass1234', persona='HACKER', startup_stage='MVP',
+            province='BAGMATI', interest_tags=['AI', 'Tech'],
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def tearDown(self):
+        match_index.reset()
+
+    def test_ranked_by_compatibility(self):
+        User.objects.create_user(username='same_persona', password='x', persona='HACKER', startup_stage='MVP', province='BAGMATI', interest_tags=['AI'])
+        User.objects.create_user(username='weak', password='x', persona='HUSTLER', province='KOSHI')
+        User.objects.create_user(username='strong', password='x', persona='HIPSTER', startup_stage='MVP', province='BAGMATI', interest_tags=['AI', 'Tech'], karma_score=10)
+        User.objects.create_user(username='expert', password='x', role='EXPERT', persona='HIPSTER')
+        res = self.client.get('/api/users/discovery/')
+        results = res.data['results']
+        self.assertEqual([u['username'] for u in results], ['strong', 'weak'])
+        self.assertEqual(results[0]['match_score'], 1.0)
+        self.assertEqual(results[1]['match_score'], 0.35)
+
+    def test_index_tracks_user_changes(self):
+        other = User.objects.create_user(username='other', password='x', persona='HUSTLER')
+        self.assertEqual(len(self.client.get('/api/users/discovery/').data['results']), 1)
+        other.persona = 'HACKER'
+        with self.captureOnCommitCallbacks(execute=True):
+            other.save()
+        self.assertEqual(self.client.get('/api/users/discovery/').data['results'], [])
+        other.persona = 'HIPSTER'
+        other.interest_tags = ['AI']
+        with self.captureOnCommitCallbacks(execute=True):
+            other.save()
+        res = self.client.get('/api/users/discovery/', {'tags': 'AI'})
+        self.assertEqual([u['username'] for u in res.data['results']], ['other'])
+        self.assertEqual(res.data['results'][0]['match_score'], 0.475)
+
+    def test_rolled_back_writes_never_reach_the_index(self):
+        other = User.objects.create_user(username='other', password='x', persona='HUSTLER')
+        self.assertEqual(len(self.client.get('/api/users/discovery/').data['results']), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    User.objects.create_user(username='ghost', password='x', persona='HIPSTER')
+                    other.delete()
+                    raise DatabaseError('rolled back')
+            except DatabaseError:
+                pass
+        res = self.client.get('/api/users/discovery/')
+        self.assertEqual([u['username'] for u in res.data['results']], ['other'])
+
+    def test_ranked_pages_follow_cursor(self):
+        for i in range(7):
+            User.objects.create_user(username=f'f{i}', password='x', persona='HUSTLER', karma_score=i % 3)
+        seen = []
+        url, params = '/api/users/discovery/', {'page_size': 3}
+        while url:
+            res = self.client.get(url, params)
+            seen.extend((u['match_score'], u['id']) for u in res.data['results'])
+            url, params = res.data['next'], None
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(seen, sorted(seen, key=lambda row: (-row[0], row[1])))
+
+
+@override_settings(QUERY_STATS_HEADERS=True)
+class CachedAuthTests(TestCase):
+    def setUp(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+        from .authentication import user_cache
+        user_cache.clear()
+        self.user = User.objects.create_user(username='cached', password='x')
+        self.token = str(AccessToken.for_user(self.user))
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def me(self):
+        res = self.client.get('/api/users/profile/')
+        return res, int(res['X-Query-Count'])
+
+    def test_user_is_read_once_until_saved(self):
+        _, cold = self.me()
+        res, warm = self.me()
+        self.assertEqual((res.status_code, warm), (200, cold - 1))
+        self.user.first_name = 'Renamed'
+        self.user.save()
+        res, queries = self.me()
+        self.assertEqual((res.data['first_name'], queries), ('Renamed', cold))
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.me()[0].status_code, 401)
+
+    def test_websocket_connect_uses_the_cache(self):
+        from asgiref.sync import async_to_sync
+        from core.middleware import JwtAuthMiddleware
+        middleware = JwtAuthMiddleware(None)
+        self.assertEqual(async_to_sync(middleware.get_user)(self.token), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(async_to_sync(middleware.get_user)(self.token), self.user)
+        self.assertIsNone(async_to_sync(middleware.get_user)(self.token + 'x'))
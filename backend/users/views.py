@@ -7,6 +7,10 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth import authenticate
 from .serializers import UserSerializer, UserDiscoverySerializer
 from .models import INTEREST_TAGS
+from core.tag_index import parse_tags, tagged_ids
+from core.search import search_queryset
+from core.pagination import RankedPagination
+from .matching import match_index
 
 User = get_user_model()
 
@@ -102,11 +106,40 @@ class ChangePasswordView(APIView):
         return Response({"message": "Password changed successfully"}, status=status.HTTP_200_OK)
 
 class JodiMatcherView(generics.ListAPIView):
+    """Founder discovery. Ranked by users.matching when NumPy is available."""
     serializer_class = UserDiscoverySerializer
     permission_classes = (permissions.IsAuthenticated,)
 
+    def list(self, request, *args, **kwargs):
+        if not match_index.available:
+            return super().list(request, *args, **kwargs)
+        params = request.query_params
+        candidate_ids = None
+        search = params.get('search', None)
+        if search:
+            candidate_ids = search_queryset(User.objects.filter(role='FOUNDER'), 'user', search).values_list('id', flat=True)
+
+        def rank(limit, after):
+            return match_index.top_k(
+                request.user,
+                limit,
+                persona=params.get('persona', None),
+                stage=params.get('stage', None),
+                province=params.get('province', None),
+                tags=parse_tags(params.get('tags', None)),
+                candidate_ids=candidate_ids,
+                after=after,
+            )
+
+        paginator = RankedPagination()
+        ranked = paginator.paginate_ranked(rank, request)
+        users = User.objects.in_bulk([user_id for user_id, _ in ranked])
+        matches = [users[user_id] for user_id, _ in ranked if user_id in users]
+        context = self.get_serializer_context()
+        context['match_scores'] = dict(ranked)
+        return paginator.get_paginated_response(UserDiscoverySerializer(matches, many=True, context=context).data)
+
     def get_queryset(self):
-        from django.db.models import Q
         user = self.request.user
         qs = User.objects.filter(role='FOUNDER').exclude(id=user.id)
         # Optional: exclude same persona for complementary matching
@@ -124,15 +157,12 @@ class JodiMatcherView(generics.ListAPIView):
         province = self.request.query_params.get('province', None)
         if province:
             qs = qs.filter(province=province)
-        # Filter by interest tags (at least one match)
-        tags = self.request.query_params.get('tags', None)
-        if tags:
-            tag_list = [t.strip() for t in tags.split(',') if t.strip()]
-            if tag_list:
-                filtered_ids = [u.id for u in qs if any(t in (u.interest_tags or []) for t in tag_list)]
-                qs = qs.filter(id__in=filtered_ids)
+        # Filter by interest tags (at least one match, answered from the tag index)
+        tag_list = parse_tags(self.request.query_params.get('tags', None))
+        if tag_list:
+            qs = qs.filter(id__in=tagged_ids('USER', tag_list))
         # Search by username or bio
         search = self.request.query_params.get('search', None)
         if search:
-            qs = qs.filter(Q(username__icontains=search) | Q(bio__icontains=search))
+            qs = search_queryset(qs, 'user', search)
         return qs
@@ -1,19 +1,24 @@
 import React, { useEffect, useRef, useState } from 'react';
 import api from '../../services/api';
+import { onFrame, sendChat, subscribe } from '../../services/stream';
 
 const ChatModal = ({ receiver, onClose }) => {
   const [messages, setMessages] = useState([]);
   const [input, setInput] = useState('');
-  const [socket, setSocket] = useState(null);
   const [loading, setLoading] = useState(true);
   const [sending, setSending] = useState(false);
+  const [olderUrl, setOlderUrl] = useState(null);
+  const [loadingOlder, setLoadingOlder] = useState(false);
   const messagesEndRef = useRef(null);
+  const scrollToEnd = useRef(true);
 
   useEffect(() => {
     const fetchHistory = async () => {
       try {
         const res = await api.get(`/core/chat/history/${receiver.id}/`);
-        setMessages(res.data);
+        setMessages(res.data.results);
+        setOlderUrl(res.data.next);
+        api.post(`/core/chat/mark-as-read/${receiver.id}/`).catch(() => {});
       } catch (e) {
         setMessages([]);
       } finally {
@@ -23,16 +28,24 @@ const ChatModal = ({ receiver, onClose }) => {
     fetchHistory();
   }, [receiver.id]);
 
+  const loadOlder = async () => {
+    if (!olderUrl) return;
+    setLoadingOlder(true);
+    try {
+      const res = await api.get(olderUrl);
+      scrollToEnd.current = false;
+      setMessages((prev) => [...res.data.results, ...prev]);
+      setOlderUrl(res.data.next);
+    } catch (_) {
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
   useEffect(() => {
-    const token = localStorage.getItem('access_token');
-    const wsHost = '127.0.0.1:8000';
-    const wsScheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
-    const wsUrl = `${wsScheme}://${wsHost}/ws/chat/${receiver.id}/${token ? `?token=${encodeURIComponent(token)}` : ''}`;
-    const ws = new window.WebSocket(wsUrl);
-    ws.onmessage = (e) => {
-      const data = JSON.parse(e.data);
+    const stopListening = onFrame((data) => {
       // Only add incoming messages from the other person; our own sent messages are added optimistically
-      if (data.sender_id === receiver.id) {
+      if (data.type === 'chat.message' && data.sender_id === receiver.id) {
         setMessages((prev) => [...prev, {
           id: data.id,
           sender: data.sender_id,
@@ -40,22 +53,28 @@ const ChatModal = ({ receiver, onClose }) => {
           content: data.message,
           timestamp: data.timestamp,
         }]);
+        // The chat is open, so the new message is read as it arrives.
+        api.post(`/core/chat/mark-as-read/${receiver.id}/`, { message_id: data.id }).catch(() => {});
       }
-    };
-    setSocket(ws);
+    });
+    const unsubscribe = subscribe(receiver.id);
     return () => {
-      ws.close();
+      unsubscribe();
+      stopListening();
     };
   }, [receiver.id]);
 
   useEffect(() => {
-    messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
+    if (scrollToEnd.current) {
+      messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
+    }
+    scrollToEnd.current = true;
   }, [messages]);
 
   const handleSend = async (e) => {
     e.preventDefault();
     const text = input.trim();
-    if (!text || !socket) return;
+    if (!text) return;
     setSending(true);
     // Show message immediately (optimistic update)
     const optimisticMsg = {
@@ -68,10 +87,7 @@ const ChatModal = ({ receiver, onClose }) => {
     setMessages((prev) => [...prev, optimisticMsg]);
     setInput('');
     setSending(false);
-    socket.send(JSON.stringify({ message: text }));
-    try {
-      await api.post(`/core/chat/mark-as-read/${receiver.id}/`);
-    } catch (_) {}
+    sendChat(receiver.id, text);
   };
 
   const handleInputKeyDown = (e) => {
@@ -91,7 +107,15 @@ const ChatModal = ({ receiver, onClose }) => {
           {loading ? (
             <div className="text-center text-surface-text-muted">Loading...</div>
           ) : (
-            messages.map((msg, idx) => (
+            <>
+            {olderUrl && (
+              <div className="text-center">
+                <button onClick={loadOlder} disabled={loadingOlder} className="text-xs text-sangam-emerald font-bold">
+                  {loadingOlder ? 'Loading...' : 'Load earlier messages'}
+                </button>
+              </div>
+            )}
+            {messages.map((msg, idx) => (
               <div
                 key={msg.id || idx}
                 className={`flex flex-col ${msg.sender === receiver.id ? 'items-start' : 'items-end'}`}
@@ -101,7 +125,8 @@ const ChatModal = ({ receiver, onClose }) => {
                 </div>
                 <span className="text-xs text-surface-text-muted mt-1">{new Date(msg.timestamp).toLocaleString()}</span>
               </div>
-            ))
+            ))}
+            </>
           )}
           <div ref={messagesEndRef} />
         </div>
@@ -1,6 +1,9 @@
 import React, { useEffect, useState, useRef } from 'react';
 import { Bell } from 'lucide-react';
 import api from '../../services/api';
+import { onFrame } from '../../services/stream';
+
+const RESYNC_INTERVAL_MS = 5 * 60 * 1000;
 
 const NotificationDropdown = () => {
     const [notifications, setNotifications] = useState([]);
@@ -10,12 +13,10 @@ const NotificationDropdown = () => {
 
     const fetchNotifications = async () => {
         try {
-            const [listRes, countRes] = await Promise.all([
-                api.get('/core/notifications/'),
-                api.get('/core/notifications/unread-count/')
-            ]);
-            setNotifications(listRes.data || []);
-            setUnreadCount(countRes.data?.count ?? 0);
+            // One request for list and count; the browser revalidates it with the ETag.
+            const res = await api.get('/core/notifications/');
+            setNotifications(res.data?.results || []);
+            setUnreadCount(res.data?.unread_count ?? 0);
         } catch (err) {
             console.error('Error fetching notifications', err);
         }
@@ -23,8 +24,18 @@ const NotificationDropdown = () => {
 
     useEffect(() => {
         fetchNotifications();
-        const interval = setInterval(fetchNotifications, 30000);
-        return () => clearInterval(interval);
+        // New notifications are pushed over the stream socket; polling only resyncs.
+        const interval = setInterval(fetchNotifications, RESYNC_INTERVAL_MS);
+        const stopListening = onFrame((frame) => {
+            if (frame.type === 'stream.open' && frame.reconnect) fetchNotifications();
+            if (frame.type !== 'notification') return;
+            setNotifications(prev => [frame.notification, ...prev.filter(n => n.id !== frame.notification.id)].slice(0, 50));
+            setUnreadCount(frame.unread_count);
+        });
+        return () => {
+            clearInterval(interval);
+            stopListening();
+        };
     }, []);
 
     useEffect(() => {
@@ -89,9 +100,9 @@ const NotificationDropdown = () => {
                                     onClick={() => !n.read && markAsRead(n.id)}
                                     className={`p-4 hover:bg-surface-base cursor-pointer transition-colors ${!n.read ? 'bg-sangam-emerald/5' : ''}`}
                                 >
-                                    <p className={`font-bold text-sm ${!n.read ? 'text-surface-text' : 'text-surface-text-muted'}`}>{n.title}</p>
+                                    <p className={`font-bold text-sm ${!n.read ? 'text-surface-text' : 'text-surface-text-muted'}`}>{n.title}{n.count > 1 && <span className="ml-1 text-sangam-emerald">×{n.count}</span>}</p>
                                     <p className="text-xs text-surface-text-muted mt-1">{n.message}</p>
-                                    <p className="text-[10px] text-surface-text-muted/70 mt-2">{new Date(n.created_at).toLocaleString()}</p>
+                                    <p className="text-[10px] text-surface-text-muted/70 mt-2">{new Date(n.updated_at || n.created_at).toLocaleString()}</p>
                                 </div>
                             ))
                         )}
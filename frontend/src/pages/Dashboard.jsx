@@ -18,11 +18,11 @@ const Dashboard = () => {
                 const [statsRes, userRes, bookingsRes] = await Promise.all([
                     api.get('/core/stats/'),
                     api.get('/users/profile/'),
-                    api.get('/core/bookings/').catch(() => ({ data: [] }))
+                    api.get('/core/bookings/').catch(() => ({ data: { results: [] } }))
                 ]);
                 setStats(statsRes.data);
                 setUser(userRes.data);
-                setBookings(bookingsRes.data || []);
+                setBookings(bookingsRes.data.results || []);
             } catch (err) {
                 console.error('Error fetching dashboard data:', err);
                 setError(err.message || 'Failed to load ecosystem data');
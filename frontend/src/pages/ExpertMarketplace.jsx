@@ -39,7 +39,7 @@ const ExpertMarketplace = () => {
                 if (search) params.append('search', search);
                 if (params.toString()) url += '?' + params.toString();
                 const response = await api.get(url);
-                setExperts(response.data);
+                setExperts(response.data.results || []);
             } catch (err) {
                 console.error('Error fetching experts:', err);
                 setError('Failed to load expert profiles.');
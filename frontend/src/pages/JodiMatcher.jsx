@@ -47,7 +47,7 @@ const JodiMatcher = () => {
                 if (selectedProvince) params.append('province', selectedProvince);
                 const url = params.toString() ? `/users/discovery/?${params}` : '/users/discovery/';
                 const response = await api.get(url);
-                setMatches(response.data || []);
+                setMatches(response.data.results || []);
             } catch (err) {
                 console.error('Error fetching discovery cards:', err);
                 setError('Failed to find potential matches.');
@@ -87,8 +87,9 @@ const PulseLedger = () => {
 
     const fetchSnapshots = async () => {
         try {
-            const response = await api.get('/core/snapshots/');
-            setSnapshots(response.data || []);
+            // Latest 100 weeks, newest first from the API, oldest first for the charts.
+            const response = await api.get('/core/snapshots/', { params: { page_size: 100, ordering: '-week_ending' } });
+            setSnapshots((response.data.results || []).slice().reverse());
         } catch (err) {
             console.error('Error fetching snapshots:', err);
             setError('Failed to load growth snapshots.');
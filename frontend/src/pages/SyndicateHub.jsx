@@ -35,7 +35,7 @@ const SyndicateHub = () => {
                 if (selectedTags.length) params.append('tags', selectedTags.join(','));
                 const url = params.toString() ? `/core/syndicates/?${params}` : '/core/syndicates/';
                 const response = await api.get(url);
-                setSyndicates(response.data || []);
+                setSyndicates(response.data.results || []);
             } catch (err) {
                 console.error('Error fetching syndicates:', err);
                 setError('Failed to load investment syndicates.');
@@ -0,0 +1,85 @@
+// One WebSocket per tab (ws/stream/) shared by every open chat.
+// Components listen for frames with onFrame() and open conversations with
+// subscribe(); the socket reconnects with backoff, re-subscribes and emits a
+// local { type: 'stream.open', reconnect } frame.
+
+const WS_HOST = '127.0.0.1:8000';
+
+const listeners = new Set();
+const subscriptions = new Map(); // partner id -> number of components using it
+let socket = null;
+let queued = [];
+let retryDelay = 1000;
+let reconnectTimer = null;
+let connectedBefore = false;
+
+const transmit = (frame) => {
+    if (socket && socket.readyState === window.WebSocket.OPEN) {
+        socket.send(JSON.stringify(frame));
+    } else {
+        queued.push(frame);
+        connect();
+    }
+};
+
+const connect = () => {
+    if (socket || listeners.size === 0) return;
+    const token = localStorage.getItem('access_token');
+    const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+    socket = new window.WebSocket(`${scheme}://${WS_HOST}/ws/stream/${token ? `?token=${encodeURIComponent(token)}` : ''}`);
+    socket.onopen = () => {
+        retryDelay = 1000;
+        // Subscriptions first, so queued chat.send frames find their conversation.
+        const pending = queued.filter((frame) => frame.type !== 'subscribe' && frame.type !== 'unsubscribe');
+        queued = [];
+        subscriptions.forEach((_, partnerId) => socket.send(JSON.stringify({ type: 'subscribe', partner_id: partnerId })));
+        pending.forEach((frame) => socket.send(JSON.stringify(frame)));
+        // Lets listeners resync whatever was pushed while the socket was down.
+        listeners.forEach((listener) => listener({ type: 'stream.open', reconnect: connectedBefore }));
+        connectedBefore = true;
+    };
+    socket.onmessage = (e) => {
+        const frame = JSON.parse(e.data);
+        listeners.forEach((listener) => listener(frame));
+    };
+    socket.onclose = () => {
+        socket = null;
+        if (listeners.size > 0 && !reconnectTimer) {
+            reconnectTimer = setTimeout(() => {
+                reconnectTimer = null;
+                connect();
+            }, retryDelay);
+            retryDelay = Math.min(retryDelay * 2, 30000);
+        }
+    };
+};
+
+export const onFrame = (listener) => {
+    listeners.add(listener);
+    connect();
+    return () => {
+        listeners.delete(listener);
+        if (listeners.size === 0 && socket) {
+            socket.close();
+        }
+    };
+};
+
+export const subscribe = (partnerId) => {
+    const count = subscriptions.get(partnerId) || 0;
+    subscriptions.set(partnerId, count + 1);
+    if (count === 0) transmit({ type: 'subscribe', partner_id: partnerId });
+    return () => {
+        const remaining = (subscriptions.get(partnerId) || 1) - 1;
+        if (remaining > 0) {
+            subscriptions.set(partnerId, remaining);
+            return;
+        }
+        subscriptions.delete(partnerId);
+        if (socket && socket.readyState === window.WebSocket.OPEN) {
+            socket.send(JSON.stringify({ type: 'unsubscribe', partner_id: partnerId }));
+        }
+    };
+};
+
+export const sendChat = (partnerId, message) => transmit({ type: 'chat.send', partner_id: partnerId, message });